@@ -0,0 +1,80 @@
+"""
+Runs the CH2TF benchmarks and stores the results as JSON, or compares two result files.
+
+    python -m bench [--filter store_data] [--repeat 5]
+    python -m bench --compare bench/results/old.json bench/results/new.json
+"""
+
+import argparse
+import datetime
+import fnmatch
+import json
+import os
+import platform
+import subprocess
+import sys
+
+from .benchmarks import BENCHMARKS, run_benchmark, compare, load
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main(argv: list | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench")
+    parser.add_argument("--filter", default="*", help="glob of benchmark names")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--output", help="result file, bench/results/<time>.json by default"
+    )
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        lines, regressed = compare(
+            load(args.compare[0]), load(args.compare[1]), args.tolerance
+        )
+        print("\n".join(lines))
+        return 1 if regressed else 0
+
+    now = datetime.datetime.now()
+    results = {}
+    for name, (benchmark, params) in BENCHMARKS.items():
+        if not fnmatch.fnmatch(name, args.filter):
+            continue
+        results[name] = run_benchmark(benchmark, params, args.repeat)
+        print(
+            f"{name}: {results[name]['median_s']:.6f}s ({results[name]['ops_per_s']:.0f} ops/s)"
+        )
+
+    output = args.output or os.path.join(
+        os.path.dirname(__file__), "results", f"{now:%Y%m%d-%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, mode="w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "meta": {
+                    "time": now.isoformat(),
+                    "commit": _git_commit(),
+                    "python": sys.version,
+                    "platform": platform.platform(),
+                },
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    print(f"results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
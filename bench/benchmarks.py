@@ -0,0 +1,291 @@
+"""
+Fixed workloads for the hot paths of CH2TF.
+Each benchmark returns the number of operations and is timed by run_benchmark.
+"""
+
+import json
+import random
+import statistics
+import time
+from typing import Callable, Dict, List, Tuple
+
+from src.ch2tf import CH2TF, CH2TFState, HeavyHitterAnalysis, DDoSAttackAnalysis
+from src.config import AS_SIZE, THRESHOLD_VICTIM_LO
+from src.enums import DetectionEnum, DecisionEnum
+from src.mitigation import NoMitigation
+from src.models import (
+    DefenseCollaborationRequestData,
+    DefenseCollaborationResponseData,
+    PacketData,
+)
+from src.simulation import InMemoryBroker, InMemoryProducer, InMemoryConsumer
+from src.simulation import VirtualClock
+from src.util import sha3_hash, init_bloom_filter, add_to_bloom_filter
+from src.util.jsonSerializer import json_serializer, json_deserializer
+
+SEED = 42
+MANAGED_HOSTS = 10_000
+VICTIMS = 10
+VICTIM_SHARE = 0.2
+
+
+def _ips(prefix: str, n: int) -> List[str]:
+    return [f"{prefix}.{i // 256 % 256}.{i % 256}" for i in range(n)]
+
+
+def create_ch2tf() -> CH2TF:
+    """
+    CH2TF instance that manages the addresses 10.0.x.y and publishes to an in-memory broker.
+    """
+    clock = VirtualClock()
+    broker = InMemoryBroker(clock)
+    managed_ips = _ips("10.0", MANAGED_HOSTS)
+    return CH2TF(
+        queue=None,  # type: ignore
+        mitigation=NoMitigation(),
+        attacker_analysis=HeavyHitterAnalysis(),
+        attack_analysis=DDoSAttackAnalysis(),
+        state=CH2TFState(clock),
+        as_name="bench",
+        managed_ips=add_to_bloom_filter(init_bloom_filter(100_000), managed_ips),
+        producer=InMemoryProducer(broker),  # type: ignore
+        consumer_factory=lambda: InMemoryConsumer(broker),  # type: ignore
+        clock=clock,
+    )
+
+
+def _fill(ch2tf: CH2TF, destinations: int, flows: int, rnd: random.Random) -> None:
+    """
+    Adds `flows` packets from managed and unmanaged sources to `destinations` destinations.
+    VICTIMS of the destinations receive VICTIM_SHARE of the packets.
+    """
+    dsts = _ips("192.168", destinations)
+    victims = dsts[:VICTIMS]
+    srcs = _ips("10.0", MANAGED_HOSTS) + _ips("172.16", MANAGED_HOSTS)
+    dest_dict, src_dict = ch2tf.state.dest_dict, ch2tf.state.src_dict
+    for _ in range(flows):
+        src = rnd.choice(srcs)
+        dst = rnd.choice(victims if rnd.random() < VICTIM_SHARE else dsts)
+        dest_dict[dst][src] += 1
+        if src.startswith("10.0."):
+            src_dict[src][dst] += 1
+
+
+def bench_store_data(packets: int) -> Tuple[Callable[[], int], Callable[[], None]]:
+    rnd = random.Random(SEED)
+    srcs = _ips("10.0", MANAGED_HOSTS) + _ips("172.16", MANAGED_HOSTS)
+    dsts = _ips("192.168", 1_000)
+    packet_data = [
+        PacketData(
+            src=rnd.choice(srcs),
+            dst=rnd.choice(dsts),
+            srcport="80",
+            dstport="80",
+            timestamp=None,  # type: ignore
+            transport_layer="TCP",
+        )
+        for _ in range(packets)
+    ]
+    ch2tf = create_ch2tf()
+
+    def run() -> int:
+        dest_dict, src_dict = ch2tf.state.dest_dict, ch2tf.state.src_dict
+        for received in packet_data:
+            ch2tf._store_data(received, dest_dict, src_dict)
+        return packets
+
+    return run, ch2tf.state.reset_period
+
+
+def bench_run_analysis(
+    destinations: int, flows: int
+) -> Tuple[Callable[[], int], Callable[[], None]]:
+    instances = []
+
+    def setup() -> None:
+        # new instance, such that the requests are not coalesced with the previous run
+        instances[:] = [create_ch2tf()]
+        _fill(instances[0], destinations, flows, random.Random(SEED))
+
+    def run() -> int:
+        instances[0].analyse_period(1)
+        return 1
+
+    return run, setup
+
+
+def bench_handle_collab_req(
+    attackers: int,
+) -> Tuple[Callable[[], int], Callable[[], None]]:
+    ch2tf = create_ch2tf()
+    rnd = random.Random(SEED)
+    _fill(ch2tf, 100, 100_000, rnd)
+    # half of the attackers are managed by this AS
+    attacker_ips = rnd.sample(_ips("10.0", MANAGED_HOSTS), attackers // 2) + rnd.sample(
+        _ips("172.16", MANAGED_HOSTS), attackers - attackers // 2
+    )
+    message_values = []
+
+    def setup() -> None:
+        message_values.clear()
+        request = DefenseCollaborationRequestData(
+            potential_attacker_ips=attacker_ips,
+            potential_victim="192.168.0.1",
+            request_detection=DetectionEnum.THRESHOLD,
+            requests_relative_to_size=(THRESHOLD_VICTIM_LO + 1) / max(AS_SIZE, 1),
+            request_originator="other",
+        )
+        message_values.append(json_deserializer(json_serializer(request.to_json())))
+        # the verdicts of previous runs must not be reused
+        ch2tf.verdict_cache.rollover()
+
+    def run() -> int:
+        message = type("Message", (), {"value": message_values[0]})()
+        ch2tf.handle_collab_req(message, topic="lowprob.REQ")  # type: ignore
+        return 1
+
+    return run, setup
+
+
+def bench_json(attackers: int) -> Tuple[Callable[[], int], Callable[[], None]]:
+    attacker_ips = [sha3_hash(ip) for ip in _ips("10.0", attackers)]
+    request = DefenseCollaborationRequestData(
+        potential_attacker_ips=attacker_ips,
+        potential_victim="192.168.0.1",
+        request_detection=DetectionEnum.THRESHOLD,
+        requests_relative_to_size=1.0,
+    )
+    response = DefenseCollaborationResponseData(
+        ack_potential_attacker_ips=attacker_ips,
+        decision=DecisionEnum.FOUND,
+        as_name="bench",
+        request_id=request.request_id,
+        request_originator="other",
+    )
+
+    def run() -> int:
+        for msg, cls in (
+            (request, DefenseCollaborationRequestData),
+            (response, DefenseCollaborationResponseData),
+        ):
+            value = json_serializer(msg.to_json())  # type: ignore
+            cls.from_json(json_deserializer(value))  # type: ignore
+        return 2
+
+    return run, lambda: None
+
+
+def bench_sha3_hash(n: int) -> Tuple[Callable[[], int], Callable[[], None]]:
+    ips = _ips("10.0", n)
+
+    def run() -> int:
+        for ip in ips:
+            sha3_hash(ip)
+        return n
+
+    return run, lambda: None
+
+
+def bench_bloom_lookup(n: int) -> Tuple[Callable[[], int], Callable[[], None]]:
+    ch2tf = create_ch2tf()
+    # half of the lookups are managed ips
+    ips = _ips("10.0", n // 2) + _ips("172.16", n - n // 2)
+
+    def run() -> int:
+        for ip in ips:
+            ch2tf.check_if_is_managed(ip)
+        return n
+
+    return run, lambda: None
+
+
+# name -> (benchmark, parameters)
+BENCHMARKS: Dict[str, Tuple[Callable, dict]] = {
+    "store_data": (bench_store_data, {"packets": 200_000}),
+    "run_analysis/100dst-10kflows": (
+        bench_run_analysis,
+        {"destinations": 100, "flows": 10_000},
+    ),
+    "run_analysis/1kdst-50kflows": (
+        bench_run_analysis,
+        {"destinations": 1_000, "flows": 50_000},
+    ),
+    "run_analysis/10kdst-100kflows": (
+        bench_run_analysis,
+        {"destinations": 10_000, "flows": 100_000},
+    ),
+    "handle_collab_req/100": (bench_handle_collab_req, {"attackers": 100}),
+    "handle_collab_req/1k": (bench_handle_collab_req, {"attackers": 1_000}),
+    "handle_collab_req/10k": (bench_handle_collab_req, {"attackers": 10_000}),
+    "json/100": (bench_json, {"attackers": 100}),
+    "json/10k": (bench_json, {"attackers": 10_000}),
+    "sha3_hash": (bench_sha3_hash, {"n": 100_000}),
+    "bloom_lookup": (bench_bloom_lookup, {"n": 100_000}),
+}
+
+
+def run_benchmark(benchmark: Callable, params: dict, repeat: int) -> dict:
+    """
+    Runs a benchmark `repeat` times, the setup is not part of the measured time.
+
+    :param benchmark: returns the function to measure and its setup
+    :type benchmark: Callable
+    :param params: parameters of the benchmark
+    :type params: dict
+    :param repeat: number of measurements
+    :type repeat: int
+    :return: parameters and timings
+    :rtype: dict
+    """
+    run, setup = benchmark(**params)
+    timings = []
+    ops = 0
+    for _ in range(repeat):
+        setup()
+        start = time.perf_counter()
+        ops = run()
+        timings.append(time.perf_counter() - start)
+    median = statistics.median(timings)
+    return {
+        "params": params,
+        "repeat": repeat,
+        "ops": ops,
+        "min_s": min(timings),
+        "median_s": median,
+        "ops_per_s": ops / median if median else 0.0,
+    }
+
+
+def compare(old: dict, new: dict, tolerance: float) -> Tuple[List[str], bool]:
+    """
+    Compares the median timings of two result files.
+
+    :param old: baseline results
+    :type old: dict
+    :param new: new results
+    :type new: dict
+    :param tolerance: relative slowdown that is accepted, e.g. 0.1
+    :type tolerance: float
+    :return: report lines and whether any benchmark regressed
+    :rtype: Tuple[List[str], bool]
+    """
+    lines = []
+    regressed = False
+    for name, result in new["results"].items():
+        base = old["results"].get(name)
+        if base is None:
+            lines.append(f"{name}: new")
+            continue
+        change = result["median_s"] / base["median_s"] - 1 if base["median_s"] else 0.0
+        slower = change > tolerance
+        regressed |= slower
+        lines.append(
+            f"{name}: {base['median_s']:.6f}s -> {result['median_s']:.6f}s "
+            f"({change:+.1%}){' REGRESSION' if slower else ''}"
+        )
+    return lines, regressed
+
+
+def load(path: str) -> dict:
+    with open(path, mode="r", encoding="utf-8") as f:
+        return json.load(f)
@@ -1,4 +1,11 @@
 from .ch2tf import CH2TF
+from .state import CH2TFState
+from .attackers import ConfirmedAttackerTable
+from .checkpoint import Checkpointer
+from .digests import DigestTable
+from .export import EpochExporter
+from .sampling import SamplingController, SampledQueue
+from .runtime import CH2TFRuntime
 from .analyses import (
     DDoSAttackAnalysis,
     HeavyHitterAnalysis,
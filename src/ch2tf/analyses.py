@@ -1,6 +1,6 @@
 import logging
-from collections import defaultdict
-from typing import Tuple, Any
+from collections import defaultdict, Counter
+from typing import Tuple, Any, List
 from abc import abstractmethod, ABC
 
 from src.config import (
@@ -12,8 +12,12 @@ from src.config import (
     THRESHOLD_VICTIM_LO,
     THRESHOLD_VICTIM_TIME_MIN,
     THRESHOLD_VICTIM_TIME_PERCENTAGE,
+    HHH_THRESHOLD,
+    HHH_MIN_SOURCES,
 )
 from src.enums import DetectionEnum
+from src.util import scale_sampled
+from src.util.profiling import stopwatch
 
 log = logging.getLogger("analysis")
 
@@ -33,6 +37,37 @@ class Analysis(ABC):
 
 
 class AttackerAnalysis(Analysis):
+    def pop_case_counts(self) -> dict:
+        """
+        :return: case -> number of attackers that matched it since the last call
+        :rtype: dict
+        """
+        return {}
+
+    def run_prefix_analysis(
+        self,
+        members: List[str],
+        victim_ip: str,
+        src_dict: defaultdict,
+        dst_dict: defaultdict,
+        **kwargs,
+    ) -> List[str]:
+        """
+        Analyses the managed sources of a prefix that has been requested instead of its sources.
+
+        :param members: managed sources in the prefix
+        :type members: List[str]
+        :param victim_ip: potential victim
+        :type victim_ip: str
+        :return: the sources that are attackers
+        :rtype: List[str]
+        """
+        return [
+            member
+            for member in members
+            if self.run_analysis(member, victim_ip, src_dict, dst_dict, **kwargs)
+        ]
+
     @abstractmethod
     def run_analysis(
         self,
@@ -63,32 +98,40 @@ class AttackAnalysis(Analysis):
 class DDoSAttackAnalysis(AttackAnalysis):
     @staticmethod
     def check_timed_difference(
-        victim_ip: str, dest_dict: defaultdict, dest_dict_aggregated: defaultdict
+        victim_ip: str,
+        dest_dict: defaultdict,
+        dest_dict_aggregated: defaultdict,
+        sampling_rate: float = 1.0,
     ) -> tuple[bool, float]:
         new = dest_dict
+        # the aggregate of the previous period is already scaled by its sampling rate
         old = dest_dict_aggregated
 
         num_old = old.get(victim_ip, 0)
-        num_new = sum(new[victim_ip].values())
+        num_new = scale_sampled(sum(new[victim_ip].values()), sampling_rate)
 
         if num_old == 0 or num_new < THRESHOLD_VICTIM_TIME_MIN:
             return False, 0.0
         difference = float(num_new / num_old)
         return difference > THRESHOLD_VICTIM_TIME_PERCENTAGE, difference
 
-    # @stopwatch(name="AttackAnalysis")
+    @stopwatch(name="AttackAnalysis")
     def run_analysis(
         self, attacker_ip: str, victim_ip: str, src_dict, dst_dict, *args, **kwargs
     ) -> Tuple[bool, DetectionEnum, float]:
+        # counts are scaled by the sampling rate of the period, thresholds apply to the sent packets
+        sampling_rate = kwargs.pop("sampling_rate", 1.0)
         # case 1: amount of packets arriving at destination is above threshold
-        num_packets_destination = sum(dst_dict[victim_ip].values())
+        num_packets_destination = scale_sampled(
+            sum(dst_dict[victim_ip].values()), sampling_rate
+        )
         if num_packets_destination > THRESHOLD_VICTIM_LO:
             return True, DetectionEnum.THRESHOLD, num_packets_destination
 
         # case 2: increase in traffic above threshold
         dest_dict_aggregated = kwargs.pop("dest_dict_aggregated")
         rel_new_requests, ratio = self.check_timed_difference(
-            victim_ip, dst_dict, dest_dict_aggregated
+            victim_ip, dst_dict, dest_dict_aggregated, sampling_rate
         )
         if rel_new_requests:
             return True, DetectionEnum.TRAFFIC_INCREASE, ratio
@@ -96,12 +139,71 @@ class DDoSAttackAnalysis(AttackAnalysis):
 
 
 class HeavyHitterAnalysis(AttackerAnalysis):
+    def __init__(self):
+        # matched cases are counted and logged as a summary per request instead of a line per attacker
+        self.case_counts: Counter = Counter()
+
+    def pop_case_counts(self) -> dict:
+        case_counts, self.case_counts = self.case_counts, Counter()
+        return dict(case_counts)
+
+    def run_prefix_analysis(
+        self,
+        members: List[str],
+        victim_ip: str,
+        src_dict: defaultdict,
+        dst_dict: defaultdict,
+        **kwargs,
+    ) -> List[str]:
+        src_dict_tm1 = kwargs["src_dict_tm1"]
+        sampling_rate = kwargs.get("sampling_rate", 1.0)
+        sampling_rate_tm1 = kwargs.get("sampling_rate_tm1", 1.0)
+        sending = {}
+        for member in members:
+            num_packets = max(
+                scale_sampled(
+                    src_dict.get(member, {}).get(victim_ip, 0), sampling_rate
+                ),
+                scale_sampled(
+                    src_dict_tm1.get(member, {}).get(victim_ip, 0), sampling_rate_tm1
+                ),
+            )
+            if num_packets:
+                sending[member] = num_packets
+        # case 5: the sources of the prefix send too many packets to the victim together.
+        # as by the originator, heavy hitters are not aggregated (they are analysed on their own)
+        # and each acknowledged source has to send a share of the packets of a heavy hitter,
+        # i.e. a single heavy source does not make its neighbours attackers
+        min_packets = THRESHOLD_SRC_1 / HHH_MIN_SOURCES
+        contributing = [
+            member
+            for member, num_packets in sending.items()
+            if min_packets <= num_packets <= THRESHOLD_SRC_1
+        ]
+        found: List[str] = []
+        if (
+            len(contributing) >= HHH_MIN_SOURCES
+            and sum(sending[member] for member in contributing) >= HHH_THRESHOLD
+        ):
+            self.case_counts["case5"] += len(contributing)
+            log.debug("depth - case5: %s sources -> %s", len(contributing), victim_ip)
+            found = contributing
+        acknowledged = set(found)
+        return found + super().run_prefix_analysis(
+            [member for member in members if member not in acknowledged],
+            victim_ip,
+            src_dict,
+            dst_dict,
+            **kwargs,
+        )
+
     @staticmethod
     def is_traffic_direction_proportional(
         atk_ip: str,
         vic_ip: str,
-        num_packets_from_src_to_victim_only: int,
+        num_packets_from_src_to_victim_only: float,
         dst_dict: dict,
+        sampling_rate: float = 1.0,
     ):
         """
         Considers the proportionality in flow between src and destination.
@@ -111,7 +213,7 @@ class HeavyHitterAnalysis(AttackerAnalysis):
         # number of packets attacker sent to victim
         num_to_vic = num_packets_from_src_to_victim_only
         # number of packets attacker got from victim
-        num_from_vic = dst_dict[atk_ip].get(vic_ip, 0)
+        num_from_vic = scale_sampled(dst_dict[atk_ip].get(vic_ip, 0), sampling_rate)
         # case where attacker has not received any traffic from victim
         # these are considered as likelier attackers here => weighted 10x more
         if num_from_vic == 0:
@@ -120,11 +222,11 @@ class HeavyHitterAnalysis(AttackerAnalysis):
         # only consider the case atk_to_vic > atk_from_vic.
         # since we are not concerned here with the victim being an attacker
         if THRESHOLD_TRAFFIC_PROPORTIONALITY <= num_to_vic / num_from_vic:
-            log.info(f"Proportionality: False - {num_to_vic} / {num_from_vic}")
+            log.debug("Proportionality: False - %s / %s", num_to_vic, num_from_vic)
             return False
         return True
 
-    # @stopwatch(name="AttackerAnalysis")
+    @stopwatch(name="AttackerAnalysis")
     def run_analysis(
         self,
         attacker_ip: str,
@@ -137,13 +239,16 @@ class HeavyHitterAnalysis(AttackerAnalysis):
         src_dict = src_dict.copy()
         dst_dict = dst_dict.copy()
         src_dict_tm1 = kwargs.pop("src_dict_tm1")
+        # counts of each period are scaled by its sampling rate, thresholds apply to the sent packets
+        sampling_rate = kwargs.pop("sampling_rate", 1.0)
+        sampling_rate_tm1 = kwargs.pop("sampling_rate_tm1", 1.0)
 
-        num_packets_from_src_to_victim_only = src_dict.get(attacker_ip, {}).get(
-            victim_ip, 0
+        num_packets_from_src_to_victim_only = scale_sampled(
+            src_dict.get(attacker_ip, {}).get(victim_ip, 0), sampling_rate
+        )
+        num_packets_from_src_to_victim_only_prev = scale_sampled(
+            src_dict_tm1.get(attacker_ip, {}).get(victim_ip, 0), sampling_rate_tm1
         )
-        num_packets_from_src_to_victim_only_prev = src_dict_tm1.get(
-            attacker_ip, {}
-        ).get(victim_ip, 0)
 
         num_packets_from_src_to_victim_only = max(
             num_packets_from_src_to_victim_only,
@@ -151,30 +256,45 @@ class HeavyHitterAnalysis(AttackerAnalysis):
         )
         # case 1: source sends too many packets to victim
         if num_packets_from_src_to_victim_only > THRESHOLD_SRC_1:
-            log.info("depth - case1")
+            self.case_counts["case1"] += 1
+            log.debug("depth - case1: %s -> %s", attacker_ip, victim_ip)
             return True
         # case 2: source sends many packets to many victims
-        packets_from_this_src = sum(src_dict.get(attacker_ip, {}).values())
-        packets_from_this_src_prev = sum(src_dict_tm1.get(attacker_ip, {}).values())
+        packets_from_this_src = scale_sampled(
+            sum(src_dict.get(attacker_ip, {}).values()), sampling_rate
+        )
+        packets_from_this_src_prev = scale_sampled(
+            sum(src_dict_tm1.get(attacker_ip, {}).values()), sampling_rate_tm1
+        )
         num_packets_from_this_src = max(
             packets_from_this_src, packets_from_this_src_prev
         )
         if num_packets_from_this_src > THRESHOLD_SRC_2:
-            log.info("depth - case2")
+            self.case_counts["case2"] += 1
+            log.debug("depth - case2: %s -> %s", attacker_ip, victim_ip)
             return True
         # case 3: source is sending packets only to the victim, though not enough packets to enter the other thresholds
         if num_packets_from_this_src > THRESHOLD_SRC_3_MIN and (
             (ratio := (num_packets_from_src_to_victim_only / num_packets_from_this_src))
             >= THRESHOLD_SRC_3
         ):
-            log.info(
-                f"depth - case3: {num_packets_from_src_to_victim_only} / {num_packets_from_this_src} packets = {ratio}"
+            self.case_counts["case3"] += 1
+            log.debug(
+                "depth - case3: %s / %s packets = %s",
+                num_packets_from_src_to_victim_only,
+                num_packets_from_this_src,
+                ratio,
             )
             return True
         # case 4: traffic direction proportionality
         if not self.is_traffic_direction_proportional(
-            attacker_ip, victim_ip, num_packets_from_src_to_victim_only, dst_dict
+            attacker_ip,
+            victim_ip,
+            num_packets_from_src_to_victim_only,
+            dst_dict,
+            sampling_rate,
         ):
-            log.info("depth - case4")
+            self.case_counts["case4"] += 1
+            log.debug("depth - case4: %s -> %s", attacker_ip, victim_ip)
             return True
         return False
@@ -0,0 +1,111 @@
+import logging
+from collections import Counter, deque
+from typing import Deque, Dict, Iterable, Set, Tuple
+
+from src.config import ATTACKER_TTL_PERIODS, ATTACKER_MAX_ENTRIES
+
+log = logging.getLogger("ch2tf")
+
+
+class ConfirmedAttackerTable:
+    """
+    Attackers confirmed by the responses of other ASes, checked for each packet before it is aggregated.
+    The attackers are confirmed per victim, i.e. only their packets to that victim are counted per flow
+    and kept out of the traffic tables, which therefore do not grow with an ongoing attack.
+    Their traffic to other destinations is still aggregated and analysed.
+
+    The attackers expire in buckets of analysis periods: an attacker is kept for ttl_periods periods
+    after it was confirmed the last time. Expiring a period only touches the attackers confirmed in it.
+    A lookup is a single dict lookup, unlike a bloom filter the table supports removal and has no false positives.
+    """
+
+    def __init__(
+        self,
+        ttl_periods: int = ATTACKER_TTL_PERIODS,
+        max_entries: int = ATTACKER_MAX_ENTRIES,
+    ):
+        """
+        :param ttl_periods: periods an attacker is kept after its last confirmation
+        :type ttl_periods: int
+        :param max_entries: max. number of attackers, further attackers are not added
+        :type max_entries: int
+        """
+        self.ttl_periods = ttl_periods
+        self.max_entries = max_entries
+        self.epoch = 0
+        # (attacker, victim) -> epoch of the last confirmation
+        self._confirmed: Dict[Tuple[str, str], int] = {}
+        # (epoch, flows confirmed in it), oldest first
+        self._buckets: Deque[Tuple[int, Set[Tuple[str, str]]]] = deque([(0, set())])
+        # (attacker, victim) -> packets of the current period
+        self.packets: Counter = Counter()
+
+    def __contains__(self, flow: Tuple[str, str]) -> bool:
+        return flow in self._confirmed
+
+    def __len__(self) -> int:
+        return len(self._confirmed)
+
+    def add(self, ips: Iterable[str], victim: str) -> int:
+        """
+        Adds the attackers of a victim or refreshes their expiry.
+
+        :param ips: confirmed attackers
+        :type ips: Iterable[str]
+        :param victim: victim the attackers have been confirmed for
+        :type victim: str
+        :return: number of attackers that were not in the table
+        :rtype: int
+        """
+        bucket = self._buckets[-1][1]
+        added = 0
+        for ip in ips:
+            flow = (ip, victim)
+            if flow not in self._confirmed:
+                if len(self._confirmed) >= self.max_entries:
+                    log.debug("confirmed attacker table is full, %s not added", ip)
+                    continue
+                added += 1
+            self._confirmed[flow] = self.epoch
+            bucket.add(flow)
+        return added
+
+    def remove(self, ip: str, victim: str) -> bool:
+        """
+        :param ip: attacker to remove
+        :type ip: str
+        :param victim: victim the attacker has been confirmed for
+        :type victim: str
+        :return: whether the attacker was in the table
+        :rtype: bool
+        """
+        # the attacker stays in its bucket, the bucket is skipped on expiry
+        return self._confirmed.pop((ip, victim), None) is not None
+
+    def rollover(self) -> Counter:
+        """
+        Ends the period: expires the attackers of the oldest bucket that were not confirmed again.
+
+        :return: (attacker, victim) -> packets of the ended period
+        :rtype: Counter
+        """
+        packets, self.packets = self.packets, Counter()
+        self.epoch += 1
+        self._buckets.append((self.epoch, set()))
+        expired = 0
+        while self._buckets[0][0] <= self.epoch - self.ttl_periods:
+            epoch, flows = self._buckets.popleft()
+            for flow in flows:
+                if self._confirmed.get(flow) == epoch:
+                    del self._confirmed[flow]
+                    expired += 1
+        if packets or expired:
+            log.info(
+                "confirmed attackers: %s packets of %s flows kept out of the tables, "
+                "%s expired, %s active",
+                sum(packets.values()),
+                len(packets),
+                expired,
+                len(self._confirmed),
+            )
+        return packets
@@ -0,0 +1,132 @@
+import threading
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Mapping, Tuple
+
+from src.enums import DecisionEnum
+
+
+@dataclass
+class Campaign:
+    """
+    All collaboration requests that are sent for the same victim while it stays under attack.
+    """
+
+    victim: str
+    last_period: int
+    campaign_id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    # attacker -> number of packets when it was last sent in a request
+    sent: Dict[str, int] = field(default_factory=dict)
+    # attacker -> number of packets when it was last analysed by this AS itself,
+    # kept apart from sent since early alarms publish requests without analysing them locally
+    handled: Dict[str, int] = field(default_factory=dict)
+
+
+class CampaignManager:
+    """
+    Keeps track of the victims that are currently under attack (originator side).
+    For each victim, a campaign with a stable id is kept, such that repeated detections
+    only send the attackers that are new or whose number of packets changed significantly.
+    """
+
+    def __init__(self, idle_periods: int, change_ratio: float):
+        """
+        :param idle_periods: number of periods without detection after which a campaign ends
+        :type idle_periods: int
+        :param change_ratio: factor by which the packets of an attacker have to increase to be sent again
+        :type change_ratio: float
+        """
+        self.idle_periods = idle_periods
+        self.change_ratio = change_ratio
+        self.period = 0
+        self.campaigns: Dict[str, Campaign] = {}
+        self._lock = threading.Lock()
+
+    def delta(
+        self, victim: str, src_ips: Mapping[str, int], local: bool = False
+    ) -> Tuple[str, List[str]]:
+        """
+        Returns the campaign id of the victim and the attackers that have not been sent yet in this campaign,
+        or whose number of packets increased by at least change_ratio since they have been sent.
+
+        :param victim: the potential victim
+        :type victim: str
+        :param src_ips: source -> number of packets sent to the victim
+        :type src_ips: Mapping[str, int]
+        :param local: whether the attackers are analysed by this AS itself instead of sent to the others
+        :type local: bool
+        :return: campaign id and the new or changed attackers
+        :rtype: Tuple[str, List[str]]
+        """
+        with self._lock:
+            campaign = self.campaigns.get(victim)
+            if campaign is None:
+                campaign = Campaign(victim=victim, last_period=self.period)
+                self.campaigns[victim] = campaign
+            campaign.last_period = self.period
+            sent = campaign.handled if local else campaign.sent
+            changed = []
+            for src_ip, num_packets in list(src_ips.items()):
+                prev = sent.get(src_ip)
+                if prev is None or num_packets >= prev * self.change_ratio:
+                    sent[src_ip] = num_packets
+                    changed.append(src_ip)
+            return campaign.campaign_id, changed
+
+    def end_period(self) -> List[str]:
+        """
+        Starts a new period and ends the campaigns of victims that have not been detected for idle_periods.
+
+        :return: ids of the ended campaigns
+        :rtype: List[str]
+        """
+        with self._lock:
+            self.period += 1
+            ended = [
+                victim
+                for victim, campaign in self.campaigns.items()
+                if self.period - campaign.last_period > self.idle_periods
+            ]
+            return [self.campaigns.pop(victim).campaign_id for victim in ended]
+
+
+class CampaignVerdictCache:
+    """
+    Caches the verdicts of the receiving AS per campaign.
+    Only verdicts that do not change during an attack are kept,
+    i.e. NOT_MANAGED and FOUND (acknowledged attacker).
+    Managed ips that have been under the thresholds may exceed them with the traffic of a later period,
+    they are only cached for the current period by the VerdictCache, i.e. further chunks of the campaign
+    in the same period are not analysed again.
+    """
+
+    def __init__(self, idle_periods: int):
+        """
+        :param idle_periods: number of periods without request after which the verdicts of a campaign are dropped
+        :type idle_periods: int
+        """
+        self.idle_periods = idle_periods
+        self.period = 0
+        # campaign id -> (last period used, attacker -> verdict)
+        self.verdicts: Dict[str, Tuple[int, Dict[str, DecisionEnum]]] = {}
+
+    def get_campaign(self, campaign_id: str) -> Dict[str, DecisionEnum]:
+        """
+        Returns the cached verdicts of a campaign, which can be read and updated by the caller.
+
+        :param campaign_id: id of the campaign
+        :type campaign_id: str
+        :return: attacker -> verdict
+        :rtype: Dict[str, DecisionEnum]
+        """
+        _, verdicts = self.verdicts.get(campaign_id, (self.period, {}))
+        self.verdicts[campaign_id] = (self.period, verdicts)
+        return verdicts
+
+    def end_period(self) -> None:
+        self.period += 1
+        self.verdicts = {
+            campaign_id: entry
+            for campaign_id, entry in self.verdicts.items()
+            if self.period - entry[0] <= self.idle_periods
+        }
@@ -1,21 +1,33 @@
 import copy
-import os
 import time
 from multiprocessing import Queue
-from collections import defaultdict
+from typing import Any, Callable, Iterable, List, Sequence
+from collections import defaultdict, deque
 import logging
 from kafka.consumer.fetcher import ConsumerRecord
 from kafka import KafkaConsumer, KafkaProducer
 from src.enums import DetectionEnum, DecisionEnum
+from .attackers import ConfirmedAttackerTable
+from .checkpoint import Checkpointer
+from .digests import DigestTable, encode_bloom_filter
+from .export import EpochExporter
+from .sampling import SamplingController
+from .hhh import aggregate_sources, is_prefix, parse_prefix, PrefixIndex
+from .sharding import ShardRebalanceListener
 from .analyses import (
     AttackerAnalysis,
     AttackAnalysis,
 )
+from .campaign import CampaignManager, CampaignVerdictCache
+from .metrics import CH2TFMetrics, timed
+from .verdict_cache import VerdictCache
+from .state import CH2TFState
+from .state_store import BoundedStore, StoredRequest, AttackerRef
 from src.util import (
     is_sampling_skip,
     init_managed_ips,
-    init_bloom_filter,
-    add_to_bloom_filter,
+    partition_for,
+    scale_sampled,
 )
 from collections import Counter
 
@@ -32,51 +44,146 @@ from src.config import (
     MANAGED_IPS_PATH,
     ANALYSIS_PERIOD,
     MSG_LENGTH,
-    SAMPLING_RATE,
     USE_HASH,
     TOPICS_USE_ADDITIONAL,
+    TOPIC_PARTITIONS,
+    CONSUMER_GROUP,
+    DIGEST_ROUTING,
+    DIGEST_TOPIC,
+    DIGEST_PERIODS,
+    STREAMING_DETECTION,
+    STREAMING_DEBOUNCE,
+    CAMPAIGN_IDLE_PERIODS,
+    CAMPAIGN_CHANGE_RATIO,
+    HHH_ENABLED,
+    HHH_THRESHOLD,
+    HHH_MIN_SOURCES,
+    THRESHOLD_SRC_1,
+    ATTACKER_FAST_PATH,
+    ATTACKER_MIN_REPUTATION,
+    CHECKPOINT_DIR,
+    EXPORT_DIR,
 )
 
 from src.mitigation import Mitigation
 from src.models import (
     DefenseCollaborationRequestData,
     DefenseCollaborationResponseData,
+    Detection,
+    ManagedSpaceDigest,
     PacketData,
 )
 from src.util.jsonSerializer import json_serializer, json_deserializer
+from src.util.profiling import stopwatch, stage_timer, stage_timers_enabled
+from src.util.pseudonym import hash_ip
 
 log = logging.getLogger("ch2tf")
 
+COLLECTION_TIMER_SAMPLING = 1024
 
-class CH2TF:
-    dest_dict: defaultdict = defaultdict(Counter)
-    src_dict: defaultdict = defaultdict(Counter)
-    src_dict_tm1: defaultdict = defaultdict(Counter)
-    reputation_dict: defaultdict = defaultdict(lambda: 1.0)
-    req_dict: defaultdict = defaultdict(lambda: DefenseCollaborationRequestData)
-    responses: defaultdict = defaultdict(
-        lambda: defaultdict(lambda: DefenseCollaborationResponseData)
-    )
 
+class CH2TF:
     def __init__(
         self,
         queue: Queue,
         mitigation: Mitigation,
         attacker_analysis: AttackerAnalysis,
         attack_analysis: AttackAnalysis,
+        state: CH2TFState | None = None,
+        as_name: str = AS_NAME,
+        managed_ips: Any = None,
+        producer: KafkaProducer | None = None,
+        consumer_factory: Callable[[], KafkaConsumer] | None = None,
+        clock: Callable[[], float] = time.monotonic,
+        metrics: CH2TFMetrics | None = None,
+        attackers: ConfirmedAttackerTable | None = None,
+        sampling: SamplingController | None = None,
+        checkpointer: Checkpointer | None = None,
+        exporter: EpochExporter | None = None,
     ):
-        self.dest_dict_aggregated: defaultdict = defaultdict(Counter)
+        """
+        :param state: traffic tables and collaboration state, a new CH2TFState by default
+        :type state: CH2TFState | None
+        :param as_name: name of this AS
+        :type as_name: str
+        :param managed_ips: container of the managed ips, read from MANAGED_IPS_PATH by default
+        :type managed_ips: Any
+        :param producer: producer to publish the collaboration messages, a KafkaProducer by default
+        :type producer: KafkaProducer | None
+        :param consumer_factory: creates the consumer to listen with, a KafkaConsumer by default
+        :type consumer_factory: Callable[[], KafkaConsumer] | None
+        :param clock: returns the current time in seconds
+        :type clock: Callable[[], float]
+        :param metrics: metrics of the pipeline stages, registered in the process registry by default
+        :type metrics: CH2TFMetrics | None
+        :param attackers: confirmed attackers whose packets are kept out of the traffic tables
+        :type attackers: ConfirmedAttackerTable | None
+        :param sampling: sets the sampling rate of each period, a SamplingController by default
+        :type sampling: SamplingController | None
+        :param checkpointer: writes and restores snapshots of the state, only used if CHECKPOINT_DIR is set by default
+        :type checkpointer: Checkpointer | None
+        :param exporter: exports the traffic and decisions of each period, only used if EXPORT_DIR is set by default
+        :type exporter: EpochExporter | None
+        """
+        # traffic tables and collaboration state, owned by this instance
+        self.state = state if state is not None else CH2TFState()
+        self.as_name = as_name
+        self.clock = clock
+        self.metrics = metrics if metrics is not None else CH2TFMetrics(as_name)
+        # victim -> time of the last collaboration request (for debouncing early alarms)
+        self.alarm_dict: dict = {}
+        # early alarms raised while collecting packets, sent by send_early_alarms on the analysis thread
+        self.pending_alarms: deque = deque()
+        # originator side: victims under attack, receiver side: verdicts per campaign
+        self.campaigns = CampaignManager(CAMPAIGN_IDLE_PERIODS, CAMPAIGN_CHANGE_RATIO)
+        self.campaign_verdicts = CampaignVerdictCache(CAMPAIGN_IDLE_PERIODS)
+        # receiver side: verdicts per (attacker, victim) of the current epoch
+        self.verdict_cache = VerdictCache()
         self.queue = queue
+        if queue is not None:
+            self.metrics.queue_depth.set_function(queue.qsize)
         self.mitigation = mitigation
         self.sub_topics = [top + "." for top in TOPICS]
-        self.managed_ips = init_managed_ips(MANAGED_IPS_PATH, USE_HASH)
-        self.heavy_hitter_table = init_bloom_filter()
+        self.managed_ips = (
+            managed_ips
+            if managed_ips is not None
+            else init_managed_ips(MANAGED_IPS_PATH, USE_HASH, hash_function=hash_ip)
+        )
+        # attackers confirmed by FOUND responses per victim, only filled if ATTACKER_FAST_PATH is enabled
+        self.attackers = (
+            attackers if attackers is not None else ConfirmedAttackerTable()
+        )
+        self.sampling = sampling if sampling is not None else SamplingController()
+        # packets of a SampledQueue are sampled before they are queued, not again when they are aggregated.
+        # checked by its interface, the class may have been imported through another path (src.ch2tf / ch2tf)
+        self._presampled = hasattr(queue, "set_rate")
+        if self._presampled:
+            queue.set_rate(self.sampling.rate)  # type: ignore
+        self.metrics.sampling_rate.set(self.sampling.rate)
+        self.checkpointer = (
+            checkpointer
+            if checkpointer is not None
+            else (Checkpointer() if CHECKPOINT_DIR else None)
+        )
+        self.exporter = (
+            exporter
+            if exporter is not None
+            else (EpochExporter(as_name) if EXPORT_DIR else None)
+        )
+        # digests of the managed ips of the other ASes, only used if DIGEST_ROUTING is enabled
+        self.digests = DigestTable(clock=clock)
+        self._digest: str | None = None
+        # partitions of the victims this worker analyses, all victims if None (no consumer group)
+        self.shard: frozenset | None = None
+        # victim -> partition, cleared each period
+        self._partitions: dict = {}
 
-        self.producer = KafkaProducer(
+        self.producer = producer or KafkaProducer(
             bootstrap_servers=[KAFKA],
             api_version=(0, 10, 0),
             value_serializer=json_serializer,
         )
+        self.consumer_factory = consumer_factory or self._create_kafka_consumer
         self.attacker_analysis = attacker_analysis
         self.attack_analysis = attack_analysis
 
@@ -109,6 +216,42 @@ class CH2TF:
         """
         return ip_address in self.managed_ips
 
+    def assign_shard(self, partitions: Iterable[int] | None) -> None:
+        """
+        Sets the partitions of the victims this worker is responsible for.
+        Traffic to other victims is no longer aggregated in the destination perspective (except to managed ips),
+        entries of revoked victims are gone after the next period. The source perspective is kept for all victims.
+
+        :param partitions: assigned partitions, None for all
+        :type partitions: Iterable[int] | None
+        :return: None
+        """
+        self.shard = frozenset(partitions) if partitions is not None else None
+        log.info(
+            "%s: shard %s of %s partitions",
+            self.as_name,
+            sorted(self.shard) if self.shard is not None else "all",
+            TOPIC_PARTITIONS,
+        )
+
+    def partition(self, victim: str) -> int:
+        """
+        :param victim: potential victim
+        :type victim: str
+        :return: partition of the messages and the traffic of the victim
+        :rtype: int
+        """
+        partition = self._partitions.get(victim)
+        if partition is None:
+            partition = self._partitions[victim] = partition_for(
+                victim, TOPIC_PARTITIONS
+            )
+        return partition
+
+    def _partition_of(self, victim: str) -> int | None:
+        # messages are only sent to an explicit partition if the topics are partitioned
+        return self.partition(victim) if TOPIC_PARTITIONS > 1 else None
+
     def collect_packages(self) -> None:
         """
         Collect traffic packages that the method receives through the queue.
@@ -116,16 +259,37 @@ class CH2TF:
         :return: None
         """
 
-        dest_dict = self.dest_dict
-        src_dict = self.src_dict
+        state = self.state
+        collection = stage_timer("collection")
+        received_packets = 0
+        sampled = self._presampled
         while True:
             received: PacketData = self.queue.get()
-            self._store_data(received, dest_dict, src_dict)
+            # the tables are replaced at the end of each period
+            dest_dict = state.dest_dict
+            src_dict = state.src_dict
+            received_packets += 1
+            if received_packets % COLLECTION_TIMER_SAMPLING == 0:
+                self.observe_backlog()
+            # only one of COLLECTION_TIMER_SAMPLING packets is timed, timing each costs more than storing it
+            if (
+                received_packets % COLLECTION_TIMER_SAMPLING == 0
+                and stage_timers_enabled()
+            ):
+                start = time.perf_counter()
+                self._store_data(received, dest_dict, src_dict, sampled)
+                collection.observe(time.perf_counter() - start)
+                continue
+            self._store_data(received, dest_dict, src_dict, sampled)
 
     # noinspection PyMethodMayBeStatic
     # (using references here, cannot be static)
     def _store_data(
-        self, received: PacketData, dest_dict: defaultdict, src_dict: defaultdict
+        self,
+        received: PacketData,
+        dest_dict: defaultdict,
+        src_dict: defaultdict,
+        sampled: bool = False,
     ) -> None:
         """
         Aggregates packages.
@@ -136,89 +300,596 @@ class CH2TF:
         :type dest_dict: defaultdict(Counter)
         :param src_dict: Source perspective dict
         :type src_dict: defaultdict(Counter)
+        :param sampled: whether the packet has already been sampled (by a SampledQueue)
+        :type sampled: bool
         :return: None
         """
-        if is_sampling_skip(SAMPLING_RATE):
+        # fast path: packets of confirmed attackers to their victim are only counted
+        attackers = self.attackers
+        if attackers:
+            flow = (received.src, received.dst)
+            if flow in attackers:
+                attackers.packets[flow] += 1
+                return
+        sampling_rate = self.sampling.rate
+        if (
+            sampling_rate < 1
+            and not sampled
+            and is_sampling_skip(sampling_rate, self.sampling.rng.random())
+        ):
+            self.metrics.packets_sampled_out.inc()
             return
-        dest_dict[received.dst][received.src] += 1
+        shard = self.shard
+        if shard is None or self.partition(received.dst) in shard:
+            dest_dict[received.dst][received.src] += 1
+            if STREAMING_DETECTION:
+                self.state.dest_totals[received.dst] += 1
+                # the threshold is scaled instead of the count of each packet
+                if (
+                    self.state.dest_totals[received.dst]
+                    > THRESHOLD_VICTIM_LO * sampling_rate
+                ):
+                    self._raise_early_alarm(received.dst, dest_dict)
+        elif self.check_if_is_managed(received.dst):
+            # victims of other partitions are aggregated by their workers, the traffic to managed ips is kept
+            # for the traffic proportionality of their sources (case 4)
+            dest_dict[received.dst][received.src] += 1
+        else:
+            self.metrics.packets_sharded_out.inc()
+        # the source perspective is not sharded, the analysis of a source needs all of its destinations
         if not self.check_if_is_managed(received.src):
             return
         src_dict[received.src][received.dst] += 1
 
-    def run_analysis(self) -> None:
+    @stopwatch("collection")
+    def store_packets(self, packets: Sequence[PacketData]) -> None:
+        """
+        Aggregates a batch of packets taken from the queue.
+
+        :param packets: received packets
+        :type packets: Sequence[PacketData]
+        :return: None
         """
-        Every x seconds the shallow analysis is run.
+        dest_dict = self.state.dest_dict
+        src_dict = self.state.src_dict
+        sampled = self._presampled
+        for received in packets:
+            self._store_data(received, dest_dict, src_dict, sampled)
+
+    @stopwatch("collection")
+    def store_batch(self, srcs: Sequence[str], dsts: Sequence[str]) -> None:
+        """
+        Aggregates a batch of packets, given as columns of source and destination addresses.
+        Same result as _store_data for each packet, but the packets are counted per flow first
+        and each distinct flow is only checked once against the confirmed attackers (each source against the managed ips).
+
+        :param srcs: source addresses
+        :type srcs: Sequence[str]
+        :param dsts: destination addresses
+        :type dsts: Sequence[str]
+        :return: None
+        """
+        flows = Counter(zip(srcs, dsts))
+        attackers = self.attackers
+        if attackers:
+            for flow in [flow for flow in flows if flow in attackers]:
+                attackers.packets[flow] += flows.pop(flow)
+        sampling_rate = self.sampling.rate
+        if sampling_rate < 1:
+            sampled = Counter()
+            rand = self.sampling.rng.random
+            for flow, num_packets in flows.items():
+                kept = sum(
+                    not is_sampling_skip(sampling_rate, rand())
+                    for _ in range(num_packets)
+                )
+                if kept:
+                    sampled[flow] = kept
+            self.metrics.packets_sampled_out.inc(
+                sum(flows.values()) - sum(sampled.values())
+            )
+            flows = sampled
+        dest_dict = self.state.dest_dict
+        src_dict = self.state.src_dict
+        managed: dict = {}
+        # destination -> whether it is kept in the destination perspective of this worker
+        kept: dict = {}
+        sharded_out = 0
+        for (src, dst), num_packets in flows.items():
+            keep = kept.get(dst)
+            if keep is None:
+                keep = kept[dst] = self._keeps_destination(dst)
+            if keep:
+                dest_dict[dst][src] += num_packets
+            else:
+                sharded_out += num_packets
+            is_managed = managed.get(src)
+            if is_managed is None:
+                is_managed = managed[src] = self.check_if_is_managed(src)
+            if is_managed:
+                src_dict[src][dst] += num_packets
+        if sharded_out:
+            self.metrics.packets_sharded_out.inc(sharded_out)
+        if STREAMING_DETECTION:
+            dest_totals = self.state.dest_totals
+            victims = {dst for dst in kept if self._in_shard(dst)}
+            for (_, dst), num_packets in flows.items():
+                if dst in victims:
+                    dest_totals[dst] += num_packets
+            for dst in victims:
+                if dest_totals[dst] > THRESHOLD_VICTIM_LO * sampling_rate:
+                    self._raise_early_alarm(dst, dest_dict)
+
+    def _in_shard(self, victim: str) -> bool:
+        """
+        :param victim: potential victim
+        :type victim: str
+        :return: whether the victim is analysed by this worker
+        :rtype: bool
+        """
+        return self.shard is None or self.partition(victim) in self.shard
+
+    def _keeps_destination(self, dst: str) -> bool:
+        """
+        Victims of other partitions are aggregated by their workers, the traffic to managed ips is kept
+        for the traffic proportionality of their sources (case 4).
+
+        :param dst: destination of a packet
+        :type dst: str
+        :return: whether the traffic to the destination is kept in the destination perspective
+        :rtype: bool
+        """
+        return self._in_shard(dst) or self.check_if_is_managed(dst)
+
+    def _raise_early_alarm(self, dest_ip: str, dest_dict: defaultdict) -> None:
+        """
+        Raises an alarm as soon as a victim crosses THRESHOLD_VICTIM_LO,
+        without waiting for the end of the analysis period.
+        Alarms for the same victim are debounced by STREAMING_DEBOUNCE seconds.
+        The alarm is only queued, the collaboration requests are sent by send_early_alarms.
+
+        :param dest_ip: the potential victim
+        :type dest_ip: str
+        :param dest_dict: Destination perspective dict
+        :type dest_dict: defaultdict(Counter)
+        :return: None
+        """
+        now = self.clock()
+        last_alarm = self.alarm_dict.get(dest_ip)
+        if last_alarm is not None and now - last_alarm < STREAMING_DEBOUNCE:
+            return
+        self.alarm_dict[dest_ip] = now
+        num_packets_for_this_destination = scale_sampled(
+            self.state.dest_totals[dest_ip], self.sampling.rate
+        )
+        log.info(
+            "early alarm for victim %s: %s packets",
+            dest_ip,
+            num_packets_for_this_destination,
+        )
+        # the sources are copied, the collection of packets keeps updating them
+        self.pending_alarms.append(
+            (dest_ip, Counter(dest_dict[dest_ip]), num_packets_for_this_destination)
+        )
+
+    def send_early_alarms(self) -> int:
+        """
+        Sends the collaboration requests of the queued early alarms.
+        Runs with the analysis (like dispatch and analyse_period), the campaign, the mitigation
+        and the producer are never used by the thread that collects the packets.
+
+        :return: number of sent alarms
+        :rtype: int
+        """
+        sent = 0
+        while self.pending_alarms:
+            dest_ip, src_ips, num_packets = self.pending_alarms.popleft()
+            # the local analysis (handle_collab_req) is left to the periodic analysis
+            self._send_collab_requests(
+                dest_ip,
+                src_ips,
+                DetectionEnum.THRESHOLD,
+                num_packets,
+                num_packets,
+                handle_locally=False,
+            )
+            sent += 1
+        return sent
+
+    def _send_collab_requests(
+        self,
+        dest_ip: str,
+        src_ips: Counter,
+        detection_case: DetectionEnum,
+        ratio: float,
+        num_packets_for_this_destination: float,
+        handle_locally: bool = True,
+    ) -> List[str]:
+        """
+        Publishes the collaboration requests for a detected victim, split into messages of MSG_LENGTH.
+        While the victim stays under attack, the requests share the same campaign id
+        and only contain the sources that are new or changed in this campaign.
+        With HHH_ENABLED, sources that are heavy hitters only together are sent as their prefix.
+
+        :param dest_ip: the potential victim
+        :type dest_ip: str
+        :param src_ips: source -> number of packets sent to the victim
+        :type src_ips: Counter
+        :param detection_case: how the attack has been detected
+        :type detection_case: DetectionEnum
+        :param ratio: detection value, sent relative to the AS size
+        :type ratio: float
+        :param num_packets_for_this_destination: packets received by the victim in this period, scaled by the sampling rate
+        :type num_packets_for_this_destination: float
+        :param handle_locally: whether this AS analyses its own request directly
+        :type handle_locally: bool
+        :return: the prefixes that are sent instead of their sources
+        :rtype: List[str]
+        """
+        req_dict = self.state.req_dict
+        prefixes: List[str] = []
+        if HHH_ENABLED:
+            num_sources = len(src_ips)
+            # the sources are counted in sampled packets of the current period
+            sampling_rate = self.sampling.rate
+            src_ips, prefixes = aggregate_sources(
+                src_ips,
+                HHH_THRESHOLD * sampling_rate,
+                HHH_MIN_SOURCES,
+                THRESHOLD_SRC_1 * sampling_rate,
+            )
+            if prefixes:
+                log.info(
+                    "victim %s: %s sources aggregated into %s prefixes",
+                    dest_ip,
+                    num_sources - (len(src_ips) - len(prefixes)),
+                    len(prefixes),
+                )
+        if handle_locally:
+            # the campaign only sends new or changed sources, the blocks of the sources that keep attacking
+            # are extended each period such that they do not expire during the attack
+            self.mitigation.refresh(src_ips)
+        campaign_id, potential_attacker_ips = self.campaigns.delta(dest_ip, src_ips)
+        # early alarms only publish, the sources they sent are still analysed locally by the periodic analysis
+        local_ips = (
+            self.campaigns.delta(dest_ip, src_ips, local=True)[1]
+            if handle_locally
+            else []
+        )
+        if not potential_attacker_ips and not local_ips:
+            log.info(
+                "no new potential attackers for victim %s in campaign %s",
+                dest_ip,
+                campaign_id,
+            )
+            return prefixes
+        # pick topic based on threshold. i.e. probable vs highly certain of attack
+        # checks are simple here, to improve performance.
+        topic = TOPIC_LOW
+        if num_packets_for_this_destination > THRESHOLD_VICTIM_HI:
+            topic = TOPIC_HIGH
+        publish_topics = [topic]
+        # if this env is true, will skip 'default' topics! and send to each additional one
+        if TOPICS_USE_ADDITIONAL:
+            publish_topics = TOPICS
+
+        # (topics, potential attackers, whether the requests are published, whether they are handled locally)
+        if DIGEST_ROUTING and len(self.digests):
+            routes = self._route_by_digest(
+                potential_attacker_ips, publish_topics, local_ips
+            )
+        elif potential_attacker_ips == local_ips:
+            routes = [(publish_topics, potential_attacker_ips, True, True)]
+        else:
+            routes = [
+                route
+                for route in (
+                    (publish_topics, potential_attacker_ips, True, False),
+                    (publish_topics, local_ips, False, True),
+                )
+                if route[1]
+            ]
+
+        for topics, attacker_ips, publish, local in routes:
+            # split list into more manageable list of MSG_LENGTH
+            for x in range(0, len(attacker_ips), MSG_LENGTH):
+                request = DefenseCollaborationRequestData(
+                    potential_attacker_ips=attacker_ips[x : x + MSG_LENGTH],
+                    potential_victim=dest_ip,
+                    request_detection=detection_case,
+                    requests_relative_to_size=ratio / AS_SIZE,
+                    request_originator=self.as_name,
+                    campaign_id=campaign_id,
+                )
+                for top in topics if publish else ():
+                    topic = top + ".REQ"
+                    self._send(
+                        topic,
+                        request.to_json(),
+                        request.request_id,
+                        self._partition_of(dest_ip),
+                    )
+                    log.info(
+                        "%s sending collab request - %s - with id: %s for victim %s",
+                        self.as_name,
+                        topic,
+                        request.request_id,
+                        request.potential_victim,
+                    )
+
+                if publish and self.exporter is not None:
+                    self.exporter.record_request(request, "sent")
+                # store a reference to the chunk instead of a copy
+                req_dict.put(
+                    str(request.request_id),
+                    StoredRequest.from_request(
+                        request, AttackerRef(attacker_ips, x, x + MSG_LENGTH)
+                    ),
+                    owner=request.request_originator,
+                )
+                if local:
+                    # go directly to analysis, do not need to go through kafka
+                    self.handle_collab_req(def_collab_req=request, topics=topics)
+
+                log.debug(
+                    "%s potential attackers in request %s",
+                    len(request.potential_attacker_ips),
+                    request.request_id,
+                )
+        # light mitigation
+        self.mitigation.filter_ips(potential_attacker_ips)
+        return prefixes
+
+    def _route_by_digest(
+        self, potential_attacker_ips: list, publish_topics: list, local_ips: list
+    ) -> list:
+        """
+        Splits the potential attackers by the digests of the ASes that probably manage them.
+        Each AS receives its part on its own topics (<topic>.<AS name>), the part managed by this AS is only handled
+        locally. Potential attackers in no digest are broadcast as without digests. While an AS may be without a
+        fresh digest (at startup or after its digest expired), the routed potential attackers are broadcast as well,
+        a false positive of another digest must not keep them from the AS that manages them.
+
+        :param potential_attacker_ips: potential attackers of the campaign
+        :type potential_attacker_ips: list
+        :param publish_topics: topics the requests would be broadcast to
+        :type publish_topics: list
+        :param local_ips: potential attackers that this AS analyses directly if it manages them
+        :type local_ips: list
+        :return: routes as in _send_collab_requests
+        :rtype: list
+        """
+        digest_routes = self.digests.route(potential_attacker_ips)
+        routes = [
+            ([f"{top}.{as_name}" for top in publish_topics], attacker_ips, True, False)
+            for as_name, attacker_ips in digest_routes.items()
+            if as_name != self.as_name
+        ]
+        routed = (
+            {ip for attacker_ips in digest_routes.values() for ip in attacker_ips}
+            if self.digests.complete()
+            else set()
+        )
+        unrouted = [
+            ip
+            for ip in potential_attacker_ips
+            if ip not in routed and not self.check_if_is_managed(ip)
+        ]
+        if unrouted:
+            routes.append((publish_topics, unrouted, True, False))
+        # prefixes are not in the digests, they may contain managed sources of any AS
+        own = [ip for ip in local_ips if is_prefix(ip) or self.check_if_is_managed(ip)]
+        log.info(
+            "%s potential attackers routed to %s ASes, %s broadcast, %s managed by this AS",
+            len(potential_attacker_ips),
+            len(routes) - bool(unrouted),
+            len(unrouted),
+            len(own),
+        )
+        if own:
+            routes.append(
+                ([f"{top}.{self.as_name}" for top in publish_topics], own, False, True)
+            )
+        return routes
+
+    def publish_digest(self) -> None:
+        """
+        Publishes the digest of the managed ips on DIGEST_TOPIC.
+        :return: None
+        """
+        if self._digest is None:
+            self._digest = encode_bloom_filter(self.managed_ips)
+        digest = ManagedSpaceDigest(as_name=self.as_name, bloom_filter=self._digest)
+        # each worker of a consumer group reads its own partitions, the digest is sent to all of them
+        for partition in range(TOPIC_PARTITIONS) if TOPIC_PARTITIONS > 1 else [None]:
+            self._send(DIGEST_TOPIC, digest.to_json(), self.as_name, partition)
+        log.info("%s published its digest (%s bytes)", self.as_name, len(self._digest))
+
+    def handle_digest(self, message: ConsumerRecord) -> None:
+        """
+        Stores the digest of another AS.
+        :param message: pubsub message
+        :type message: ConsumerRecord
+        :return: None
+        """
+        digest = ManagedSpaceDigest.from_json(message.value)  # type: ignore
+        if digest.as_name != self.as_name:
+            self.digests.put(digest.as_name, digest.bloom_filter)
+
+    @timed("analysis_duration")
+    @stopwatch("analysis")
+    def analyse_period(self, iteration: int) -> list[Detection]:
+        """
+        Runs the shallow analysis once for the packets collected in the current period
+        and starts the next period afterwards.
         This is done for all packets that arrive at an AS,
         whether it will be routed further or are managed by this AS
+        :param iteration: number of the analysis period
+        :type iteration: int
+        :return: the potential victims detected in this period
+        :rtype: list[Detection]
+        """
+        log.info("running analysis: %s", iteration)
+        self.send_early_alarms()
+        if DIGEST_ROUTING and iteration % DIGEST_PERIODS == 0:
+            self.publish_digest()
+        # use copy here since during execution new packets are being collected
+        dest_dict = self.state.dest_dict.copy()
+        src_dict = self.state.src_dict.copy()
+        self.metrics.epoch_destinations.set(len(dest_dict))
+        self.metrics.epoch_flows.set(sum(len(srcs) for srcs in dest_dict.values()))
+        # the rate is constant within a period, it only changes in next_epoch
+        sampling_rate = self.sampling.rate
+        detections = []
+        for dest_ip, src_ips in dest_dict.items():
+            if not self._in_shard(dest_ip):
+                # traffic to a managed ip of another partition, only kept for the analysis of its sources
+                continue
+            detected, detection_case, ratio = self.attack_analysis.run_analysis(
+                "",
+                dest_ip,
+                src_dict,
+                dest_dict,
+                dest_dict_aggregated=self.state.dest_dict_aggregated,
+                sampling_rate=sampling_rate,
+            )
+            if not detected:
+                continue
+            self.alarm_dict[dest_ip] = self.clock()
+            num_packets = scale_sampled(sum(dest_dict[dest_ip].values()), sampling_rate)
+            self.metrics.detections.inc()
+            prefixes = self._send_collab_requests(
+                dest_ip,
+                dest_dict[dest_ip],
+                detection_case,
+                ratio,
+                num_packets,
+            )
+            detections.append(
+                Detection(dest_ip, detection_case, ratio, num_packets, prefixes)
+            )
+        dest_dict_aggregated = self.create_aggregate(self.state.dest_dict.copy())
+        # aggregated packets are counted once per period instead of per packet
+        self.metrics.packets_aggregated.inc(sum(dest_dict_aggregated.values()))
+        # compared with the next period, which may be sampled with another rate
+        self.state.dest_dict_aggregated = (
+            dest_dict_aggregated
+            if sampling_rate >= 1
+            else {
+                dest_ip: scale_sampled(num_packets, sampling_rate)
+                for dest_ip, num_packets in dest_dict_aggregated.items()
+            }
+        )
+        # tables are measured at their largest, i.e. before the reset
+        for name, memory in self.state.table_memory().items():
+            self.metrics.memory(name).set(memory)
+        self.metrics.packets_fast_path.inc(sum(self.attackers.rollover().values()))
+        self.metrics.confirmed_attackers.set(len(self.attackers))
+        self.mitigation.flush()
+        self.metrics.sampling_rate.set(self.sampling.next_epoch())
+        if self._presampled:
+            self.queue.set_rate(self.sampling.rate)  # type: ignore
+            self.metrics.packets_sampled_out.inc(self.queue.take_sampled_out())  # type: ignore
+        self.reset_data()
+        if self.exporter is not None:
+            # the counters of the copy are no longer changed after the reset
+            self.exporter.end_epoch(iteration, dest_dict, detections, sampling_rate)
+        if self.checkpointer is not None and iteration % self.checkpointer.periods == 0:
+            self.checkpoint()
+        self.log_state_memory()
+        log.info("Analysis: %s done", iteration)
+        return detections
+
+    def run_analysis(self) -> None:
+        """
+        Runs the analysis every ANALYSIS_PERIOD seconds.
+        The periods are scheduled on a fixed cadence, i.e. the time the analysis takes
+        does not delay the following periods.
         :return:
         :rtype:
         """
-        req_dict = self.req_dict
         iteration = 0
+        next_run = time.monotonic()
         while True:
             iteration += 1
-            log.info(f"running analysis: {iteration}")
-            # use copy here since during execution new packets are being collected
-            dest_dict = self.dest_dict.copy()
-            src_dict = self.src_dict.copy()
-            for dest_ip, src_ips in dest_dict.items():
-                detected, detection_case, ratio = self.attack_analysis.run_analysis(
-                    "",
-                    dest_ip,
-                    src_dict,
-                    dest_dict,
-                    dest_dict_aggregated=self.dest_dict_aggregated,
+            next_run += ANALYSIS_PERIOD
+            self.analyse_period(iteration)
+            delay = next_run - time.monotonic()
+            if delay < 0:
+                # analysis took longer than a period, continue with the next one from now on
+                log.warning(
+                    "Analysis: %s overran the period by %.3fs", iteration, -delay
                 )
-                if not detected:
-                    continue
-                num_packets_for_this_destination = sum(dest_dict[dest_ip].values())
-                # pick topic based on threshold. i.e. probable vs highly certain of attack
-                # checks are simple here, to improve performance.
-                topic = TOPIC_LOW
-                if num_packets_for_this_destination > THRESHOLD_VICTIM_HI:
-                    topic = TOPIC_HIGH
-                publish_topics = [topic]
-                # if this env is true, will skip 'default' topics! and send to each additional one
-                if TOPICS_USE_ADDITIONAL:
-                    publish_topics = TOPICS
-                potential_attacker_ips = list(dest_dict[dest_ip])
-
-                # split list into more manageable list of MSG_LENGTH
-                splitted_potential_attacker_ips = [
-                    potential_attacker_ips[x : x + MSG_LENGTH]
-                    for x in range(0, len(potential_attacker_ips), MSG_LENGTH)
-                ]
-                for e in splitted_potential_attacker_ips:
-                    request = DefenseCollaborationRequestData(
-                        potential_attacker_ips=e,
-                        potential_victim=dest_ip,
-                        request_detection=detection_case,
-                        requests_relative_to_size=ratio / AS_SIZE,
-                    )
-                    for top in publish_topics:
-                        topic = top + ".REQ"
-                        self.producer.send(
-                            topic=topic,
-                            value=request.to_json(),  # type: ignore
-                            key=str.encode(request.request_id),
-                        )
-                        log.info(
-                            f"{AS_NAME} sending collab request - {topic} - with id: {request.request_id} for victim {request.potential_victim}"
-                        )
+                self.sampling.observe(lag=-delay)
+                next_run = time.monotonic()
+                continue
+            time.sleep(delay)
 
-                    req_dict[str(request.request_id)] = request
-                    # go directly to analysis, do not need to go through kafka
-                    self.handle_collab_req(
-                        def_collab_req=request, topics=publish_topics
-                    )
+    def checkpoint(self, wait: bool = False) -> None:
+        """
+        Writes a snapshot of the epoch state and the reputations in the background.
+        Has to be called after a reset, the tables of the previous period are not changed until the next one.
+
+        :param wait: whether to wait until the snapshot is written
+        :type wait: bool
+        :return: None
+        """
+        if self.checkpointer is None:
+            return
+        self.checkpointer.submit(
+            self.state.src_dict_tm1,
+            self.state.dest_dict_aggregated,
+            list(self.state.reputation_dict.items_with_age()),
+            self.sampling.previous_rate,
+            wait=wait,
+        )
+
+    def restore_checkpoint(self) -> bool:
+        """
+        Restores the latest snapshot, such that the comparisons with the previous period
+        and the reputations are available right after a restart.
+        The epoch state of snapshots older than CHECKPOINT_MAX_AGE is not restored.
+
+        :return: whether a snapshot has been restored
+        :rtype: bool
+        """
+        if self.checkpointer is None:
+            return False
+        snapshot = self.checkpointer.load_latest()
+        if snapshot is None:
+            return False
+        age = max(0.0, self.checkpointer.clock() - snapshot.created)
+        if age <= self.checkpointer.max_age:
+            self.state.src_dict_tm1 = snapshot.src_dict_tm1
+            self.state.dest_dict_aggregated = snapshot.dest_dict_aggregated
+            self.sampling.previous_rate = snapshot.sampling_rate
+        reputation_dict = self.state.reputation_dict
+        for as_name, reputation, reputation_age in snapshot.reputation:
+            if reputation_age + age <= reputation_dict.ttl:
+                reputation_dict.put(
+                    as_name, reputation, owner=as_name, age=reputation_age + age
+                )
+        log.info(
+            "restored snapshot of %.1fs ago: %s sources, %s destinations, %s reputations%s",
+            age,
+            len(snapshot.src_dict_tm1),
+            len(snapshot.dest_dict_aggregated),
+            len(reputation_dict),
+            "" if age <= self.checkpointer.max_age else " (epoch state too old)",
+        )
+        return True
 
-                    log.info(f"{len(request.potential_attacker_ips)}")
-                # light mitigation
-                self.mitigation.filter_ips(potential_attacker_ips)
-            self.dest_dict_aggregated = self.create_aggregate(self.dest_dict.copy())
-            self.reset_data()
-            time.sleep(ANALYSIS_PERIOD)
-            log.info(f"Analysis: {iteration} done")
+    def observe_backlog(self) -> None:
+        """
+        Reports the packets waiting in the queue to the sampling controller.
+        :return: None
+        """
+        try:
+            backlog = self.queue.qsize()
+        except NotImplementedError:
+            # multiprocessing queues have no size on macOS
+            return
+        self.sampling.observe(backlog=backlog)
 
     def create_aggregate(self, dest_dict):
         dest_dict_aggregated = {}
@@ -228,37 +899,83 @@ class CH2TF:
 
     def reset_data(self):
         try:
-            self.src_dict_tm1 = copy.deepcopy(dict(self.src_dict))
-            self.src_dict.clear()
-            self.dest_dict.clear()
+            self.state.reset_period()
+            self._partitions.clear()
+            self.campaigns.end_period()
+            self.campaign_verdicts.end_period()
+            self.verdict_cache.rollover()
+            # forget alarms that are not debounced anymore
+            now = self.clock()
+            self.alarm_dict = {
+                victim: last_alarm
+                for victim, last_alarm in self.alarm_dict.items()
+                if now - last_alarm < STREAMING_DEBOUNCE
+            }
             log.info("resetted!")
         except Exception as e:
-            log.error(f"resetting failed!")
-            log.error(e)
-
-    def listen(self) -> None:
-        """
-        listens as a consumer to the topics and delegates according to topic
-        :return:
-        """
+            log.error("resetting failed: %s", e)
 
-        log.info("listening")
-        consumer = KafkaConsumer(
+    @staticmethod
+    def _create_kafka_consumer() -> KafkaConsumer:
+        return KafkaConsumer(
             bootstrap_servers=[KAFKA],
             api_version=(0, 10, 0),
             value_deserializer=json_deserializer,
             auto_offset_reset="latest",
-            enable_auto_commit=False,
+            # workers of the same AS split the partitions of the topics,
+            # the offsets are committed such that a worker continues where the previous owner stopped
+            group_id=CONSUMER_GROUP or None,
+            enable_auto_commit=bool(CONSUMER_GROUP),
         )
 
-        topics = self._init_consumer_topics(TOPICS, [TOPIC_HIGH, TOPIC_LOW])
-        consumer.subscribe(topics)
+    def subscribe(self) -> KafkaConsumer:
+        """
+        Creates a consumer that is subscribed to the request and response topics.
+        :return: subscribed consumer
+        :rtype: KafkaConsumer
+        """
+        consumer = self.consumer_factory()
+        standard = [TOPIC_HIGH, TOPIC_LOW]
+        topics = self._init_consumer_topics(TOPICS, standard)
+        if DIGEST_ROUTING:
+            # requests routed by digest are sent to the topics of this AS
+            topics += self._init_consumer_topics(
+                [f"{top}.{self.as_name}" for top in TOPICS + standard], []
+            )
+            topics.append(DIGEST_TOPIC)
+        consumer.subscribe(topics, listener=ShardRebalanceListener(self))
         log.info(consumer.topics())
+        if DIGEST_ROUTING:
+            self.publish_digest()
+        return consumer
+
+    def listen(self) -> None:
+        """
+        listens as a consumer to the topics and delegates according to topic
+        :return:
+        """
+
+        log.info("listening")
+        consumer = self.subscribe()
 
         message: ConsumerRecord
         for message in consumer:
-            topic = message.topic
-            if "REQ" in topic:
+            self.dispatch(message)
+            self.send_early_alarms()
+
+    def dispatch(self, message: ConsumerRecord) -> None:
+        """
+        Delegates a received message according to its topic.
+        :param message: pubsub message
+        :type message: ConsumerRecord
+        :return: None
+        """
+        topic = message.topic
+        self.metrics.messages_received(topic).inc()
+        try:
+            if topic == DIGEST_TOPIC:
+                self.handle_digest(message)
+            elif "REQ" in topic:
                 if TOPIC_HIGH in topic:
                     self.handle_collab_req(message, high_prio=True, topic=topic)
                 else:
@@ -266,7 +983,43 @@ class CH2TF:
                     self.handle_collab_req(message, topic=topic)
             elif "RES" in topic:
                 self.handle_collab_res(message, topic=topic)
+        except Exception:
+            self.metrics.receive_errors(topic).inc()
+            raise
+
+    @stopwatch("publishing")
+    def _send(
+        self, topic: str, value: Any, key: str, partition: int | None = None
+    ) -> None:
+        """
+        Publishes a message and counts it (and its failure) for the topic.
+        :param topic: topic to publish to
+        :type topic: str
+        :param value: message
+        :type value: Any
+        :param key: key of the message
+        :type key: str
+        :param partition: partition of the topic, chosen by the producer if None
+        :type partition: int | None
+        :return: None
+        """
+        errors = self.metrics.send_errors(topic)
+        try:
+            future = (
+                self.producer.send(topic=topic, value=value, key=str.encode(key))
+                if partition is None
+                else self.producer.send(
+                    topic=topic, value=value, key=str.encode(key), partition=partition
+                )
+            )
+        except Exception:
+            errors.inc()
+            raise
+        self.metrics.messages_sent(topic).inc()
+        future.add_errback(lambda _: errors.inc())
 
+    @timed("collab_request_duration")
+    @stopwatch("request_handling")
     def handle_collab_req(
         self,
         message: ConsumerRecord = None,
@@ -294,10 +1047,10 @@ class CH2TF:
         """
         topic = topic.replace(".REQ", "")
 
-        dest_dict = copy.deepcopy(self.dest_dict.copy())
-        src_dict = copy.deepcopy(self.src_dict.copy())
-        src_dict_tm1 = copy.deepcopy(self.src_dict_tm1.copy())
-        req_dict = self.req_dict
+        dest_dict = copy.deepcopy(self.state.dest_dict.copy())
+        src_dict = copy.deepcopy(self.state.src_dict.copy())
+        src_dict_tm1 = copy.deepcopy(self.state.src_dict_tm1.copy())
+        req_dict = self.state.req_dict
         def_collab_req = (
             DefenseCollaborationRequestData.from_json(message.value)  # type: ignore
             if message
@@ -305,21 +1058,26 @@ class CH2TF:
         )
 
         # ignore own request that receives through kafka consumer
-        if def_collab_req.request_originator == AS_NAME and message is not None:
+        if def_collab_req.request_originator == self.as_name and message is not None:
             return
 
         log.info(
-            f"{AS_NAME}: handle request from {def_collab_req.request_originator} "
-            f"with id: {def_collab_req.request_id} for victim {def_collab_req.potential_victim} "
-            f"with topic(s) {topic or topics}"
+            "%s: handle request from %s with id: %s for victim %s with topic(s) %s",
+            self.as_name,
+            def_collab_req.request_originator,
+            def_collab_req.request_id,
+            def_collab_req.potential_victim,
+            topic or topics,
         )
 
-        req_dict[str(def_collab_req.request_id)] = def_collab_req
-
         # in the case that reputation of the originator is OK (> 0.5)
         # and it has been sent with high priority (= 2nd topic)
         # then some mitigation (not part of this work) will already be put in place
-        if high_prio and self.reputation_dict[def_collab_req.request_originator] > 0.5:
+        if (
+            high_prio
+            and self.state.reputation_dict.get(def_collab_req.request_originator, 1.0)
+            > 0.5
+        ):
             self.mitigation.filter_ips(def_collab_req.potential_attacker_ips)
 
         # note: if is_larger_than_own_threshold is true,
@@ -340,35 +1098,99 @@ class CH2TF:
 
         highest_amount_of_pkts_sent_from_this_src = -9999999
 
+        # own requests have already been stored when sending,
+        # the attackers of requests that this AS does not acknowledge are not kept
+        if str(def_collab_req.request_id) not in req_dict:
+            req_dict.put(
+                str(def_collab_req.request_id),
+                StoredRequest.from_request(
+                    def_collab_req,
+                    None if is_larger_than_own_threshold else AttackerRef(()),
+                ),
+                owner=def_collab_req.request_originator,
+            )
+
         if not is_larger_than_own_threshold:
             decision = DecisionEnum.NOT_ACK
             def_collab_req.potential_attacker_ips = []
         else:
             highest_amount_of_pkts_sent_from_this_src = 0
+            # verdicts of previous requests in the same campaign, only ips that may have changed are re-evaluated
+            campaign_verdicts = (
+                self.campaign_verdicts.get_campaign(def_collab_req.campaign_id)
+                if def_collab_req.campaign_id
+                else {}
+            )
+            victim = def_collab_req.potential_victim
+            prefix_index = None
             for potential_attacker in def_collab_req.potential_attacker_ips:
-                # check if ip of a potential attacker is managed by this AS. if not, nothing is done.
-                if self.check_if_is_managed(potential_attacker):
-                    highest_amount_of_pkts_sent_from_this_src = max(
-                        highest_amount_of_pkts_sent_from_this_src,
-                        src_dict_tm1.get(potential_attacker, {}).get(
-                            def_collab_req.potential_victim, 0
-                        ),
-                        src_dict.get(potential_attacker, {}).get(
-                            def_collab_req.potential_victim, 0
-                        ),
-                    )
-                    if self.attacker_analysis.run_analysis(
-                        potential_attacker,
-                        def_collab_req.potential_victim,
+                if is_prefix(potential_attacker):
+                    # prefixes are analysed by their managed sources, the sources are acknowledged
+                    if prefix_index is None:
+                        prefix_index = PrefixIndex(
+                            set(src_dict) | set(src_dict_tm1),
+                            filter(
+                                None,
+                                map(
+                                    parse_prefix, def_collab_req.potential_attacker_ips
+                                ),
+                            ),
+                        )
+                    key = parse_prefix(potential_attacker)
+                    members = prefix_index.members(key) if key is not None else []
+                    if not members:
+                        list_not_managed.append(potential_attacker)
+                        continue
+                    found = self.attacker_analysis.run_prefix_analysis(
+                        members,
+                        victim,
                         src_dict,
                         dest_dict,
                         src_dict_tm1=src_dict_tm1,
-                    ):
-                        list_ack_attacker.append(potential_attacker)
+                        sampling_rate=self.sampling.rate,
+                        sampling_rate_tm1=self.sampling.previous_rate,
+                    )
+                    if found:
+                        list_ack_attacker.extend(found)
                     else:
                         list_not_attacker.append(potential_attacker)
-                else:
-                    list_not_managed.append(potential_attacker)
+                    continue
+                verdict = campaign_verdicts.get(
+                    potential_attacker
+                ) or self.verdict_cache.get(potential_attacker, victim)
+                if verdict is None:
+                    # check if ip of a potential attacker is managed by this AS. if not, nothing is done.
+                    if self.check_if_is_managed(potential_attacker):
+                        highest_amount_of_pkts_sent_from_this_src = max(
+                            highest_amount_of_pkts_sent_from_this_src,
+                            src_dict_tm1.get(potential_attacker, {}).get(victim, 0),
+                            src_dict.get(potential_attacker, {}).get(victim, 0),
+                        )
+                        verdict = (
+                            DecisionEnum.FOUND
+                            if self.attacker_analysis.run_analysis(
+                                potential_attacker,
+                                victim,
+                                src_dict,
+                                dest_dict,
+                                src_dict_tm1=src_dict_tm1,
+                                sampling_rate=self.sampling.rate,
+                                sampling_rate_tm1=self.sampling.previous_rate,
+                            )
+                            else DecisionEnum.UNDER_THRS
+                        )
+                    else:
+                        verdict = DecisionEnum.NOT_MANAGED
+                    self.verdict_cache.put(potential_attacker, victim, verdict)
+                match verdict:
+                    case DecisionEnum.FOUND:
+                        list_ack_attacker.append(potential_attacker)
+                        campaign_verdicts[potential_attacker] = verdict
+                    case DecisionEnum.NOT_MANAGED:
+                        list_not_managed.append(potential_attacker)
+                        campaign_verdicts[potential_attacker] = verdict
+                    case _:
+                        list_not_attacker.append(potential_attacker)
             decision = (
                 DecisionEnum.UNDER_THRS
                 if len(list_ack_attacker) == 0
@@ -385,32 +1207,55 @@ class CH2TF:
                 ack_potential_attacker_ips=list_ack_attacker,
                 decision=decision,
                 request_originator=def_collab_req.request_originator,
-                as_name=os.getenv("AS_NAME", default=""),
+                as_name=self.as_name,
             )
         )
 
+        if self.exporter is not None:
+            self.exporter.record_request(
+                def_collab_req,
+                "handled",
+                decision.name,
+                len(list_ack_attacker),
+                len(list_not_managed),
+            )
+        # one summary per request instead of a line per attacker
         log.info(
-            f"Highest amount of pckts from a single src to this victim: {highest_amount_of_pkts_sent_from_this_src}"
+            "request %s - decision: %s - NOT managed: %s, managed, but not attacking: %s, "
+            "managed, and ack attacking: %s - highest amount of pckts from a single src to this victim: %s"
+            " - cases: %s",
+            def_collab_req.request_id,
+            decision,
+            len(list_not_managed),
+            len(list_not_attacker),
+            len(list_ack_attacker),
+            highest_amount_of_pkts_sent_from_this_src,
+            self.attacker_analysis.pop_case_counts(),
         )
-        log.info(f"decision: {decision}")
-        log.info(f"NOT managed: {len(list_not_managed)}")
-        log.info(f"Managed, but not attacking: {len(list_not_attacker)}")
-        log.info(f"Managed, and ack attacking: {len(list_ack_attacker)}")
 
         if topics is None:  # if message received through kafka topics is None
             topics = [topic]
+            base_topic, _, receiver = topic.rpartition(".")
+            if DIGEST_ROUTING and receiver == self.as_name:
+                # requests routed by digest are answered on the topic of the originator
+                topics = [f"{base_topic}.{def_collab_req.request_originator}"]
         for topic in topics:
             topic = topic + ".RES"
             log.info(
-                f"{def_collab_res.as_name} sending collab response - {topic} with id: {def_collab_res.request_id}"
+                "%s sending collab response - %s with id: %s",
+                def_collab_res.as_name,
+                topic,
+                def_collab_res.request_id,
             )
-            self.producer.send(
-                topic=topic,
-                value=def_collab_res.to_json(),  # type: ignore
-                key=str.encode(def_collab_res.request_id),
+            self._send(
+                topic,
+                def_collab_res.to_json(),
+                def_collab_res.request_id,
+                self._partition_of(def_collab_req.potential_victim),
             )
         self.mitigation.filter_ips(def_collab_res.ack_potential_attacker_ips)
 
+    @stopwatch("response_handling")
     def handle_collab_res(self, message, topic):
         """
         Handling of collaboration response
@@ -423,17 +1268,26 @@ class CH2TF:
         :rtype: None
         """
         topic = topic.replace(".RES", "")
-        responses: defaultdict = self.responses
+        responses: BoundedStore = self.state.responses
 
         collab_response: DefenseCollaborationResponseData = (
             DefenseCollaborationResponseData.from_json(message.value)
         )
-        responses[collab_response.request_id][collab_response.as_name] = collab_response
+        responses.put(
+            (collab_response.request_id, collab_response.as_name),
+            collab_response,
+            owner=collab_response.as_name,
+        )
         given_decision: DecisionEnum = collab_response.decision
+        if self.exporter is not None:
+            self.exporter.record_response(collab_response)
 
         log.info(
-            f"handle response with id: {collab_response.request_id} from {collab_response.as_name}"
-            f" with topic {topic} - decision: {given_decision}"
+            "handle response with id: %s from %s with topic %s - decision: %s",
+            collab_response.request_id,
+            collab_response.as_name,
+            topic,
+            given_decision,
         )
 
         match given_decision:
@@ -441,15 +1295,13 @@ class CH2TF:
                 log.info("Found Attackers")
                 # mitigation starts here, but not part of this work
                 self.mitigation.filter_ips(collab_response.ack_potential_attacker_ips)
-                if collab_response.request_originator == AS_NAME:
-                    self.reputation_dict[collab_response.as_name] += 0.1
-                self.heavy_hitter_table = add_to_bloom_filter(
-                    self.heavy_hitter_table, collab_response.ack_potential_attacker_ips
-                )
+                if collab_response.request_originator == self.as_name:
+                    self._update_reputation(collab_response.as_name, 0.1)
+                    self._confirm_attackers(collab_response)
             case DecisionEnum.NOT_ACK:
                 # in the case that it originates from this AS, build reputation scheme
-                if collab_response.request_originator == AS_NAME:
-                    self.reputation_dict[collab_response.as_name] -= 0.1
+                if collab_response.request_originator == self.as_name:
+                    self._update_reputation(collab_response.as_name, -0.1)
 
                 # note: future work could include dynamic thresholds that are adjusted accordingly based on the replies
                 # such that each AS keeps track of the thresholds from the other and adjusts them if they are not ACK
@@ -462,6 +1314,60 @@ class CH2TF:
             case _:
                 pass
 
+    def _confirm_attackers(
+        self, collab_response: DefenseCollaborationResponseData
+    ) -> None:
+        """
+        Keeps the packets of the attackers acknowledged for an own request out of the traffic tables (fast path).
+        Only if the mitigation blocks them, otherwise the attackers would neither be blocked nor analysed anymore,
+        and only if the responding AS has a reputation above ATTACKER_MIN_REPUTATION.
+
+        :param collab_response: FOUND response to a request of this AS
+        :type collab_response: DefenseCollaborationResponseData
+        :return: None
+        """
+        if not ATTACKER_FAST_PATH or not self.mitigation.active:
+            return
+        reputation = self.state.reputation_dict.get(collab_response.as_name, 1.0)
+        if reputation <= ATTACKER_MIN_REPUTATION:
+            log.info(
+                "attackers of %s are not confirmed, reputation: %s",
+                collab_response.as_name,
+                reputation,
+            )
+            return
+        request = self.state.req_dict.get(str(collab_response.request_id))
+        if request is None:
+            return
+        self.attackers.add(
+            collab_response.ack_potential_attacker_ips, request.potential_victim
+        )
+
+    def _update_reputation(self, as_name: str, delta: float) -> None:
+        reputation = self.state.reputation_dict.get(as_name, 1.0) + delta
+        self.state.reputation_dict.put(as_name, reputation, owner=as_name)
+
+    def log_state_memory(self) -> None:
+        """
+        Logs the size and approximated memory of the collaboration state and updates the memory metrics.
+        :return: None
+        """
+        for name, store in (
+            ("requests", self.state.req_dict),
+            ("responses", self.state.responses),
+            ("reputation", self.state.reputation_dict),
+        ):
+            store.evict_expired()
+            memory = store.memory_usage()
+            self.metrics.memory(name).set(memory)
+            log.info(
+                "state %s: %s entries, %s bytes, evictions: %s",
+                name,
+                len(store),
+                memory,
+                dict(store.evictions),
+            )
+
     def _is_larger_than_own_threshold(
         self, def_collab_req: DefenseCollaborationRequestData
     ) -> bool:
@@ -0,0 +1,454 @@
+import logging
+import mmap
+import os
+import struct
+import time
+from collections import Counter
+from collections.abc import Mapping
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from src.config import (
+    CHECKPOINT_DIR,
+    CHECKPOINT_PERIODS,
+    CHECKPOINT_KEEP,
+    CHECKPOINT_MAX_AGE,
+)
+
+log = logging.getLogger("checkpoint")
+
+MAGIC = b"CH2TFCKP"
+VERSION = 1
+SUFFIX = ".ckpt"
+# magic, version, number of arrays, wall clock time of the snapshot, sampling rate of src_dict_tm1
+_HEADER = struct.Struct("<8sIIdd")
+# name, dtype, offset, number of elements
+_ENTRY = struct.Struct("<16s8sQQ")
+# arrays start at multiples of the alignment, such that they can be mapped without copies
+_ALIGNMENT = 64
+
+
+def _key_array(keys: List[str]) -> np.ndarray:
+    # fixed-width byte strings, numpy strips the padding again on access
+    return np.array(keys, dtype=bytes) if keys else np.empty(0, dtype="S1")
+
+
+def _search(keys: np.ndarray, key: object) -> int:
+    """
+    :param keys: sorted fixed-width keys
+    :type keys: np.ndarray
+    :param key: key to look up
+    :type key: object
+    :return: index of the key, -1 if it is not contained
+    :rtype: int
+    """
+    if not isinstance(key, str):
+        return -1
+    encoded = key.encode()
+    # longer keys would be truncated by the search
+    if len(encoded) > keys.dtype.itemsize:
+        return -1
+    i = int(np.searchsorted(keys, encoded))
+    if i < len(keys) and keys[i] == encoded:
+        return i
+    return -1
+
+
+class MappedTable(Mapping):
+    """
+    Read-only source -> destination -> packets table, backed by the arrays of a snapshot (CSR layout):
+    the sources are sorted, the destinations of source i are columns[indptr[i]:indptr[i + 1]]
+    (indices into the sorted destinations) with their packets in values.
+    Lookups are binary searches, only the rows that are looked up are turned into Counters.
+    """
+
+    def __init__(
+        self,
+        keys: np.ndarray,
+        indptr: np.ndarray,
+        columns: np.ndarray,
+        values: np.ndarray,
+        column_keys: np.ndarray,
+    ):
+        self._keys = keys
+        self._indptr = indptr
+        self._columns = columns
+        self._values = values
+        self._column_keys = column_keys
+
+    def __getitem__(self, key: str) -> Counter:
+        i = _search(self._keys, key)
+        if i < 0:
+            raise KeyError(key)
+        start, stop = self._indptr[i], self._indptr[i + 1]
+        return Counter(
+            dict(
+                zip(
+                    self._column_keys[self._columns[start:stop]].astype(str).tolist(),
+                    self._values[start:stop].tolist(),
+                )
+            )
+        )
+
+    def __contains__(self, key: object) -> bool:
+        return _search(self._keys, key) >= 0
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._keys.astype(str).tolist())
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    # the table is immutable, copies are not needed
+    def copy(self) -> "MappedTable":
+        return self
+
+    def __deepcopy__(self, memo: dict) -> "MappedTable":
+        return self
+
+    @property
+    def nbytes(self) -> int:
+        return sum(
+            a.nbytes
+            for a in (
+                self._keys,
+                self._indptr,
+                self._columns,
+                self._values,
+                self._column_keys,
+            )
+        )
+
+
+class MappedCounts(Mapping):
+    """
+    Read-only key -> number mapping, backed by sorted keys and their values.
+    """
+
+    def __init__(self, keys: np.ndarray, values: np.ndarray):
+        self._keys = keys
+        self._values = values
+
+    def __getitem__(self, key: str) -> float:
+        i = _search(self._keys, key)
+        if i < 0:
+            raise KeyError(key)
+        return self._values[i].item()
+
+    def __contains__(self, key: object) -> bool:
+        return _search(self._keys, key) >= 0
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._keys.astype(str).tolist())
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def copy(self) -> "MappedCounts":
+        return self
+
+    def __deepcopy__(self, memo: dict) -> "MappedCounts":
+        return self
+
+
+def _table_arrays(table: Mapping) -> Dict[str, np.ndarray]:
+    """
+    :param table: source -> destination -> packets
+    :type table: Mapping
+    :return: the table in CSR layout with sorted sources and destinations
+    :rtype: Dict[str, np.ndarray]
+    """
+    srcs = list(table)
+    rows = [table[src] for src in srcs]
+    lengths = np.fromiter((len(row) for row in rows), dtype=np.int64, count=len(rows))
+    total = int(lengths.sum())
+    values = np.fromiter(
+        (n for row in rows for n in row.values()), dtype=np.uint32, count=total
+    )
+    dsts = _key_array([dst for row in rows for dst in row])
+    column_keys, columns = np.unique(dsts, return_inverse=True)
+    columns = columns.astype(np.int32)
+
+    # rows in the order of the sorted sources
+    keys = _key_array(srcs)
+    order = np.argsort(keys, kind="stable")
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1])) if len(rows) else lengths
+    lengths = lengths[order]
+    indptr = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+    gather = np.repeat(starts[order] - indptr[:-1], lengths) + np.arange(total)
+    return {
+        "src_keys": keys[order],
+        "src_indptr": indptr,
+        "src_columns": columns[gather],
+        "src_values": values[gather],
+        "dst_keys": column_keys,
+    }
+
+
+def _counts_arrays(prefix: str, counts: Mapping) -> Dict[str, np.ndarray]:
+    keys = _key_array(list(counts))
+    values = np.fromiter(counts.values(), dtype=np.float64, count=len(keys))
+    order = np.argsort(keys, kind="stable")
+    return {f"{prefix}_keys": keys[order], f"{prefix}_values": values[order]}
+
+
+def write_snapshot(
+    path: str,
+    src_dict_tm1: Mapping,
+    dest_dict_aggregated: Mapping,
+    reputation: List[Tuple[str, float, float]],
+    sampling_rate: float = 1.0,
+    created: float | None = None,
+) -> int:
+    """
+    Writes a snapshot atomically, i.e. readers see either the previous or the complete file.
+
+    :param path: file of the snapshot
+    :type path: str
+    :param src_dict_tm1: source -> destination -> packets of the previous period
+    :type src_dict_tm1: Mapping
+    :param dest_dict_aggregated: destination -> packets of the previous period
+    :type dest_dict_aggregated: Mapping
+    :param reputation: (AS name, reputation, age in seconds), oldest first
+    :type reputation: List[Tuple[str, float, float]]
+    :param sampling_rate: rate the packets of src_dict_tm1 were sampled with
+    :type sampling_rate: float
+    :param created: wall clock time of the snapshot, now by default
+    :type created: float | None
+    :return: size of the file in bytes
+    :rtype: int
+    """
+    arrays = _table_arrays(src_dict_tm1)
+    arrays.update(_counts_arrays("agg", dest_dict_aggregated))
+    arrays["rep_keys"] = _key_array([as_name for as_name, _, _ in reputation])
+    arrays["rep_values"] = np.array([r for _, r, _ in reputation], dtype=np.float64)
+    arrays["rep_ages"] = np.array([age for _, _, age in reputation], dtype=np.float64)
+
+    offset = _HEADER.size + _ENTRY.size * len(arrays)
+    entries = []
+    for name, array in arrays.items():
+        offset += -offset % _ALIGNMENT
+        entries.append((name, array, offset))
+        offset += array.nbytes
+
+    tmp = f"{path}.tmp"
+    with open(tmp, mode="wb") as f:
+        f.write(
+            _HEADER.pack(
+                MAGIC,
+                VERSION,
+                len(arrays),
+                time.time() if created is None else created,
+                sampling_rate,
+            )
+        )
+        for name, array, offset in entries:
+            f.write(
+                _ENTRY.pack(name.encode(), array.dtype.str.encode(), offset, len(array))
+            )
+        for _, array, offset in entries:
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+        size = f.tell()
+    os.replace(tmp, path)
+    return size
+
+
+@dataclass
+class Snapshot:
+    src_dict_tm1: MappedTable
+    dest_dict_aggregated: MappedCounts
+    # (AS name, reputation, age in seconds at the time of the snapshot)
+    reputation: List[Tuple[str, float, float]]
+    sampling_rate: float
+    # wall clock time of the snapshot
+    created: float
+
+
+def read_snapshot(path: str) -> Snapshot:
+    """
+    Maps a snapshot into memory, the tables are read lazily from the mapped file.
+
+    :param path: file of the snapshot
+    :type path: str
+    :return: the snapshot
+    :rtype: Snapshot
+    """
+    with open(path, mode="rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, num_arrays, created, sampling_rate = _HEADER.unpack_from(buffer)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is no snapshot of version {VERSION}")
+    arrays = {}
+    for i in range(num_arrays):
+        name, dtype, offset, count = _ENTRY.unpack_from(
+            buffer, _HEADER.size + i * _ENTRY.size
+        )
+        # the arrays reference the mapping, it is closed when they are gone
+        arrays[name.rstrip(b"\0").decode()] = np.frombuffer(
+            buffer,
+            dtype=np.dtype(dtype.rstrip(b"\0").decode()),
+            count=count,
+            offset=offset,
+        )
+    return Snapshot(
+        src_dict_tm1=MappedTable(
+            arrays["src_keys"],
+            arrays["src_indptr"],
+            arrays["src_columns"],
+            arrays["src_values"],
+            arrays["dst_keys"],
+        ),
+        dest_dict_aggregated=MappedCounts(arrays["agg_keys"], arrays["agg_values"]),
+        reputation=list(
+            zip(
+                arrays["rep_keys"].astype(str).tolist(),
+                arrays["rep_values"].tolist(),
+                arrays["rep_ages"].tolist(),
+            )
+        ),
+        sampling_rate=sampling_rate,
+        created=created,
+    )
+
+
+class Checkpointer:
+    """
+    Writes snapshots of the epoch state (src_dict_tm1, dest_dict_aggregated) and of the reputations
+    in a background thread and restores the latest one on startup.
+    The epoch tables are replaced, not changed, at the end of each period,
+    i.e. they are written while the packets of the next period are aggregated, without copies.
+    """
+
+    def __init__(
+        self,
+        directory: str = CHECKPOINT_DIR,
+        periods: int = CHECKPOINT_PERIODS,
+        keep: int = CHECKPOINT_KEEP,
+        max_age: float = CHECKPOINT_MAX_AGE,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        :param directory: directory of the snapshots
+        :type directory: str
+        :param periods: analysis periods between two snapshots
+        :type periods: int
+        :param keep: number of snapshots that are kept
+        :type keep: int
+        :param max_age: seconds after which the epoch state of a snapshot is not restored anymore
+        :type max_age: float
+        :param clock: returns the wall clock time in seconds
+        :type clock: Callable[[], float]
+        """
+        self.directory = directory
+        self.periods = periods
+        self.keep = keep
+        self.max_age = max_age
+        self.clock = clock
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="checkpoint")
+        self._pending: Future | None = None
+        self._sequence = 0
+
+    def snapshots(self) -> List[str]:
+        """
+        :return: paths of the snapshots, newest first
+        :rtype: List[str]
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        names = sorted(
+            (name for name in os.listdir(self.directory) if name.endswith(SUFFIX)),
+            reverse=True,
+        )
+        return [os.path.join(self.directory, name) for name in names]
+
+    def submit(
+        self,
+        src_dict_tm1: Mapping,
+        dest_dict_aggregated: Mapping,
+        reputation: List[Tuple[str, float, float]],
+        sampling_rate: float,
+        wait: bool = False,
+    ) -> Future | None:
+        """
+        Writes a snapshot in the background, skipped if the previous one is still being written.
+
+        :param src_dict_tm1: source -> destination -> packets of the previous period, not changed afterwards
+        :type src_dict_tm1: Mapping
+        :param dest_dict_aggregated: destination -> packets of the previous period, not changed afterwards
+        :type dest_dict_aggregated: Mapping
+        :param reputation: (AS name, reputation, age in seconds), oldest first
+        :type reputation: List[Tuple[str, float, float]]
+        :param sampling_rate: rate the packets of src_dict_tm1 were sampled with
+        :type sampling_rate: float
+        :param wait: whether to wait until the snapshot is written
+        :type wait: bool
+        :return: the write, None if it was skipped
+        :rtype: Future | None
+        """
+        if self._pending is not None and not self._pending.done():
+            if not wait:
+                log.warning("previous snapshot is still being written, skipped")
+                return None
+            self._pending.result()
+        created = self.clock()
+        # named by time, such that the newest snapshot sorts first
+        self._sequence += 1
+        path = os.path.join(
+            self.directory, f"{int(created * 1e6):020d}-{self._sequence:08d}{SUFFIX}"
+        )
+        self._pending = self._executor.submit(
+            self._write,
+            path,
+            src_dict_tm1,
+            dest_dict_aggregated,
+            reputation,
+            sampling_rate,
+            created,
+        )
+        if wait:
+            self._pending.result()
+        return self._pending
+
+    def _write(self, path: str, *args) -> None:
+        start = time.perf_counter()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            size = write_snapshot(path, *args)
+        except Exception:
+            log.exception("writing snapshot %s failed", path)
+            raise
+        log.info(
+            "snapshot %s written: %s bytes in %.3fs",
+            path,
+            size,
+            time.perf_counter() - start,
+        )
+        for old in self.snapshots()[self.keep :]:
+            try:
+                os.remove(old)
+            except OSError as e:
+                log.warning("removing snapshot %s failed: %s", old, e)
+
+    def load_latest(self) -> Snapshot | None:
+        """
+        :return: the latest readable snapshot, None if there is none
+        :rtype: Snapshot | None
+        """
+        for path in self.snapshots():
+            try:
+                snapshot = read_snapshot(path)
+            except (OSError, ValueError, KeyError, struct.error) as e:
+                log.warning("snapshot %s is not readable: %s", path, e)
+                continue
+            log.info("snapshot %s loaded", path)
+            return snapshot
+        return None
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,146 @@
+import base64
+import io
+import logging
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+import pybloom_live
+
+from src.config import DIGEST_TTL
+from src.util import init_bloom_filter, add_to_bloom_filter
+from .hhh import is_prefix
+
+log = logging.getLogger("ch2tf")
+
+
+def encode_bloom_filter(managed_ips: Any) -> str:
+    """
+    Serializes the managed ips as a compressed bloom filter.
+
+    :param managed_ips: bloom filter of the managed ips or another collection of them
+    :type managed_ips: Any
+    :return: base64 of the compressed bloom filter
+    :rtype: str
+    """
+    bloom_filter = managed_ips
+    if not isinstance(bloom_filter, pybloom_live.BloomFilter):
+        bloom_filter = add_to_bloom_filter(
+            init_bloom_filter(max(len(managed_ips), 1) * 2), managed_ips
+        )
+    f = io.BytesIO()
+    bloom_filter.tofile(f)
+    return base64.b64encode(zlib.compress(f.getvalue())).decode("ascii")
+
+
+def decode_bloom_filter(encoded: str) -> pybloom_live.BloomFilter:
+    """
+    :param encoded: bloom filter serialized by encode_bloom_filter
+    :type encoded: str
+    :return: the bloom filter
+    :rtype: pybloom_live.BloomFilter
+    """
+    return pybloom_live.BloomFilter.fromfile(
+        io.BytesIO(zlib.decompress(base64.b64decode(encoded)))
+    )
+
+
+class DigestTable:
+    """
+    Digests of the managed address space of the other ASes, used to send each AS only the
+    potential attackers it probably manages. Digests that were not refreshed within ttl seconds are dropped,
+    the AS then no longer receives requests routed by digest.
+    The table is only complete once every AS may have published its digest (ttl seconds after the start)
+    and while no digest has expired within the last ttl seconds, the AS of an expired digest may have left
+    or may still manage any ip.
+    """
+
+    def __init__(
+        self, ttl: float = DIGEST_TTL, clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        :param ttl: seconds a digest is used after it was received
+        :type ttl: float
+        :param clock: returns the current time in seconds
+        :type clock: Callable[[], float]
+        """
+        self.ttl = ttl
+        self.clock = clock
+        # AS name -> (encoded digest, bloom filter, time of receipt)
+        self._digests: Dict[str, Tuple[str, pybloom_live.BloomFilter, float]] = {}
+        # AS name -> time of expiry, for the ASes whose digest expired within the last ttl seconds
+        self._expired: Dict[str, float] = {}
+        self._started = clock()
+
+    def __len__(self) -> int:
+        self.expire()
+        return len(self._digests)
+
+    def __contains__(self, as_name: str) -> bool:
+        return as_name in self._digests
+
+    def put(self, as_name: str, encoded: str) -> None:
+        """
+        Stores the digest of an AS, an unchanged digest is only refreshed and not decoded again.
+
+        :param as_name: name of the AS
+        :type as_name: str
+        :param encoded: its serialized bloom filter
+        :type encoded: str
+        :return: None
+        """
+        self._expired.pop(as_name, None)
+        known = self._digests.get(as_name)
+        if known is not None and known[0] == encoded:
+            self._digests[as_name] = (encoded, known[1], self.clock())
+            return
+        self._digests[as_name] = (encoded, decode_bloom_filter(encoded), self.clock())
+        log.info("digest of %s %s", as_name, "updated" if known else "added")
+
+    def expire(self) -> None:
+        now = self.clock()
+        for as_name in [
+            as_name
+            for as_name, (_, _, received) in self._digests.items()
+            if now - received > self.ttl
+        ]:
+            del self._digests[as_name]
+            self._expired[as_name] = now
+            log.info("digest of %s expired", as_name)
+        for as_name in [
+            as_name
+            for as_name, expired in self._expired.items()
+            if now - expired > self.ttl
+        ]:
+            del self._expired[as_name]
+            log.info("AS %s is no longer expected to publish a digest", as_name)
+
+    def complete(self) -> bool:
+        """
+        :return: whether all ASes probably have a fresh digest, i.e. whether routing by digest reaches all of them
+        :rtype: bool
+        """
+        self.expire()
+        return not self._expired and self.clock() - self._started >= self.ttl
+
+    def route(self, ips: Sequence[str]) -> Dict[str, List[str]]:
+        """
+        Splits the ips by the ASes that probably manage them.
+        An ip can be routed to more than one AS (false positives of the bloom filters) or to none.
+        Prefixes can contain sources of any AS and are routed to all ASes.
+
+        :param ips: potential attackers
+        :type ips: Sequence[str]
+        :return: AS name -> ips in its digest, only ASes with at least one ip
+        :rtype: Dict[str, List[str]]
+        """
+        self.expire()
+        prefixes = [ip for ip in ips if is_prefix(ip)]
+        if prefixes:
+            ips = [ip for ip in ips if not is_prefix(ip)]
+        routes = {}
+        for as_name, (_, bloom_filter, _) in self._digests.items():
+            matched = [ip for ip in ips if ip in bloom_filter] + prefixes
+            if matched:
+                routes[as_name] = matched
+        return routes
@@ -0,0 +1,453 @@
+import heapq
+import logging
+import os
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Mapping, Sequence, Tuple
+
+from src.config import (
+    EXPORT_DIR,
+    EXPORT_FORMAT,
+    EXPORT_TOP_SOURCES,
+    EXPORT_BATCH_PERIODS,
+    EXPORT_ROTATE_PERIODS,
+    EXPORT_QUEUE_SIZE,
+)
+from src.models import (
+    DefenseCollaborationRequestData,
+    DefenseCollaborationResponseData,
+    Detection,
+)
+from src.util.metrics import REGISTRY
+
+log = logging.getLogger("export")
+
+_exported = REGISTRY.counter(
+    "ch2tf_export_rows_total", "Rows written by the exporter.", ("table",)
+)
+_dropped = REGISTRY.counter(
+    "ch2tf_export_dropped_periods_total",
+    "Periods that were not exported because the exporter fell behind.",
+)
+
+# table -> columns (name, type), the types are mapped to arrow types by the writer
+TABLES: Dict[str, Tuple[Tuple[str, str], ...]] = {
+    # packets per destination, as sampled (divide by sampling_rate for the estimate)
+    "destinations": (
+        ("epoch", "int64"),
+        ("time", "float64"),
+        ("as_name", "string"),
+        ("destination", "string"),
+        ("packets", "int64"),
+        ("sources", "int64"),
+        ("sampling_rate", "float64"),
+    ),
+    # the EXPORT_TOP_SOURCES sources with the most packets per destination
+    "top_sources": (
+        ("epoch", "int64"),
+        ("as_name", "string"),
+        ("destination", "string"),
+        ("rank", "int64"),
+        ("source", "string"),
+        ("packets", "int64"),
+    ),
+    "detections": (
+        ("epoch", "int64"),
+        ("time", "float64"),
+        ("as_name", "string"),
+        ("victim", "string"),
+        ("detection_case", "string"),
+        ("ratio", "float64"),
+        ("packets", "float64"),
+        ("prefixes", "list<string>"),
+    ),
+    # requests sent by this AS and requests it handled (decision and counts only for handled requests)
+    "requests": (
+        ("epoch", "int64"),
+        ("time", "float64"),
+        ("as_name", "string"),
+        ("role", "string"),
+        ("request_id", "string"),
+        ("originator", "string"),
+        ("victim", "string"),
+        ("campaign_id", "string"),
+        ("detection", "string"),
+        ("requests_relative_to_size", "float64"),
+        ("potential_attackers", "int64"),
+        ("decision", "string"),
+        ("acknowledged", "int64"),
+        ("not_managed", "int64"),
+    ),
+    # responses received by this AS
+    "responses": (
+        ("epoch", "int64"),
+        ("time", "float64"),
+        ("as_name", "string"),
+        ("request_id", "string"),
+        ("originator", "string"),
+        ("responder", "string"),
+        ("decision", "string"),
+        ("acknowledged", "int64"),
+    ),
+}
+
+
+class ColumnarWriter(ABC):
+    """
+    Appends batches of columns to the files of the tables.
+    """
+
+    @abstractmethod
+    def write(self, table: str, columns: Dict[str, list]) -> None:
+        """
+        :param table: name of the table in TABLES
+        :type table: str
+        :param columns: column name -> values, all columns of the table with the same length
+        :type columns: Dict[str, list]
+        :return: None
+        """
+        raise NotImplementedError
+
+    def rotate(self) -> None:
+        """
+        Closes the current files, the following batches are written to new files.
+        :return: None
+        """
+
+    def close(self) -> None:
+        self.rotate()
+
+
+class ArrowWriter(ColumnarWriter):
+    """
+    Writes each table to <directory>/<table>/<as_name>-<start>.<arrows|parquet>.
+    Arrow IPC streams are readable up to the last complete batch while they are written,
+    parquet files only after they are closed, i.e. after rotate.
+    Requires pyarrow.
+    """
+
+    def __init__(self, directory: str, file_format: str = "arrow", as_name: str = ""):
+        """
+        :param directory: directory of the files
+        :type directory: str
+        :param file_format: arrow (IPC stream) or parquet
+        :type file_format: str
+        :param as_name: prefix of the file names, such that multiple instances can export to the same directory
+        :type as_name: str
+        """
+        try:
+            import pyarrow
+        except ImportError as e:
+            raise ImportError("the export requires pyarrow: pip install pyarrow") from e
+        if file_format not in ("arrow", "parquet"):
+            raise ValueError(f"unknown export format: {file_format}")
+        self._pa = pyarrow
+        self.directory = directory
+        self.file_format = file_format
+        self.as_name = as_name
+        types = {
+            "int64": pyarrow.int64(),
+            "float64": pyarrow.float64(),
+            "string": pyarrow.string(),
+            "list<string>": pyarrow.list_(pyarrow.string()),
+        }
+        self.schemas = {
+            table: pyarrow.schema([(name, types[type_]) for name, type_ in columns])
+            for table, columns in TABLES.items()
+        }
+        # table -> open writer and the file it writes to (closed separately for streams)
+        self._writers: Dict[str, Tuple[object, object]] = {}
+
+    def _open(self, table: str):
+        directory = os.path.join(self.directory, table)
+        os.makedirs(directory, exist_ok=True)
+        extension = "arrows" if self.file_format == "arrow" else "parquet"
+        path = os.path.join(
+            directory, f"{self.as_name or 'ch2tf'}-{time.time_ns()}.{extension}"
+        )
+        schema = self.schemas[table]
+        if self.file_format == "parquet":
+            import pyarrow.parquet
+
+            return pyarrow.parquet.ParquetWriter(path, schema), None
+        sink = self._pa.OSFile(path, "wb")
+        return self._pa.ipc.new_stream(sink, schema), sink
+
+    def write(self, table: str, columns: Dict[str, list]) -> None:
+        opened = self._writers.get(table)
+        if opened is None:
+            opened = self._writers[table] = self._open(table)
+        writer = opened[0]
+        batch = self._pa.RecordBatch.from_pydict(columns, schema=self.schemas[table])
+        if self.file_format == "parquet":
+            # one row group per batch
+            writer.write_table(self._pa.Table.from_batches([batch]))  # type: ignore
+        else:
+            writer.write_batch(batch)  # type: ignore
+
+    def rotate(self) -> None:
+        writers, self._writers = self._writers, {}
+        for writer, sink in writers.values():
+            writer.close()  # type: ignore
+            if sink is not None:
+                sink.close()  # type: ignore
+
+
+def top_sources(sources: Mapping[str, int], n: int) -> List[Tuple[str, int]]:
+    """
+    :param sources: source -> packets
+    :type sources: Mapping[str, int]
+    :param n: number of sources
+    :type n: int
+    :return: the n sources with the most packets, most packets first
+    :rtype: List[Tuple[str, int]]
+    """
+    if len(sources) <= n:
+        return sorted(sources.items(), key=lambda item: item[1], reverse=True)
+    return heapq.nlargest(n, sources.items(), key=lambda item: item[1])
+
+
+class EpochExporter:
+    """
+    Exports the traffic matrix, detections, requests and responses of each period to columnar files.
+    The analysis only hands over the tables of the ended period (they are not changed afterwards)
+    and the rows of the messages; the rows are built, batched and written in a background thread.
+    If the thread falls behind, periods are dropped instead of blocking the analysis.
+    """
+
+    def __init__(
+        self,
+        as_name: str,
+        writer: ColumnarWriter | None = None,
+        top_n: int = EXPORT_TOP_SOURCES,
+        batch_periods: int = EXPORT_BATCH_PERIODS,
+        rotate_periods: int = EXPORT_ROTATE_PERIODS,
+        queue_size: int = EXPORT_QUEUE_SIZE,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        :param as_name: name of the AS, written to each row
+        :type as_name: str
+        :param writer: writes the batches, an ArrowWriter for EXPORT_DIR and EXPORT_FORMAT by default
+        :type writer: ColumnarWriter | None
+        :param top_n: number of sources exported per destination
+        :type top_n: int
+        :param batch_periods: periods that are written as one batch
+        :type batch_periods: int
+        :param rotate_periods: periods after which new files are started (0: never)
+        :type rotate_periods: int
+        :param queue_size: max. periods waiting to be written
+        :type queue_size: int
+        :param clock: returns the wall clock time in seconds
+        :type clock: Callable[[], float]
+        """
+        self.as_name = as_name
+        self.writer = (
+            writer
+            if writer is not None
+            else ArrowWriter(EXPORT_DIR, EXPORT_FORMAT, as_name)
+        )
+        self.top_n = top_n
+        self.batch_periods = batch_periods
+        self.rotate_periods = rotate_periods
+        self.clock = clock
+        # rows of the messages of the current period, appended by the handlers
+        self._requests: List[tuple] = []
+        self._responses: List[tuple] = []
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        # table -> column -> values of the current batch, only used by the background thread
+        self._columns = self._empty_columns()
+        self._batched = 0
+        self._written = 0
+        self._thread = threading.Thread(target=self._run, name="export", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _empty_columns() -> Dict[str, Dict[str, list]]:
+        return {
+            table: {name: [] for name, _ in columns}
+            for table, columns in TABLES.items()
+        }
+
+    def record_request(
+        self,
+        request: DefenseCollaborationRequestData,
+        role: str,
+        decision: str = "",
+        acknowledged: int = 0,
+        not_managed: int = 0,
+    ) -> None:
+        """
+        :param request: sent or handled request
+        :type request: DefenseCollaborationRequestData
+        :param role: sent or handled
+        :type role: str
+        :param decision: decision of this AS on a handled request
+        :type decision: str
+        :param acknowledged: acknowledged attackers of a handled request
+        :type acknowledged: int
+        :param not_managed: potential attackers of a handled request that are not managed by this AS
+        :type not_managed: int
+        :return: None
+        """
+        self._requests.append(
+            (
+                self.clock(),
+                role,
+                str(request.request_id),
+                request.request_originator,
+                request.potential_victim,
+                request.campaign_id,
+                request.request_detection.name,
+                request.requests_relative_to_size,
+                len(request.potential_attacker_ips),
+                decision,
+                acknowledged,
+                not_managed,
+            )
+        )
+
+    def record_response(self, response: DefenseCollaborationResponseData) -> None:
+        self._responses.append(
+            (
+                self.clock(),
+                str(response.request_id),
+                response.request_originator,
+                response.as_name,
+                response.decision.name,
+                len(response.ack_potential_attacker_ips),
+            )
+        )
+
+    def end_epoch(
+        self,
+        epoch: int,
+        dest_dict: Mapping[str, Mapping[str, int]],
+        detections: Sequence[Detection],
+        sampling_rate: float = 1.0,
+    ) -> bool:
+        """
+        Hands the period over to the background thread.
+
+        :param epoch: number of the period
+        :type epoch: int
+        :param dest_dict: destination -> source -> packets of the period, must not be changed afterwards
+        :type dest_dict: Mapping[str, Mapping[str, int]]
+        :param detections: potential victims detected in the period
+        :type detections: Sequence[Detection]
+        :param sampling_rate: rate the packets of the period were sampled with
+        :type sampling_rate: float
+        :return: False if the period was dropped
+        :rtype: bool
+        """
+        requests, self._requests = self._requests, []
+        responses, self._responses = self._responses, []
+        item = (
+            epoch,
+            self.clock(),
+            dest_dict,
+            list(detections),
+            requests,
+            responses,
+            sampling_rate,
+        )
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            _dropped.labels().inc()
+            log.warning("export of period %s dropped, the exporter fell behind", epoch)
+            return False
+        return True
+
+    def close(self, timeout: float | None = None) -> None:
+        """
+        Writes the pending periods and closes the files.
+
+        :param timeout: max. seconds to wait for the background thread
+        :type timeout: float | None
+        :return: None
+        """
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    self._flush()
+                    self.writer.close()
+                    return
+                self._add(*item)
+                self._batched += 1
+                self._written += 1
+                if self._batched >= self.batch_periods:
+                    self._flush()
+                if self.rotate_periods and self._written % self.rotate_periods == 0:
+                    self._flush()
+                    self.writer.rotate()
+            except Exception:
+                # a failed write must not stop the export of the following periods
+                log.exception("export failed")
+
+    def _add(
+        self,
+        epoch: int,
+        now: float,
+        dest_dict: Mapping[str, Mapping[str, int]],
+        detections: List[Detection],
+        requests: List[tuple],
+        responses: List[tuple],
+        sampling_rate: float,
+    ) -> None:
+        as_name = self.as_name
+        destinations = self._columns["destinations"]
+        top = self._columns["top_sources"]
+        for destination, sources in dest_dict.items():
+            _append(
+                destinations,
+                epoch,
+                now,
+                as_name,
+                destination,
+                sum(sources.values()),
+                len(sources),
+                sampling_rate,
+            )
+            for rank, (source, packets) in enumerate(
+                top_sources(sources, self.top_n), 1
+            ):
+                _append(top, epoch, as_name, destination, rank, source, packets)
+        for detection in detections:
+            _append(
+                self._columns["detections"],
+                epoch,
+                now,
+                as_name,
+                detection.victim,
+                detection.detection_case.name,
+                detection.ratio,
+                detection.packets,
+                list(detection.prefixes),
+            )
+        for row in requests:
+            _append(self._columns["requests"], epoch, row[0], as_name, *row[1:])
+        for row in responses:
+            _append(self._columns["responses"], epoch, row[0], as_name, *row[1:])
+
+    def _flush(self) -> None:
+        columns, self._columns = self._columns, self._empty_columns()
+        self._batched = 0
+        for table, values in columns.items():
+            rows = len(next(iter(values.values())))
+            if not rows:
+                continue
+            self.writer.write(table, values)
+            _exported.labels(table).inc(rows)
+
+
+def _append(columns: Dict[str, list], *row) -> None:
+    for values, value in zip(columns.values(), row):
+        values.append(value)
@@ -0,0 +1,144 @@
+import socket
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Mapping, Sequence, Tuple
+
+from src.config import (
+    HHH_PREFIXES_V4,
+    HHH_PREFIXES_V6,
+    HHH_THRESHOLD,
+    HHH_MIN_SOURCES,
+    THRESHOLD_SRC_1,
+)
+
+# (address bits, network as integer, prefix length)
+PrefixKey = Tuple[int, int, int]
+
+
+def parse_address(ip: str) -> Tuple[int, int] | None:
+    """
+    :param ip: IPv4 / IPv6 address (or pseudonym), hashes are no addresses
+    :type ip: str
+    :return: address bits (32 / 128) and the address as integer, None if it is no address
+    :rtype: Tuple[int, int] | None
+    """
+    try:
+        packed = socket.inet_pton(socket.AF_INET6 if ":" in ip else socket.AF_INET, ip)
+    except (OSError, ValueError):
+        return None
+    return len(packed) * 8, int.from_bytes(packed, "big")
+
+
+def is_prefix(entry: str) -> bool:
+    return "/" in entry
+
+
+def parse_prefix(entry: str) -> PrefixKey | None:
+    """
+    :param entry: prefix in CIDR notation, e.g. 10.1.2.0/24
+    :type entry: str
+    :return: key of the prefix, None if it is no prefix
+    :rtype: PrefixKey | None
+    """
+    address, _, length = entry.partition("/")
+    parsed = parse_address(address)
+    if parsed is None or not length.isdigit() or int(length) > parsed[0]:
+        return None
+    bits, value = parsed
+    return bits, value >> (bits - int(length)), int(length)
+
+
+def format_prefix(key: PrefixKey) -> str:
+    bits, network, length = key
+    family = socket.AF_INET6 if bits == 128 else socket.AF_INET
+    address = (network << (bits - length)).to_bytes(bits // 8, "big")
+    return f"{socket.inet_ntop(family, address)}/{length}"
+
+
+def _lengths(bits: int) -> Sequence[int]:
+    return HHH_PREFIXES_V6 if bits == 128 else HHH_PREFIXES_V4
+
+
+def aggregate_sources(
+    sources: Mapping[str, int],
+    threshold: float = HHH_THRESHOLD,
+    min_sources: int = HHH_MIN_SOURCES,
+    heavy_hitter: float = THRESHOLD_SRC_1,
+) -> Tuple[Counter, List[str]]:
+    """
+    Hierarchical heavy hitters of the sources of a victim.
+    The sources are counted per prefix length (HHH_PREFIXES_V4 / _V6) in one pass.
+    Afterwards, from the longest to the shortest prefix, a prefix is reported if the sources it covers
+    that are not covered by a longer reported prefix send at least threshold packets and are at least min_sources.
+    Sources that are heavy hitters on their own are never aggregated.
+
+    :param sources: source -> packets sent to the victim
+    :type sources: Mapping[str, int]
+    :param threshold: min. packets of a prefix
+    :type threshold: float
+    :param min_sources: min. number of sources of a prefix
+    :type min_sources: int
+    :param heavy_hitter: sources with more packets are kept as they are
+    :type heavy_hitter: float
+    :return: source or prefix -> packets, with the reported prefixes instead of their sources, and the prefixes
+    :rtype: Tuple[Counter, List[str]]
+    """
+    # prefix -> sources it covers
+    members: Dict[PrefixKey, List[str]] = defaultdict(list)
+    for src, num_packets in sources.items():
+        if num_packets > heavy_hitter:
+            continue
+        parsed = parse_address(src)
+        if parsed is None:
+            continue
+        bits, value = parsed
+        for length in _lengths(bits):
+            members[(bits, value >> (bits - length), length)].append(src)
+
+    aggregated: Counter = Counter()
+    covered: set = set()
+    # longest prefixes first, such that the traffic is attributed to the most specific prefix
+    for key in sorted(members, key=lambda k: k[0] - k[2]):
+        uncovered = [src for src in members[key] if src not in covered]
+        if len(uncovered) < min_sources:
+            continue
+        num_packets = sum(sources[src] for src in uncovered)
+        if num_packets < threshold:
+            continue
+        aggregated[format_prefix(key)] = num_packets
+        covered.update(uncovered)
+    prefixes = list(aggregated)
+    for src, num_packets in sources.items():
+        if src not in covered:
+            aggregated[src] = num_packets
+    return aggregated, prefixes
+
+
+class PrefixIndex:
+    """
+    Sources of the traffic tables per requested prefix, built once per request that contains prefixes.
+    """
+
+    def __init__(self, sources: Iterable[str], prefixes: Iterable[PrefixKey]):
+        """
+        :param sources: (managed) sources of the traffic tables
+        :type sources: Iterable[str]
+        :param prefixes: prefixes of the request
+        :type prefixes: Iterable[PrefixKey]
+        """
+        wanted = set(prefixes)
+        lengths = {(bits, length) for bits, _, length in wanted}
+        self._members: Dict[PrefixKey, List[str]] = defaultdict(list)
+        for src in sources:
+            parsed = parse_address(src)
+            if parsed is None:
+                continue
+            bits, value = parsed
+            for prefix_bits, length in lengths:
+                if prefix_bits != bits:
+                    continue
+                key = (bits, value >> (bits - length), length)
+                if key in wanted:
+                    self._members[key].append(src)
+
+    def members(self, prefix: PrefixKey) -> List[str]:
+        return self._members.get(prefix, [])
@@ -0,0 +1,152 @@
+import functools
+import time
+from typing import Callable
+
+from src.util.metrics import Registry, REGISTRY, CounterValue, GaugeValue
+
+# buckets for the analysis of a period and the handling of a request, in seconds
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class CH2TFMetrics:
+    """
+    Metrics of the pipeline stages of a CH2TF instance, labelled with the name of the AS.
+    The values are bound once, such that an update is a single attribute increment.
+    Per-packet values are counted from the traffic tables at the end of each period
+    instead of on each packet.
+    """
+
+    def __init__(self, as_name: str, registry: Registry = REGISTRY):
+        """
+        :param as_name: name of the AS, label of all metrics
+        :type as_name: str
+        :param registry: registry the metrics are exposed with
+        :type registry: Registry
+        """
+        self.as_name = as_name
+        self.registry = registry
+        as_label = ("as_name",)
+
+        # collection
+        self.packets_aggregated = registry.counter(
+            "ch2tf_packets_aggregated_total",
+            "Packets aggregated into the traffic tables, updated at the end of each period.",
+            as_label,
+        ).labels(as_name)
+        self._packets_dropped = registry.counter(
+            "ch2tf_packets_dropped_total",
+            "Packets that were not aggregated, ingested = aggregated + dropped.",
+            as_label + ("reason",),
+        )
+        self.packets_sampled_out = self._packets_dropped.labels(as_name, "sampling")
+        self.packets_fast_path = self._packets_dropped.labels(
+            as_name, "confirmed_attacker"
+        )
+        # destinations of other partitions (CONSUMER_GROUP), aggregated by the worker of their partition
+        self.packets_sharded_out = self._packets_dropped.labels(as_name, "shard")
+        self.confirmed_attackers = registry.gauge(
+            "ch2tf_confirmed_attackers",
+            "Confirmed attackers whose packets are kept out of the traffic tables.",
+            as_label,
+        ).labels(as_name)
+        self.sampling_rate = registry.gauge(
+            "ch2tf_sampling_rate",
+            "Rate the packets of the current period are sampled with.",
+            as_label,
+        ).labels(as_name)
+        self.queue_depth = registry.gauge(
+            "ch2tf_queue_depth", "Packets waiting in the queue.", as_label
+        ).labels(as_name)
+
+        # analysis
+        self.epoch_destinations = registry.gauge(
+            "ch2tf_epoch_destinations",
+            "Distinct destinations of the last analysis period.",
+            as_label,
+        ).labels(as_name)
+        self.epoch_flows = registry.gauge(
+            "ch2tf_epoch_flows",
+            "Distinct (source, destination) pairs of the last analysis period.",
+            as_label,
+        ).labels(as_name)
+        self.detections = registry.counter(
+            "ch2tf_detections_total", "Detected potential victims.", as_label
+        ).labels(as_name)
+        self.analysis_duration = registry.histogram(
+            "ch2tf_analysis_duration_seconds",
+            "Duration of the analysis of a period.",
+            as_label,
+            DURATION_BUCKETS,
+        ).labels(as_name)
+        self.table_memory = registry.gauge(
+            "ch2tf_table_memory_bytes",
+            "Approximated memory of the aggregation tables and the collaboration state.",
+            as_label + ("table",),
+        )
+
+        # collaboration
+        self.collab_request_duration = registry.histogram(
+            "ch2tf_collab_request_duration_seconds",
+            "Duration of the handling of a collaboration request.",
+            as_label,
+            DURATION_BUCKETS,
+        ).labels(as_name)
+        self._messages_sent = registry.counter(
+            "ch2tf_kafka_messages_sent_total",
+            "Messages handed to the producer.",
+            as_label + ("topic",),
+        )
+        self._send_errors = registry.counter(
+            "ch2tf_kafka_send_errors_total",
+            "Messages that could not be sent.",
+            as_label + ("topic",),
+        )
+        self._messages_received = registry.counter(
+            "ch2tf_kafka_messages_received_total",
+            "Messages received by the consumer.",
+            as_label + ("topic",),
+        )
+        self._receive_errors = registry.counter(
+            "ch2tf_kafka_receive_errors_total",
+            "Received messages whose handling failed.",
+            as_label + ("topic",),
+        )
+
+    def messages_sent(self, topic: str) -> CounterValue:
+        return self._messages_sent.labels(self.as_name, topic)
+
+    def send_errors(self, topic: str) -> CounterValue:
+        return self._send_errors.labels(self.as_name, topic)
+
+    def messages_received(self, topic: str) -> CounterValue:
+        return self._messages_received.labels(self.as_name, topic)
+
+    def receive_errors(self, topic: str) -> CounterValue:
+        return self._receive_errors.labels(self.as_name, topic)
+
+    def memory(self, table: str) -> GaugeValue:
+        return self.table_memory.labels(self.as_name, table)
+
+
+def timed(histogram: str) -> Callable:
+    """
+    Decorator for methods of CH2TF, observes the duration of each call in a histogram of CH2TFMetrics.
+
+    :param histogram: attribute name of the histogram in CH2TFMetrics
+    :type histogram: str
+    :return: decorator
+    :rtype: Callable
+    """
+
+    def decorator(method: Callable) -> Callable:
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                getattr(self.metrics, histogram).observe(time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import queue
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from kafka.consumer.fetcher import ConsumerRecord
+
+from src.config import (
+    ANALYSIS_PERIOD,
+    INGEST_BATCH_SIZE,
+    CONSUMER_POLL_TIMEOUT,
+    SHUTDOWN_TIMEOUT,
+)
+from src.models import PacketData
+from .ch2tf import CH2TF
+
+log = logging.getLogger("runtime")
+
+
+class CH2TFRuntime:
+    """
+    Runs a CH2TF instance on an event loop instead of three free-running threads.
+    Ingestion, the periodic analysis and the consumer are cooperative tasks,
+    blocking calls (Kafka poll / flush) are run in an I/O executor,
+    the packets are taken from the queue and aggregated in an ingestion thread
+    and the CPU heavy work (analysis, handling of requests and responses) in a single analysis thread,
+    i.e. the analysis and the handling of messages no longer run concurrently on the same state
+    and the event loop is not blocked by the aggregation of a batch.
+
+    stop() shuts down gracefully: packets queued at the time of the stop are stored and analysed a last time,
+    consumed messages are handled and the producer is flushed before the consumer is closed.
+    With checkpoints, the latest snapshot is restored on start and a snapshot is written on shutdown.
+    """
+
+    def __init__(
+        self,
+        ch2tf: CH2TF,
+        analysis_period: float = ANALYSIS_PERIOD,
+        batch_size: int = INGEST_BATCH_SIZE,
+        poll_timeout: float = CONSUMER_POLL_TIMEOUT,
+    ):
+        """
+        :param ch2tf: instance to run
+        :type ch2tf: CH2TF
+        :param analysis_period: seconds between two analyses
+        :type analysis_period: float
+        :param batch_size: max. packets taken from the queue at once
+        :type batch_size: int
+        :param poll_timeout: seconds the consumer waits for messages
+        :type poll_timeout: float
+        """
+        self.ch2tf = ch2tf
+        self.analysis_period = analysis_period
+        self.batch_size = batch_size
+        self.poll_timeout = poll_timeout
+        self.analysis_executor = ThreadPoolExecutor(1, thread_name_prefix="analysis")
+        self.io_executor = ThreadPoolExecutor(2, thread_name_prefix="io")
+        self.ingest_executor = ThreadPoolExecutor(1, thread_name_prefix="ingest")
+        self.iteration = 0
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stopping: asyncio.Event | None = None
+
+    def stop(self) -> None:
+        """
+        Requests a graceful shutdown, can be called from any thread and from signal handlers.
+        :return: None
+        """
+        if self._loop is None or self._stopping is None:
+            return
+        self._loop.call_soon_threadsafe(self._stopping.set)
+
+    async def run(self) -> None:
+        """
+        Runs until stop() is called.
+        :return: None
+        """
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        await self._run_analysis(self.ch2tf.restore_checkpoint)
+        consumer = await self._loop.run_in_executor(
+            self.io_executor, self.ch2tf.subscribe
+        )
+        tasks = [asyncio.create_task(self._consume(consumer), name="consume")]
+        if self.ch2tf.queue is not None:
+            tasks.append(asyncio.create_task(self._ingest(), name="ingest"))
+        analysis = asyncio.create_task(self._analyse(), name="analysis")
+        await self._stopping.wait()
+        log.info("shutting down")
+        try:
+            await asyncio.wait_for(
+                self._drain(tasks, analysis, consumer), SHUTDOWN_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            log.warning("shutdown did not finish within %ss", SHUTDOWN_TIMEOUT)
+        finally:
+            self.analysis_executor.shutdown(wait=False, cancel_futures=True)
+            self.io_executor.shutdown(wait=False, cancel_futures=True)
+            self.ingest_executor.shutdown(wait=False, cancel_futures=True)
+        log.info("stopped")
+
+    async def _drain(self, tasks: list, analysis: asyncio.Task, consumer) -> None:
+        # ingestion and the consumer finish their current batch, ingestion empties the queue
+        await asyncio.gather(*tasks)
+        analysis.cancel()
+        await asyncio.gather(analysis, return_exceptions=True)
+        self.iteration += 1
+        await self._run_analysis(self.ch2tf.analyse_period, self.iteration)
+        # the next process continues with the state of the last period
+        await self._run_analysis(self.ch2tf.checkpoint, True)
+        if self.ch2tf.exporter is not None:
+            await self._loop.run_in_executor(
+                self.io_executor, self.ch2tf.exporter.close
+            )
+        await self._loop.run_in_executor(self.io_executor, self.ch2tf.producer.flush)
+        await self._loop.run_in_executor(self.io_executor, consumer.close)
+
+    async def _run_analysis(self, function, *args):
+        return await self._loop.run_in_executor(self.analysis_executor, function, *args)
+
+    def _get_batch(self, timeout: float, limit: int) -> List[PacketData]:
+        """
+        Waits up to timeout seconds for the first packet and takes the packets that are already queued,
+        at most limit packets.
+        """
+        try:
+            batch = [self.ch2tf.queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(batch) < limit:
+            try:
+                batch.append(self.ch2tf.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _ingest_batch(self, timeout: float, limit: int) -> int:
+        """
+        Takes a batch from the queue and aggregates it (in the ingestion thread).
+        :return: number of ingested packets
+        :rtype: int
+        """
+        batch = self._get_batch(timeout, limit)
+        if batch:
+            self.ch2tf.store_packets(batch)
+            self.ch2tf.observe_backlog()
+        return len(batch)
+
+    async def _ingest(self) -> None:
+        # packets left to ingest after the stop
+        remaining = None
+        while True:
+            if remaining is None and self._stopping.is_set():
+                # only the packets queued at the stop, the traffic processes may still add packets
+                remaining = self._queued()
+            if remaining is not None and remaining <= 0:
+                return
+            limit = (
+                self.batch_size
+                if remaining is None
+                else min(self.batch_size, remaining)
+            )
+            # after the stop, the queue is emptied without waiting for new packets
+            ingested = await self._loop.run_in_executor(
+                self.ingest_executor,
+                self._ingest_batch,
+                0.1 if remaining is None else 0,
+                limit,
+            )
+            if remaining is not None:
+                remaining = remaining - ingested if ingested else 0
+
+    def _queued(self) -> int:
+        try:
+            return self.ch2tf.queue.qsize()
+        except NotImplementedError:
+            # multiprocessing queues have no size on macOS, the queue is emptied
+            return sys.maxsize
+
+    async def _analyse(self) -> None:
+        next_run = time.monotonic() + self.analysis_period
+        while True:
+            await asyncio.sleep(max(0.0, next_run - time.monotonic()))
+            self.iteration += 1
+            await self._run_analysis(self.ch2tf.analyse_period, self.iteration)
+            next_run += self.analysis_period
+            delay = next_run - time.monotonic()
+            if delay < 0:
+                # analysis took longer than a period, continue with the next one from now on
+                log.warning(
+                    "Analysis: %s overran the period by %.3fs", self.iteration, -delay
+                )
+                self.ch2tf.sampling.observe(lag=-delay)
+                next_run = time.monotonic()
+
+    def _dispatch_all(self, records: List[ConsumerRecord]) -> None:
+        for record in records:
+            try:
+                self.ch2tf.dispatch(record)
+            except Exception:
+                # counted by dispatch, a malformed message must not stop the consumer
+                log.exception("handling of a message from %s failed", record.topic)
+
+    async def _consume(self, consumer) -> None:
+        timeout_ms = int(self.poll_timeout * 1000)
+        while not self._stopping.is_set():
+            polled = await self._loop.run_in_executor(
+                self.io_executor, consumer.poll, timeout_ms
+            )
+            records = [record for records in polled.values() for record in records]
+            if self.ch2tf.pending_alarms:
+                # the ingest thread only queues early alarms, they are sent with the analysis
+                await self._run_analysis(self.ch2tf.send_early_alarms)
+            if records:
+                await self._run_analysis(self._dispatch_all, records)
+            else:
+                # consumers that return immediately (e.g. in-memory) must not busy loop
+                await asyncio.sleep(0.01)
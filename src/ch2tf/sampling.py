@@ -0,0 +1,183 @@
+import logging
+import multiprocessing
+import random
+from collections import deque
+from typing import Any, Deque
+
+from src.config import (
+    SAMPLING_RATE,
+    ADAPTIVE_SAMPLING,
+    SAMPLING_MIN_RATE,
+    SAMPLING_TARGET_BACKLOG,
+    SAMPLING_MAX_LAG,
+    SAMPLING_DECREASE,
+    SAMPLING_INCREASE,
+)
+from src.util import is_sampling_skip
+
+log = logging.getLogger("ch2tf")
+
+
+class SamplingController:
+    """
+    Load shedding: adapts the sampling rate to the ingestion backlog and the lag of the analysis.
+    The backlog and the lag are observed during a period, the rate of the next period is set when a period ends
+    (multiplicative decrease when overloaded, additive increase up to max_rate when idle).
+    The rate is constant within a period, i.e. the packets of a period are an unbiased sample
+    and the analyses scale the counts of each period by its rate.
+    """
+
+    def __init__(
+        self,
+        max_rate: float = SAMPLING_RATE,
+        adaptive: bool = ADAPTIVE_SAMPLING,
+        min_rate: float = SAMPLING_MIN_RATE,
+        target_backlog: int = SAMPLING_TARGET_BACKLOG,
+        max_lag: float = SAMPLING_MAX_LAG,
+        decrease: float = SAMPLING_DECREASE,
+        increase: float = SAMPLING_INCREASE,
+        history: int = 128,
+        rng: random.Random | None = None,
+    ):
+        """
+        :param max_rate: rate without overload, the static SAMPLING_RATE
+        :type max_rate: float
+        :param adaptive: whether the rate is adapted, otherwise it stays at max_rate
+        :type adaptive: bool
+        :param min_rate: lowest rate
+        :type min_rate: float
+        :param target_backlog: packets in the queue above which the rate is lowered
+        :type target_backlog: int
+        :param max_lag: seconds the analysis may overrun its period before the rate is lowered
+        :type max_lag: float
+        :param decrease: factor the rate is lowered by
+        :type decrease: float
+        :param increase: step the rate is raised by
+        :type increase: float
+        :param history: number of periods whose rate is kept
+        :type history: int
+        :param rng: random generator the packets are sampled with, a new unseeded one by default
+        :type rng: random.Random | None
+        """
+        self.max_rate = max_rate
+        self.adaptive = adaptive
+        self.min_rate = min(min_rate, max_rate)
+        self.target_backlog = target_backlog
+        self.max_lag = max_lag
+        self.decrease = decrease
+        self.increase = increase
+        self.rng = rng if rng is not None else random.Random()
+        # rate of the current period, applied to each packet
+        self.rate = max_rate
+        # rate of the previous period, i.e. of src_dict_tm1
+        self.previous_rate = max_rate
+        # rates of the past periods, oldest first
+        self.epoch_rates: Deque[float] = deque(maxlen=history)
+        # highest backlog and lag observed in the current period
+        self._backlog = 0
+        self._lag = 0.0
+
+    def observe(self, backlog: int = 0, lag: float = 0.0) -> None:
+        """
+        :param backlog: packets waiting to be aggregated
+        :type backlog: int
+        :param lag: seconds the analysis overran its period
+        :type lag: float
+        :return: None
+        """
+        if backlog > self._backlog:
+            self._backlog = backlog
+        if lag > self._lag:
+            self._lag = lag
+
+    def next_epoch(self) -> float:
+        """
+        Ends the period: records its rate and sets the rate of the next period from the observed load.
+
+        :return: rate of the next period
+        :rtype: float
+        """
+        self.epoch_rates.append(self.rate)
+        self.previous_rate = self.rate
+        backlog, lag = self._backlog, self._lag
+        self._backlog, self._lag = 0, 0.0
+        if not self.adaptive:
+            return self.rate
+        if backlog > self.target_backlog or lag > self.max_lag:
+            rate = max(self.min_rate, self.rate * self.decrease)
+        elif backlog <= self.target_backlog / 2 and lag <= self.max_lag / 2:
+            rate = min(self.max_rate, self.rate + self.increase)
+        else:
+            rate = self.rate
+        if rate != self.rate:
+            log.info(
+                "sampling rate %.3f -> %.3f (backlog: %s packets, lag: %.3fs)",
+                self.rate,
+                rate,
+                backlog,
+                lag,
+            )
+            self.rate = rate
+        return self.rate
+
+
+class SampledQueue:
+    """
+    Packet queue that samples at the producer: packets are skipped before they are put,
+    i.e. they are neither pickled by the producer nor unpickled by the ingestion.
+    The rate is set by the consuming CH2TF at the end of each period and shared with the producer processes,
+    like the queue itself it has to be created before they are started.
+    Packets that are already queued when the rate changes are aggregated in the next period.
+    """
+
+    def __init__(self, queue: Any, rate: float = SAMPLING_RATE):
+        """
+        :param queue: queue of the packets, e.g. a multiprocessing.Queue
+        :type queue: Any
+        :param rate: sampling rate until the first period ends
+        :type rate: float
+        """
+        self.queue = queue
+        # written by the consumer only, a torn read is not possible for a double
+        self._rate = multiprocessing.RawValue("d", rate)
+        # incremented by the producers without lock, concurrent increments can get lost as for the metrics
+        self._sampled_out = multiprocessing.RawValue("Q", 0)
+        self._reported = 0
+
+    @property
+    def rate(self) -> float:
+        return self._rate.value
+
+    def set_rate(self, rate: float) -> None:
+        """
+        Sets the rate the producers sample with (consumer side).
+        :param rate: sampling rate of the current period
+        :type rate: float
+        :return: None
+        """
+        self._rate.value = rate
+
+    def put(self, packet: Any) -> None:
+        rate = self._rate.value
+        if rate < 1 and is_sampling_skip(rate):
+            self._sampled_out.value += 1
+            return
+        self.queue.put(packet)
+
+    def get(self, block: bool = True, timeout: float | None = None) -> Any:
+        return self.queue.get(block, timeout)
+
+    def get_nowait(self) -> Any:
+        return self.queue.get_nowait()
+
+    def qsize(self) -> int:
+        return self.queue.qsize()
+
+    def take_sampled_out(self) -> int:
+        """
+        :return: packets skipped since the last call (consumer side)
+        :rtype: int
+        """
+        sampled_out = self._sampled_out.value
+        taken, self._reported = sampled_out - self._reported, sampled_out
+        return taken
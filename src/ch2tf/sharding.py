@@ -0,0 +1,26 @@
+import logging
+from typing import TYPE_CHECKING, Set
+
+from kafka import ConsumerRebalanceListener
+from kafka.structs import TopicPartition
+
+if TYPE_CHECKING:
+    from .ch2tf import CH2TF
+
+log = logging.getLogger("ch2tf")
+
+
+class ShardRebalanceListener(ConsumerRebalanceListener):
+    """
+    Keeps the traffic shard of a CH2TF worker in line with the partitions assigned to its consumer group member.
+    All partitioned topics have TOPIC_PARTITIONS partitions, i.e. the partition numbers are the same for all topics.
+    """
+
+    def __init__(self, ch2tf: "CH2TF"):
+        self.ch2tf = ch2tf
+
+    def on_partitions_revoked(self, revoked: Set[TopicPartition]) -> None:
+        log.info("%s: partitions revoked: %s", self.ch2tf.as_name, len(revoked))
+
+    def on_partitions_assigned(self, assigned: Set[TopicPartition]) -> None:
+        self.ch2tf.assign_shard({tp.partition for tp in assigned})
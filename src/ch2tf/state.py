@@ -0,0 +1,88 @@
+import sys
+import time
+from collections import defaultdict, Counter
+from typing import Callable, Mapping
+
+from src.config import (
+    STATE_TTL,
+    STATE_MAX_ENTRIES,
+    STATE_MAX_ENTRIES_PER_AS,
+    REPUTATION_TTL,
+)
+from .checkpoint import MappedTable
+from .state_store import BoundedStore
+
+
+class CH2TFState:
+    """
+    Traffic tables and collaboration state of a single CH2TF instance.
+    Each instance owns its state, such that multiple instances (e.g. simulated ASes or shards)
+    can run side by side in one process. Subclasses can change how the state is kept.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        """
+        :param clock: returns the current time in seconds, used for the expiry of the collaboration state
+        :type clock: Callable[[], float]
+        """
+        # destination -> source -> packets of the current period
+        self.dest_dict: defaultdict = defaultdict(Counter)
+        # (managed) source -> destination -> packets of the current period
+        self.src_dict: defaultdict = defaultdict(Counter)
+        # src_dict of the previous period, a MappedTable after a restore
+        self.src_dict_tm1: Mapping = {}
+        # destination -> packets of the previous period (scaled by its sampling rate)
+        self.dest_dict_aggregated: Mapping = {}
+        # packets per destination in the current period, only used by the streaming detection
+        self.dest_totals: Counter = Counter()
+
+        # AS name -> reputation (default 1.0)
+        self.reputation_dict: BoundedStore = BoundedStore(
+            REPUTATION_TTL, STATE_MAX_ENTRIES, STATE_MAX_ENTRIES_PER_AS, clock
+        )
+        # request id -> StoredRequest
+        self.req_dict: BoundedStore = BoundedStore(
+            STATE_TTL, STATE_MAX_ENTRIES, STATE_MAX_ENTRIES_PER_AS, clock
+        )
+        # (request id, AS name) -> DefenseCollaborationResponseData
+        self.responses: BoundedStore = BoundedStore(
+            STATE_TTL, STATE_MAX_ENTRIES, STATE_MAX_ENTRIES_PER_AS, clock
+        )
+
+    def table_memory(self) -> dict:
+        """
+        Approximates the memory of the traffic tables from the sizes of their hash tables.
+        The address strings are not counted, they are shared between the tables and the received packets.
+        :return: table name -> bytes
+        :rtype: dict
+        """
+        return {
+            # restored tables are mapped from a snapshot, their rows are no objects
+            name: (
+                table.nbytes
+                if isinstance(table, MappedTable)
+                else sys.getsizeof(table)
+                + sum(sys.getsizeof(counter) for counter in list(table.values()))
+            )
+            for name, table in (
+                ("dest_dict", self.dest_dict),
+                ("src_dict", self.src_dict),
+                ("src_dict_tm1", self.src_dict_tm1),
+            )
+        }
+
+    def reset_period(self) -> None:
+        """
+        Starts a new period: the current source perspective becomes the previous one
+        and the tables of the current period are replaced with new ones.
+        The ingestion keeps writing while the period is reset, therefore the tables are swapped
+        instead of iterated and cleared; packets stored with a reference to the old tables during the swap
+        are counted in the previous period.
+        :return: None
+        """
+        src_dict = self.src_dict
+        self.src_dict = defaultdict(Counter)
+        self.dest_dict = defaultdict(Counter)
+        self.dest_totals = Counter()
+        # copied in one step, lookups of unknown sources must not add them
+        self.src_dict_tm1 = dict(src_dict)
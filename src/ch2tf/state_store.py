@@ -0,0 +1,246 @@
+import sys
+import threading
+import time
+from collections import OrderedDict, Counter
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Callable, Dict, Hashable, Iterator, Sequence, Tuple
+
+from src.enums import DetectionEnum
+from src.models import DefenseCollaborationRequestData
+
+
+@dataclass(frozen=True)
+class AttackerRef:
+    """
+    Reference to the attackers of a request as a slice of a list that is already kept in memory.
+    Avoids storing a copy of each MSG_LENGTH-sized chunk of the attacker list.
+    """
+
+    source: Sequence[str]
+    start: int = 0
+    stop: int | None = None
+
+    def __iter__(self) -> Iterator[str]:
+        stop = (
+            len(self.source) if self.stop is None else min(self.stop, len(self.source))
+        )
+        for i in range(self.start, stop):
+            yield self.source[i]
+
+    def __len__(self) -> int:
+        stop = (
+            len(self.source) if self.stop is None else min(self.stop, len(self.source))
+        )
+        return max(0, stop - self.start)
+
+
+@dataclass(frozen=True)
+class StoredRequest:
+    """
+    Compact representation of a DefenseCollaborationRequestData that is kept in the state store.
+    """
+
+    request_id: str
+    request_originator: str
+    potential_victim: str
+    request_detection: DetectionEnum
+    requests_relative_to_size: float
+    campaign_id: str
+    potential_attacker_ips: AttackerRef
+
+    @classmethod
+    def from_request(
+        cls,
+        request: DefenseCollaborationRequestData,
+        attackers: AttackerRef | None = None,
+    ) -> "StoredRequest":
+        """
+        :param request: the request to store
+        :type request: DefenseCollaborationRequestData
+        :param attackers: reference to the attackers, by default the list of the request itself (no copy)
+        :type attackers: AttackerRef | None
+        :return: compact request
+        :rtype: StoredRequest
+        """
+        return cls(
+            request_id=request.request_id,
+            request_originator=request.request_originator,
+            potential_victim=request.potential_victim,
+            request_detection=request.request_detection,
+            requests_relative_to_size=request.requests_relative_to_size,
+            campaign_id=request.campaign_id,
+            potential_attacker_ips=(
+                AttackerRef(request.potential_attacker_ips)
+                if attackers is None
+                else attackers
+            ),
+        )
+
+
+def approx_size(obj: Any, seen: set | None = None) -> int:
+    """
+    Approximates the memory used by an object and the objects it references.
+    Objects referenced multiple times (e.g. shared attacker lists) are counted once.
+
+    :param obj: object to measure
+    :type obj: Any
+    :param seen: ids of objects that have already been counted
+    :type seen: set | None
+    :return: approximated size in bytes
+    :rtype: int
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, int, float, bool, Enum)) or obj is None:
+        return size
+    if isinstance(obj, dict):
+        return size + sum(
+            approx_size(k, seen) + approx_size(v, seen) for k, v in obj.items()
+        )
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return size + sum(approx_size(e, seen) for e in obj)
+    if hasattr(obj, "__dict__"):
+        return size + approx_size(vars(obj), seen)
+    return size
+
+
+class BoundedStore:
+    """
+    Mapping for the collaboration state with TTL and size based eviction.
+    Each entry belongs to an owner (the AS it originates from) with a quota of entries per owner,
+    such that a single AS cannot push out the state of all others.
+    Expired entries are evicted lazily on insert and by evict_expired.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        max_entries: int,
+        max_entries_per_owner: int,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        :param ttl: seconds after which an entry expires
+        :type ttl: float
+        :param max_entries: max. number of entries in the store
+        :type max_entries: int
+        :param max_entries_per_owner: max. number of entries of a single owner
+        :type max_entries_per_owner: int
+        :param clock: returns the current time in seconds
+        :type clock: Callable[[], float]
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_entries_per_owner = max_entries_per_owner
+        self.clock = clock
+        # key -> (inserted, owner, value), ordered by insertion
+        self._entries: OrderedDict[Hashable, Tuple[float, str, Any]] = OrderedDict()
+        # owner -> keys of the owner, ordered by insertion
+        self._owner_keys: Dict[str, OrderedDict[Hashable, None]] = {}
+        self.evictions: Counter = Counter()
+        # requests and responses are stored by the analysis and the listener thread
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, None) is not None
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None or self.clock() - entry[0] > self.ttl:
+            return default
+        return entry[2]
+
+    def put(self, key: Hashable, value: Any, owner: str = "", age: float = 0.0) -> None:
+        """
+        Inserts or replaces an entry. Evicts expired entries,
+        the oldest entry of the owner if it exceeds its quota and the oldest entry if the store is full.
+
+        :param key: key of the entry
+        :type key: Hashable
+        :param value: value of the entry
+        :type value: Any
+        :param owner: owner of the entry
+        :type owner: str
+        :param age: seconds the entry already exists (restored entries), entries must be put oldest first
+        :type age: float
+        :return: None
+        """
+        with self._lock:
+            self.pop(key)
+            self.evict_expired()
+            owner_keys = self._owner_keys.setdefault(owner, OrderedDict())
+            if len(owner_keys) >= self.max_entries_per_owner:
+                self._evict(next(iter(owner_keys)), "quota")
+            if len(self._entries) >= self.max_entries:
+                self._evict(next(iter(self._entries)), "size")
+            self._entries[key] = (self.clock() - age, owner, value)
+            self._owner_keys.setdefault(owner, OrderedDict())[key] = None
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return default
+            _, owner, value = entry
+            owner_keys = self._owner_keys[owner]
+            del owner_keys[key]
+            if not owner_keys:
+                del self._owner_keys[owner]
+            return value
+
+    def _evict(self, key: Hashable, reason: str) -> None:
+        self.pop(key)
+        self.evictions[reason] += 1
+
+    def evict_expired(self) -> int:
+        """
+        :return: number of evicted entries
+        :rtype: int
+        """
+        with self._lock:
+            deadline = self.clock() - self.ttl
+            expired = []
+            for key, (inserted, _, _) in self._entries.items():
+                # entries are ordered by insertion, all following entries are newer
+                if inserted >= deadline:
+                    break
+                expired.append(key)
+            for key in expired:
+                self._evict(key, "ttl")
+            return len(expired)
+
+    def items(self) -> Iterator[Tuple[Hashable, Any]]:
+        with self._lock:
+            entries = list(self._entries.items())
+        for key, (_, _, value) in entries:
+            yield key, value
+
+    def items_with_age(self) -> Iterator[Tuple[Hashable, Any, float]]:
+        """
+        :return: key, value and age in seconds of the entries, oldest first
+        :rtype: Iterator[Tuple[Hashable, Any, float]]
+        """
+        with self._lock:
+            entries = list(self._entries.items())
+        now = self.clock()
+        for key, (inserted, _, value) in entries:
+            yield key, value, now - inserted
+
+    def memory_usage(self) -> int:
+        """
+        :return: approximated memory used by the store in bytes
+        :rtype: int
+        """
+        seen: set = set()
+        with self._lock:
+            return approx_size(self._entries, seen) + approx_size(
+                self._owner_keys, seen
+            )
@@ -0,0 +1,88 @@
+import logging
+from typing import Dict, Tuple
+
+from src.enums import DecisionEnum
+from src.util.metrics import REGISTRY
+
+log = logging.getLogger("ch2tf")
+
+_lookups = REGISTRY.counter(
+    "ch2tf_verdict_cache_lookups_total",
+    "Lookups of the verdict cache, counted at the end of each epoch.",
+    ("result",),
+)
+
+
+class VerdictCache:
+    """
+    Caches the verdicts of the receiving AS for (attacker, victim) within an analysis epoch.
+    The same attacker is often part of requests from several originators for the same victim,
+    these are answered from the cache instead of running the analysis again.
+    The verdicts are based on the traffic tables of the epoch, therefore the cache is cleared at each rollover.
+    """
+
+    def __init__(self):
+        self.epoch = 0
+        # (attacker, victim) -> verdict of the current epoch
+        self._verdicts: Dict[Tuple[str, str], DecisionEnum] = {}
+        self.hits = 0
+        self.misses = 0
+        self.epoch_hits = 0
+        self.epoch_misses = 0
+
+    def get(self, attacker_ip: str, victim_ip: str) -> DecisionEnum | None:
+        """
+        :param attacker_ip: potential attacker
+        :type attacker_ip: str
+        :param victim_ip: potential victim
+        :type victim_ip: str
+        :return: the cached verdict of this epoch or None
+        :rtype: DecisionEnum | None
+        """
+        verdict = self._verdicts.get((attacker_ip, victim_ip))
+        if verdict is None:
+            self.epoch_misses += 1
+        else:
+            self.epoch_hits += 1
+        return verdict
+
+    def put(self, attacker_ip: str, victim_ip: str, verdict: DecisionEnum) -> None:
+        self._verdicts[(attacker_ip, victim_ip)] = verdict
+
+    @staticmethod
+    def _ratio(hits: int, misses: int) -> float:
+        lookups = hits + misses
+        return hits / lookups if lookups else 0.0
+
+    @property
+    def hit_ratio(self) -> float:
+        """
+        :return: hit ratio over all epochs
+        :rtype: float
+        """
+        return self._ratio(self.hits + self.epoch_hits, self.misses + self.epoch_misses)
+
+    def rollover(self) -> None:
+        """
+        Starts a new epoch, evicts all verdicts of the previous one and reports its hit ratio.
+
+        :return: None
+        """
+        log.info(
+            "verdict cache epoch %s: %s verdicts, hit ratio %.2f (%s hits, %s misses), total %.2f",
+            self.epoch,
+            len(self._verdicts),
+            self._ratio(self.epoch_hits, self.epoch_misses),
+            self.epoch_hits,
+            self.epoch_misses,
+            self.hit_ratio,
+        )
+        # counted once per epoch instead of on each lookup in the hot path
+        _lookups.labels("hit").inc(self.epoch_hits)
+        _lookups.labels("miss").inc(self.epoch_misses)
+        self.hits += self.epoch_hits
+        self.misses += self.epoch_misses
+        self.epoch_hits = 0
+        self.epoch_misses = 0
+        self._verdicts = {}
+        self.epoch += 1
@@ -24,6 +24,23 @@ TOPICS = env_splitter(os.getenv("AS_TOPICS", default=""))
 TOPIC_HIGH = str(os.getenv("TOPIC_HIGH", ""))
 TOPIC_LOW = str(os.getenv("TOPIC_LOW", ""))
 TOPICS_USE_ADDITIONAL = get_bool(os.getenv("TOPICS_USE_ADDITIONAL", default="False"))
+# partitions of the request / response topics, messages are partitioned by victim.
+# workers of an AS that share CONSUMER_GROUP split the partitions and only analyse the victims of their partitions
+TOPIC_PARTITIONS = int(os.getenv("TOPIC_PARTITIONS", default=1))
+CONSUMER_GROUP = os.getenv("CONSUMER_GROUP", default="")
+# routing by digest: each AS publishes a bloom filter of its managed ips on DIGEST_TOPIC every DIGEST_PERIODS
+# analysis periods, requests are sent to each AS on its own topics (<topic>.<AS name>) with only the potential
+# attackers its digest contains. digests expire after DIGEST_TTL seconds. all ASes have to enable it
+DIGEST_ROUTING = get_bool(os.getenv("DIGEST_ROUTING", default="False"))
+DIGEST_TOPIC = str(os.getenv("DIGEST_TOPIC", default="digests"))
+DIGEST_PERIODS = int(os.getenv("DIGEST_PERIODS", default=12))
+# default: 3 digest intervals (ANALYSIS_PERIOD is read here as it is defined below)
+DIGEST_TTL = float(
+    os.getenv(
+        "DIGEST_TTL",
+        default=3 * DIGEST_PERIODS * float(os.getenv("ANALYSIS_PERIOD", default=0)),
+    )
+)
 
 AS_SIZE = int(os.getenv("AS_SIZE", default=0))
 SAMPLING_RATE = float(os.getenv("SAMPLING_RATE", default=1))
@@ -47,6 +64,110 @@ THRESHOLD_TRAFFIC_PROPORTIONALITY = int(
 )
 ANALYSIS_PERIOD = float(os.getenv("ANALYSIS_PERIOD", default=0))
 
+# runtime: max. packets taken from the queue at once, seconds the consumer waits for messages,
+# max. seconds for a graceful shutdown
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", default=1000))
+CONSUMER_POLL_TIMEOUT = float(os.getenv("CONSUMER_POLL_TIMEOUT", default=0.1))
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", default=30))
+
+# adaptive sampling (load shedding): the rate of the next period is multiplied by SAMPLING_DECREASE when more than
+# SAMPLING_TARGET_BACKLOG packets were queued or the analysis overran its period by more than SAMPLING_MAX_LAG seconds,
+# and raised by SAMPLING_INCREASE up to SAMPLING_RATE when both stayed below half of it.
+# the packet counts of each period are scaled by its rate before they are compared with the thresholds
+ADAPTIVE_SAMPLING = get_bool(os.getenv("ADAPTIVE_SAMPLING", default="False"))
+SAMPLING_MIN_RATE = float(os.getenv("SAMPLING_MIN_RATE", default=0.01))
+SAMPLING_TARGET_BACKLOG = int(os.getenv("SAMPLING_TARGET_BACKLOG", default=100_000))
+SAMPLING_MAX_LAG = float(os.getenv("SAMPLING_MAX_LAG", default=1))
+SAMPLING_DECREASE = float(os.getenv("SAMPLING_DECREASE", default=0.5))
+SAMPLING_INCREASE = float(os.getenv("SAMPLING_INCREASE", default=0.1))
+
+# checkpoints: the epoch state and the reputations are written to CHECKPOINT_DIR (disabled if empty)
+# every CHECKPOINT_PERIODS periods and on shutdown, the last CHECKPOINT_KEEP snapshots are kept.
+# on startup the latest snapshot is restored, its epoch state only if it is at most CHECKPOINT_MAX_AGE seconds old
+CHECKPOINT_DIR = os.getenv("CHECKPOINT_DIR", default="")
+CHECKPOINT_PERIODS = int(os.getenv("CHECKPOINT_PERIODS", default=12))
+CHECKPOINT_KEEP = int(os.getenv("CHECKPOINT_KEEP", default=3))
+CHECKPOINT_MAX_AGE = float(
+    os.getenv("CHECKPOINT_MAX_AGE", default=3 * CHECKPOINT_PERIODS * ANALYSIS_PERIOD)
+)
+
+# export: the traffic matrix (totals and top EXPORT_TOP_SOURCES sources per destination), detections, requests
+# and responses of each period are written to EXPORT_DIR (disabled if empty) as arrow IPC streams or parquet files
+# (EXPORT_FORMAT=arrow|parquet, requires pyarrow). EXPORT_BATCH_PERIODS periods are written as one batch,
+# new files are started every EXPORT_ROTATE_PERIODS periods, periods are dropped if EXPORT_QUEUE_SIZE are pending
+EXPORT_DIR = os.getenv("EXPORT_DIR", default="")
+EXPORT_FORMAT = os.getenv("EXPORT_FORMAT", default="arrow")
+EXPORT_TOP_SOURCES = int(os.getenv("EXPORT_TOP_SOURCES", default=10))
+EXPORT_BATCH_PERIODS = int(os.getenv("EXPORT_BATCH_PERIODS", default=12))
+EXPORT_ROTATE_PERIODS = int(os.getenv("EXPORT_ROTATE_PERIODS", default=720))
+EXPORT_QUEUE_SIZE = int(os.getenv("EXPORT_QUEUE_SIZE", default=64))
+
+# streaming detection: check victims while packets are collected instead of once per period
+STREAMING_DETECTION = get_bool(os.getenv("STREAMING_DETECTION", default="False"))
+# min. number of seconds between two early alarms for the same victim
+STREAMING_DEBOUNCE = float(os.getenv("STREAMING_DEBOUNCE", default=ANALYSIS_PERIOD))
+
+# request campaigns: number of periods without detection until the campaign of a victim ends
+CAMPAIGN_IDLE_PERIODS = int(os.getenv("CAMPAIGN_IDLE_PERIODS", default=2))
+# an attacker is sent again in a campaign when its packets increased by this factor
+CAMPAIGN_CHANGE_RATIO = float(os.getenv("CAMPAIGN_CHANGE_RATIO", default=2.0))
+
+# hierarchical heavy hitters: sources of a victim that are no heavy hitters on their own (THRESHOLD_SRC_1)
+# are aggregated per prefix, prefixes with at least HHH_THRESHOLD packets from HHH_MIN_SOURCES sources
+# are sent in the requests instead of their sources (longest prefixes first)
+HHH_ENABLED = get_bool(os.getenv("HHH_ENABLED", default="False"))
+HHH_PREFIXES_V4 = [
+    int(p) for p in env_splitter(os.getenv("HHH_PREFIXES_V4", default="24,16"))
+]
+HHH_PREFIXES_V6 = [
+    int(p) for p in env_splitter(os.getenv("HHH_PREFIXES_V6", default="64,48"))
+]
+HHH_THRESHOLD = float(os.getenv("HHH_THRESHOLD", default=THRESHOLD_SRC_2))
+HHH_MIN_SOURCES = int(os.getenv("HHH_MIN_SOURCES", default=4))
+
+# confirmed attackers (FOUND responses to own requests): their packets to the victim are only counted and kept out
+# of the traffic tables. only used with a blocking MITIGATION and for ASes with a reputation above ATTACKER_MIN_REPUTATION
+ATTACKER_FAST_PATH = get_bool(os.getenv("ATTACKER_FAST_PATH", default="False"))
+ATTACKER_MIN_REPUTATION = float(os.getenv("ATTACKER_MIN_REPUTATION", default=0.5))
+# periods a confirmed attacker is kept after its last confirmation, max. number of confirmed attackers
+ATTACKER_TTL_PERIODS = int(os.getenv("ATTACKER_TTL_PERIODS", default=6))
+ATTACKER_MAX_ENTRIES = int(os.getenv("ATTACKER_MAX_ENTRIES", default=100_000))
+
+# collaboration state (requests, responses): seconds until entries expire and max. entries (in total, per AS)
+STATE_TTL = float(os.getenv("STATE_TTL", default=600))
+STATE_MAX_ENTRIES = int(os.getenv("STATE_MAX_ENTRIES", default=100_000))
+STATE_MAX_ENTRIES_PER_AS = int(os.getenv("STATE_MAX_ENTRIES_PER_AS", default=10_000))
+# seconds until the reputation of an AS without any response is reset
+REPUTATION_TTL = float(os.getenv("REPUTATION_TTL", default=86_400))
+
+# mitigation: none, nftables or ipset. the blocklist changes are written to BLOCKLIST_PATH.<number>
+# and applied with nft / ipset if BLOCKLIST_APPLY is set
+MITIGATION = os.getenv("MITIGATION", default="none")
+BLOCKLIST_PATH = os.getenv("BLOCKLIST_PATH", default="../mitigation/blocklist")
+BLOCKLIST_APPLY = get_bool(os.getenv("BLOCKLIST_APPLY", default="False"))
+# seconds an ip stays blocked after it was reported the last time
+BLOCK_TTL = float(os.getenv("BLOCK_TTL", default=300))
+# min. seconds between two changes of the blocklist
+BLOCK_FLUSH_INTERVAL = float(os.getenv("BLOCK_FLUSH_INTERVAL", default=1))
+BLOCKLIST_MAX_ENTRIES = int(os.getenv("BLOCKLIST_MAX_ENTRIES", default=1_000_000))
+# number of diffs after which the full blocklist is written again (and the older diffs are removed)
+BLOCKLIST_SNAPSHOT_DIFFS = int(os.getenv("BLOCKLIST_SNAPSHOT_DIFFS", default=100))
+
+# metrics in the Prometheus text format on http://METRICS_ADDRESS:METRICS_PORT/metrics (0 = disabled)
+METRICS_ADDRESS = os.getenv("METRICS_ADDRESS", default="127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", default=0))
+
+# profiling: stage timers (switchable at runtime with SIGUSR2), sampling profiler (started with SIGUSR1 or /profile)
+STAGE_TIMERS = get_bool(os.getenv("STAGE_TIMERS", default="False"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", default=0.01))
+PROFILE_DURATION = float(os.getenv("PROFILE_DURATION", default=30))
+PROFILE_DIR = os.getenv("PROFILE_DIR", default="../logs/profiles")
+
+# logging: max. records per call site (0 = no limit) in each interval of LOG_RATE_INTERVAL seconds,
+# only below ERROR and for the loggers of ch2tf (not for libraries)
+LOG_RATE_INTERVAL = float(os.getenv("LOG_RATE_INTERVAL", default=10))
+LOG_RATE_BURST = int(os.getenv("LOG_RATE_BURST", default=10))
+
 # for attack evaluation:
 MANAGED_IPS_PATH = os.getenv("MANAGED_IPS_PATH", default="")
 EVAL_SIMULATED_ATK_TRAFFIC_PATH = os.getenv("EVAL_SIMULATED_ATK_TRAFFIC_PATH")
@@ -58,3 +179,6 @@ ILLEGITIMATE_TRAFFIC_INTERVAL = float(
 )
 
 USE_HASH = get_bool(os.getenv("USE_HASH", default="True"))
+# hashed mode with prefix-preserving pseudonyms instead of sha3 hashes, the key has to be shared by all ASes.
+# required to aggregate the sources per prefix (HHH_ENABLED) in hashed mode
+PSEUDONYM_KEY = os.getenv("PSEUDONYM_KEY", default="")
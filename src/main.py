@@ -1,14 +1,24 @@
 from multiprocessing import Process, Queue
+import asyncio
+import signal
 import time
 import os
 import kafka
-from ch2tf import CH2TF
-from threading import Thread
 
-from src.ch2tf import HeavyHitterAnalysis, DDoSAttackAnalysis
+# all imports through src, modules imported through another root are loaded a second time (other classes)
+from src.ch2tf import (
+    CH2TF,
+    HeavyHitterAnalysis,
+    DDoSAttackAnalysis,
+    CH2TFRuntime,
+    SampledQueue,
+)
 from src.traffic import Sniffer, TrafficGenerator
-from src.config import KAFKA
-from src.mitigation import NoMitigation
+from src.config import KAFKA, METRICS_ADDRESS, METRICS_PORT
+from src.util.metrics import start_metrics_server
+from src.util.profiling import SamplingProfiler
+from src.util.logs import setup_async_logging
+from src.mitigation import create_mitigation
 import logging
 from logging.handlers import RotatingFileHandler
 
@@ -39,14 +49,14 @@ if __name__ == "__main__":
     # create logging dir if it does not exist
     if not os.path.exists("../logs"):
         os.makedirs("../logs")
-    # logging setup & config => log to files and console
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - [%(levelname)s] - %(message)s",
-        handlers=[
+    # logging setup & config => log to files and console,
+    # written by a background thread such that logging does not block the analysis and the listener
+    setup_async_logging(
+        [
             logging.StreamHandler(),
             RotatingFileHandler("../logs/log.log", backupCount=10, maxBytes=1_000_000),
         ],
+        level=logging.INFO,
     )
     log.info('starting...')
     kafka_logger = logging.getLogger("kafka")
@@ -54,15 +64,23 @@ if __name__ == "__main__":
     # upon startup kafka and zookeeper might not be ready yet,
     # check their continue and continue only when services are ready
     check_kafka_conn()
+    # profiles are started with SIGUSR1 or on /profile?seconds=N, SIGUSR2 switches the stage timers
+    profiler = SamplingProfiler()
+    profiler.install_signal_handlers()
+    if METRICS_PORT:
+        start_metrics_server(
+            METRICS_ADDRESS, METRICS_PORT, routes={"/profile": profiler.route}
+        )
 
     # queue is used to pass packets.
     # cannot use pipe here, since for attack evaluation, there are multiple senders, which pipe does not support.
-    queue: Queue = Queue()
+    # packets are sampled before they are queued, at the rate of the current period
+    queue = SampledQueue(Queue())
     traffic_gen = TrafficGenerator(queue)
     sniffer = Sniffer(queue)
     ch2tf = CH2TF(
         queue=queue,
-        mitigation=NoMitigation(),
+        mitigation=create_mitigation(),
         attacker_analysis=HeavyHitterAnalysis(),
         attack_analysis=DDoSAttackAnalysis(),
     )
@@ -76,24 +94,35 @@ if __name__ == "__main__":
     )
     p_sniff_traffic = Process(target=sniffer.start_sniffing, args=())
 
-    # ch2tf threads
-    t1 = Thread(target=ch2tf.collect_packages, args=())
-    t2 = Thread(target=ch2tf.listen, args=())
-    t3 = Thread(target=ch2tf.run_analysis, args=())
+    # ch2tf tasks: ingestion, periodic analysis and the consumer on one event loop
+    runtime = CH2TFRuntime(ch2tf)
+
+    async def evaluation() -> None:
+        # for eval only: stop the attack after 1000s and the normal traffic 1000s later
+        await asyncio.sleep(1000)
+        log.info("stopping attack after 1000s")
+        p_read_simulated_atk_traffic.kill()
+        await asyncio.sleep(1000)
+        log.info("stopping normal traffic")
+        p_read_simulated_traffic.kill()
+        runtime.stop()
 
-    t1.start()
-    t2.start()
-    t3.start()
+    async def run() -> None:
+        loop = asyncio.get_running_loop()
+        # SIGINT / SIGTERM drain the queue, analyse a last time and flush the producer before exiting
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, runtime.stop)
+        evaluation_task = asyncio.create_task(evaluation())
+        await runtime.run()
+        evaluation_task.cancel()
 
     # for eval only
     p_read_simulated_traffic.start()
     p_read_simulated_atk_traffic.start()
     # p_sniff_traffic.start()
 
-    time.sleep(1000)
-    log.info("stopping attack after 1000s")
-    p_read_simulated_atk_traffic.kill()
-    time.sleep(1000)
-    log.info("stopping normal traffic")
-    p_read_simulated_traffic.kill()
+    asyncio.run(run())
+    for process in (p_read_simulated_traffic, p_read_simulated_atk_traffic):
+        if process.is_alive():
+            process.kill()
     log.info("done")
@@ -1 +1,8 @@
 from .mitigation import NoMitigation, Mitigation
+from .blocklist import (
+    BlocklistMitigation,
+    RulesetWriter,
+    NftablesWriter,
+    IpsetWriter,
+    create_mitigation,
+)
@@ -0,0 +1,476 @@
+import ipaddress
+import logging
+import os
+import subprocess
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Sequence, Set, Tuple
+
+from src.config import (
+    MITIGATION,
+    BLOCKLIST_PATH,
+    BLOCKLIST_APPLY,
+    BLOCK_TTL,
+    BLOCK_FLUSH_INTERVAL,
+    BLOCKLIST_MAX_ENTRIES,
+    BLOCKLIST_SNAPSHOT_DIFFS,
+    USE_HASH,
+)
+from src.util.metrics import REGISTRY
+from .mitigation import Mitigation, NoMitigation
+
+log = logging.getLogger("Mitigation")
+
+Network = ipaddress.IPv4Network | ipaddress.IPv6Network
+
+_entries = REGISTRY.gauge("ch2tf_blocklist_entries", "Active entries of the blocklist.")
+_changes = REGISTRY.counter(
+    "ch2tf_blocklist_changes_total",
+    "Entries added to / removed from the blocklist.",
+    ("change",),
+)
+_rejected = REGISTRY.counter(
+    "ch2tf_blocklist_rejected_total",
+    "Addresses that were not blocked.",
+    ("reason",),
+)
+_apply_errors = REGISTRY.counter(
+    "ch2tf_blocklist_apply_errors_total",
+    "Blocklist files that could not be applied.",
+)
+
+
+def split_families(ips: Iterable[str]) -> Tuple[List[str], List[str]]:
+    """
+    :param ips: valid IPv4 / IPv6 addresses or prefixes
+    :type ips: Iterable[str]
+    :return: sorted IPv4 and IPv6 addresses / prefixes
+    :rtype: Tuple[List[str], List[str]]
+    """
+    v4, v6 = [], []
+    for ip in ips:
+        (v6 if ":" in ip else v4).append(ip)
+    return sorted(v4), sorted(v6)
+
+
+def _chunks(items: Sequence[str], size: int) -> Iterable[Sequence[str]]:
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def _write_atomic(path: str, content: str) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, mode="w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+
+class RulesetWriter(ABC):
+    """
+    Compiles changes of the blocklist into a ruleset file and optionally applies it.
+    """
+
+    # command the file is applied with, the path is appended
+    apply_command: Sequence[str] = ()
+
+    def __init__(self, path: str, apply: bool = False):
+        """
+        :param path: the changes are written to numbered files <path>.<sequence>, the snapshot to <path>.full
+        :type path: str
+        :param apply: whether the written file is applied with apply_command
+        :type apply: bool
+        """
+        self.path = path
+        self.snapshot_path = f"{path}.full"
+        self.apply = apply
+        # number of the last diff
+        self.sequence = 0
+
+    @abstractmethod
+    def compile_diff(self, added: Iterable[str], removed: Iterable[str]) -> str:
+        raise NotImplementedError
+
+    @abstractmethod
+    def compile_snapshot(self, active: Iterable[str]) -> str:
+        raise NotImplementedError
+
+    def diff_path(self, sequence: int) -> str:
+        return f"{self.path}.{sequence:08d}"
+
+    def diff_paths(self) -> List[str]:
+        """
+        :return: the diffs written since the last snapshot, i.e. the snapshot and the diffs applied in this order
+            give the current blocklist
+        :rtype: List[str]
+        """
+        directory, name = os.path.split(self.path)
+        try:
+            files = os.listdir(directory or ".")
+        except FileNotFoundError:
+            return []
+        diffs = {
+            int(file[len(name) + 1 :]): os.path.join(directory, file)
+            for file in files
+            if file.startswith(f"{name}.") and file[len(name) + 1 :].isdigit()
+        }
+        return [diffs[sequence] for sequence in sorted(diffs)]
+
+    def write_diff(self, added: Iterable[str], removed: Iterable[str]) -> bool:
+        """
+        Writes the changes to the next numbered file, i.e. diffs that have not been applied yet are not overwritten.
+        :return: whether the diff has been applied (or applying is disabled)
+        :rtype: bool
+        """
+        self.sequence += 1
+        path = self.diff_path(self.sequence)
+        _write_atomic(path, self.compile_diff(added, removed))
+        return self._apply(path)
+
+    def write_snapshot(self, active: Iterable[str], apply: bool = True) -> bool:
+        """
+        Writes the full blocklist and removes the diffs it contains.
+        :param active: blocked ips
+        :type active: Iterable[str]
+        :param apply: whether the snapshot is applied, i.e. replaces the blocked entries
+        :type apply: bool
+        :return: whether the snapshot has been applied (or is not applied)
+        :rtype: bool
+        """
+        _write_atomic(self.snapshot_path, self.compile_snapshot(active))
+        applied = self._apply(self.snapshot_path) if apply else True
+        for path in self.diff_paths():
+            os.remove(path)
+        return applied
+
+    def _apply(self, path: str) -> bool:
+        """
+        :param path: file to apply
+        :type path: str
+        :return: whether the file has been applied (or applying is disabled)
+        :rtype: bool
+        """
+        if not self.apply:
+            return True
+        result = subprocess.run(
+            [*self.apply_command, path], capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            # the whole file is rejected, e.g. nft applies it as one transaction
+            _apply_errors.labels().inc()
+            log.error("applying %s failed: %s", path, result.stderr.strip())
+            return False
+        return True
+
+
+class NftablesWriter(RulesetWriter):
+    """
+    Writes nft scripts (`nft -f <path>`): a table with one set per address family that drops the traffic
+    of its elements, and incremental `add element` / `delete element` statements.
+    The elements of interval sets must not overlap, BlocklistMitigation replaces the entries covered by a prefix.
+    """
+
+    apply_command = ("nft", "-f")
+
+    def __init__(
+        self,
+        path: str,
+        apply: bool = False,
+        table: str = "ch2tf",
+        set_name: str = "blocklist",
+        chunk_size: int = 4096,
+    ):
+        super().__init__(path, apply)
+        self.table = table
+        self.set_name = set_name
+        self.chunk_size = chunk_size
+
+    def _elements(self, statement: str, ips: Iterable[str]) -> List[str]:
+        lines = []
+        for suffix, family in zip(("4", "6"), split_families(ips)):
+            for chunk in _chunks(family, self.chunk_size):
+                lines.append(
+                    f"{statement} element inet {self.table} {self.set_name}{suffix} "
+                    f"{{ {', '.join(chunk)} }}"
+                )
+        return lines
+
+    def compile_diff(self, added: Iterable[str], removed: Iterable[str]) -> str:
+        lines = self._elements("delete", removed) + self._elements("add", added)
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def compile_snapshot(self, active: Iterable[str]) -> str:
+        lines = [
+            f"table inet {self.table}",
+            f"delete table inet {self.table}",
+            f"table inet {self.table} {{",
+            f"    set {self.set_name}4 {{ type ipv4_addr; flags interval; }}",
+            f"    set {self.set_name}6 {{ type ipv6_addr; flags interval; }}",
+            "    chain prerouting {",
+            "        type filter hook prerouting priority -300; policy accept;",
+            f"        ip saddr @{self.set_name}4 drop",
+            f"        ip6 saddr @{self.set_name}6 drop",
+            "    }",
+            "}",
+        ]
+        return "\n".join(lines + self._elements("add", active)) + "\n"
+
+
+class IpsetWriter(RulesetWriter):
+    """
+    Writes ipset restore files (`ipset restore -f <path>`) with one hash:net set per address family.
+    """
+
+    apply_command = ("ipset", "restore", "-f")
+
+    def __init__(
+        self, path: str, apply: bool = False, set_name: str = "ch2tf-blocklist"
+    ):
+        super().__init__(path, apply)
+        self.set_name = set_name
+
+    def _lines(self, command: str, ips: Iterable[str]) -> List[str]:
+        return [
+            f"{command} {self.set_name}{suffix} {ip} -exist"
+            for suffix, family in zip(("4", "6"), split_families(ips))
+            for ip in family
+        ]
+
+    def compile_diff(self, added: Iterable[str], removed: Iterable[str]) -> str:
+        lines = self._lines("del", removed) + self._lines("add", added)
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def compile_snapshot(self, active: Iterable[str]) -> str:
+        lines = []
+        for suffix, family in (("4", "inet"), ("6", "inet6")):
+            lines.append(
+                f"create {self.set_name}{suffix} hash:net family {family} -exist"
+            )
+            lines.append(f"flush {self.set_name}{suffix}")
+        return "\n".join(lines + self._lines("add", active)) + "\n"
+
+
+class BlocklistMitigation(Mitigation):
+    """
+    Blocks the filtered ips for a limited time.
+    Calls of filter_ips are de-duplicated and coalesced: the ips are collected and the blocklist is only
+    changed on flush, at most every flush_interval seconds (and at the end of each analysis period).
+    Each flush writes the added and expired entries as a diff, i.e. unchanged entries cause no rule churn.
+    Every snapshot_diffs diffs, the full blocklist is written again as snapshot (and applied if a diff has not been
+    applied since the last one).
+    The ips must be addresses or prefixes (HHH_ENABLED), i.e. USE_HASH must be disabled.
+    Entries do not overlap: entries covered by a blocked prefix are not added, entries covered by an added prefix
+    are removed (they are blocked by the prefix).
+    """
+
+    # the filtered ips are blocked (Mitigation.active), the blocked ips are kept in _expiry
+    active = True
+
+    def __init__(
+        self,
+        writer: RulesetWriter,
+        ttl: float = BLOCK_TTL,
+        flush_interval: float = BLOCK_FLUSH_INTERVAL,
+        max_entries: int = BLOCKLIST_MAX_ENTRIES,
+        snapshot_diffs: int = BLOCKLIST_SNAPSHOT_DIFFS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        :param writer: writes the changes as a ruleset
+        :type writer: RulesetWriter
+        :param ttl: seconds an ip is blocked after it was filtered the last time
+        :type ttl: float
+        :param flush_interval: min. seconds between two flushes triggered by filter_ips
+        :type flush_interval: float
+        :param max_entries: max. number of blocked ips
+        :type max_entries: int
+        :param snapshot_diffs: number of diffs after which the snapshot is written again
+        :type snapshot_diffs: int
+        :param clock: returns the current time in seconds
+        :type clock: Callable[[], float]
+        """
+        self.writer = writer
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.max_entries = max_entries
+        self.snapshot_diffs = snapshot_diffs
+        self.clock = clock
+        # blocked ip -> expiry
+        self._expiry: Dict[str, float] = {}
+        # blocked prefix -> network
+        self._prefixes: Dict[str, Network] = {}
+        self._pending: Set[str] = set()
+        self._last_flush = clock()
+        self._lock = threading.Lock()
+        # diffs since the last snapshot, whether all of them have been applied
+        self._diffs = 0
+        self._applied = self.writer.write_snapshot(())
+
+    def filter_ip(self, ip: str):
+        self.filter_ips([ip])
+
+    def filter_ips(self, ip_list: List[str]):
+        with self._lock:
+            self._pending.update(ip_list)
+            if self.clock() - self._last_flush < self.flush_interval:
+                return
+        self.flush()
+
+    def refresh(self, ip_list: Iterable[str]) -> None:
+        """
+        Blocked ips (and prefixes) expire ttl seconds from now again, without a change of the ruleset.
+        :param ip_list: ips that are still attacking
+        :type ip_list: Iterable[str]
+        :return: None
+        """
+        with self._lock:
+            expiry = self.clock() + self.ttl
+            for ip in ip_list:
+                if ip in self._expiry:
+                    self._expiry[ip] = expiry
+
+    def flush(self) -> None:
+        """
+        Applies the pending ips and removes the expired ones.
+        :return: None
+        """
+        with self._lock:
+            now = self.clock()
+            self._last_flush = now
+            pending, self._pending = self._pending, set()
+            added = []
+            for ip in pending:
+                if ip not in self._expiry:
+                    ip = self._normalize(ip)  # type: ignore
+                    if ip is None:
+                        continue
+                    if ip not in self._expiry:
+                        if len(self._expiry) >= self.max_entries:
+                            _rejected.labels("full").inc()
+                            continue
+                        added.append(ip)
+                        if "/" in ip:
+                            self._prefixes[ip] = ipaddress.ip_network(ip)
+                self._expiry[ip] = now + self.ttl
+            covered = self._covered(added)
+            for ip in covered:
+                del self._expiry[ip]
+                self._prefixes.pop(ip, None)
+            new = set(added)
+            added = [ip for ip in added if ip not in covered]
+            removed = [ip for ip in covered if ip not in new]
+            expired = [ip for ip, expiry in self._expiry.items() if expiry <= now]
+            for ip in expired:
+                del self._expiry[ip]
+                self._prefixes.pop(ip, None)
+            removed += expired
+            if not added and not removed:
+                return
+            self._applied &= self.writer.write_diff(added, removed)
+            self._diffs += 1
+            if self._diffs >= self.snapshot_diffs:
+                # a failed diff leaves the ruleset inconsistent, the snapshot replaces it
+                self._applied = self.writer.write_snapshot(
+                    self._expiry, apply=not self._applied
+                )
+                self._diffs = 0
+        _changes.labels("add").inc(len(added))
+        _changes.labels("remove").inc(len(removed))
+        _entries.labels().set(len(self._expiry))
+        log.info(
+            "blocklist: %s added, %s removed, %s active",
+            len(added),
+            len(removed),
+            len(self._expiry),
+        )
+
+    def _normalize(self, ip: str) -> str | None:
+        """
+        :param ip: address or prefix
+        :type ip: str
+        :return: the address, or the prefix with its network address, None if it is invalid
+        :rtype: str | None
+        """
+        try:
+            network = ipaddress.ip_network(ip, strict=False)
+        except ValueError:
+            _rejected.labels("invalid").inc()
+            return None
+        if network.prefixlen == network.max_prefixlen:
+            return str(network.network_address)
+        return str(network)
+
+    def _covered(self, added: List[str]) -> Set[str]:
+        """
+        :param added: entries that are added to the blocklist (already in _expiry)
+        :type added: List[str]
+        :return: blocked entries that are covered by another blocked prefix and involve an added entry
+        :rtype: Set[str]
+        """
+        if not self._prefixes:
+            return set()
+        covered = set()
+        for ip in added:
+            network = self._prefixes.get(ip)
+            if network is not None:
+                # blocked entries in the added prefix
+                for other in self._expiry:
+                    if other != ip and _is_subnet(other, network, self._prefixes):
+                        covered.add(other)
+            # blocked prefixes that contain the added entry
+            if any(
+                prefix != ip and _is_subnet(ip, other_network, self._prefixes)
+                for prefix, other_network in self._prefixes.items()
+            ):
+                covered.add(ip)
+        return covered
+
+
+def _is_subnet(ip: str, network: Network, prefixes: Dict[str, Network]) -> bool:
+    """
+    :param ip: normalized address or prefix
+    :type ip: str
+    :param network: prefix
+    :type network: Network
+    :param prefixes: prefix -> network, for the prefixes that have already been parsed
+    :type prefixes: Dict[str, Network]
+    :return: whether ip is in the network
+    :rtype: bool
+    """
+    other = prefixes.get(ip) or ipaddress.ip_network(ip)
+    return other.version == network.version and other.subnet_of(network)  # type: ignore
+
+
+def create_mitigation(
+    name: str = MITIGATION,
+    path: str = BLOCKLIST_PATH,
+    apply: bool = BLOCKLIST_APPLY,
+    use_hash: bool = USE_HASH,
+) -> Mitigation:
+    """
+    :param name: none, nftables or ipset
+    :type name: str
+    :param path: file the blocklist changes are written to
+    :type path: str
+    :param apply: whether the written files are applied (requires nft / ipset and privileges)
+    :type apply: bool
+    :param use_hash: whether the ips are hashed / pseudonymized, not allowed with a blocklist
+    :type use_hash: bool
+    :return: the configured mitigation
+    :rtype: Mitigation
+    """
+    if use_hash and name.lower() in ("nftables", "ipset"):
+        # pseudonyms (PSEUDONYM_KEY) are valid addresses, i.e. unrelated hosts would be blocked
+        raise ValueError(f"mitigation {name} requires USE_HASH=False")
+    match name.lower():
+        case "nftables":
+            return BlocklistMitigation(NftablesWriter(path, apply))
+        case "ipset":
+            return BlocklistMitigation(IpsetWriter(path, apply))
+        case "none" | "":
+            return NoMitigation()
+        case _:
+            raise ValueError(f"unknown mitigation: {name}")
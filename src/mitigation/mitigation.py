@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Iterable, List
 import logging
 
 log = logging.getLogger("Mitigation")
@@ -10,6 +10,9 @@ class Mitigation(ABC):
     Abstract class to filter IPs to achieve DDoS mitigation.
     """
 
+    # whether the filtered ips are actually blocked
+    active: bool = False
+
     @abstractmethod
     def filter_ips(self, ip_list: List[str]):
         pass
@@ -18,6 +21,19 @@ class Mitigation(ABC):
     def filter_ip(self, ip: str):
         pass
 
+    def refresh(self, ip_list: Iterable[str]) -> None:
+        """
+        Extends the filters of ips that are still filtered, ips that are not filtered are ignored.
+        Called each period with the sources of the ongoing attacks.
+        """
+        pass
+
+    def flush(self) -> None:
+        """
+        Applies filters that have been deferred, called at the end of each analysis period.
+        """
+        pass
+
 
 class NoMitigation(Mitigation):
     """
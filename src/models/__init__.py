@@ -1,3 +1,5 @@
 from src.models.packet_data import PacketData
 from src.models.collab_response import DefenseCollaborationResponseData
 from src.models.collab_request import DefenseCollaborationRequestData
+from src.models.detection import Detection
+from src.models.managed_digest import ManagedSpaceDigest
@@ -19,3 +19,5 @@ class DefenseCollaborationRequestData:
     request_detection: DetectionEnum
     request_id: str = field(default_factory=lambda: str(uuid.uuid4()))
     request_originator: str = os.getenv("AS_NAME", default="")
+    # stable id for all requests of the same victim, see CampaignManager
+    campaign_id: str = ""
@@ -0,0 +1,20 @@
+from dataclasses import dataclass, field
+from typing import List
+
+from src.enums import DetectionEnum
+
+
+@dataclass
+class Detection:
+    """
+    Potential victim detected in an analysis period.
+    """
+
+    victim: str
+    detection_case: DetectionEnum
+    # num. packets (THRESHOLD) or traffic increase (TRAFFIC_INCREASE)
+    ratio: float
+    # num. packets to the victim in the period
+    packets: int
+    # prefixes that are requested instead of their sources (HHH_ENABLED)
+    prefixes: List[str] = field(default_factory=list)
@@ -0,0 +1,14 @@
+from dataclasses import dataclass
+from dataclasses_json import dataclass_json
+
+
+@dataclass_json
+@dataclass
+class ManagedSpaceDigest:
+    """
+    Compact summary of the address space an AS manages, published on the digest topic
+    """
+
+    as_name: str
+    # serialized bloom filter of the managed ips, see src.ch2tf.digests
+    bloom_filter: str
@@ -0,0 +1,9 @@
+from .broker import InMemoryBroker, InMemoryProducer, InMemoryConsumer
+from .clock import VirtualClock
+from .simulation import Simulation, SimulationResult, SimulatedAS, EpochRecord
+from .traffic import (
+    TrafficEvent,
+    synthetic_traffic,
+    synthetic_managed_ips,
+    pcap_traffic,
+)
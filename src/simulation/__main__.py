@@ -0,0 +1,157 @@
+"""
+Runs a multi-AS scenario in one process on a virtual clock and prints the results as JSON.
+
+    python -m src.simulation --ases 3 --duration 1800 --attack-start 600
+    python -m src.simulation --pcap as0=AS_0_traffic.pcap --managed as0=AS_0_managed_ip.txt ...
+    python -m src.simulation --pcap as0=capture.pcap --timeline timeline.jsonl
+    python -m src.simulation --workload --hosts 10000 --rate 100000 --attack-rate 1000000
+"""
+
+import argparse
+import heapq
+import logging
+import sys
+from typing import Tuple
+
+import numpy as np
+
+from src.config import ANALYSIS_PERIOD
+from .simulation import Simulation, SimulationResult
+from .traffic import synthetic_managed_ips, synthetic_traffic, pcap_traffic
+from src.traffic.workload import (
+    AddressSpace,
+    WorkloadGenerator,
+    ZipfLegitimateTraffic,
+    VolumetricFlood,
+)
+
+
+def _named_paths(values: list) -> dict:
+    return dict(value.split("=", 1) for value in values)
+
+
+def main(argv: list | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m src.simulation")
+    parser.add_argument("--ases", type=int, default=3, help="number of synthetic ASes")
+    parser.add_argument("--hosts", type=int, default=1000, help="addresses per AS")
+    parser.add_argument("--duration", type=float, default=1800)
+    parser.add_argument("--rate", type=float, default=200, help="legitimate pkts/s")
+    parser.add_argument("--attack-start", type=float, default=600)
+    parser.add_argument("--attack-duration", type=float, default=600)
+    parser.add_argument("--attack-rate", type=float, default=2000, help="pkts/s")
+    parser.add_argument("--attackers", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--analysis-period", type=float, default=ANALYSIS_PERIOD, help="seconds"
+    )
+    parser.add_argument(
+        "--pcap", action="append", default=[], help="AS=path, replays pcaps instead"
+    )
+    parser.add_argument(
+        "--managed", action="append", default=[], help="AS=path of managed ips"
+    )
+    parser.add_argument(
+        "--workload",
+        action="store_true",
+        help="generates the synthetic traffic as vectorized batches (for high rates)",
+    )
+    parser.add_argument("--output", help="file to write the results to")
+    parser.add_argument(
+        "--timeline", help="file to write the per-epoch detections to (JSON lines)"
+    )
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level)
+
+    if args.workload:
+        simulation, result = _run_workload(args)
+    else:
+        simulation, result = _run_traffic(args)
+    _write(result.to_json(), args.output)
+    if args.timeline:
+        simulation.write_timeline(args.timeline)
+
+
+def _run_traffic(args: argparse.Namespace) -> Tuple[Simulation, SimulationResult]:
+    if args.pcap:
+        managed_ips = {}
+        for as_name, path in _named_paths(args.managed).items():
+            with open(path, mode="r", encoding="utf-8") as f:
+                managed_ips[as_name] = [line.rstrip("\n") for line in f]
+        pcaps = _named_paths(args.pcap)
+        for as_name in pcaps:
+            managed_ips.setdefault(as_name, [])
+        traffic = heapq.merge(
+            *(pcap_traffic(path, as_name) for as_name, path in pcaps.items())
+        )
+        duration = None
+    else:
+        as_names = [f"as{i}" for i in range(args.ases)]
+        managed_ips = synthetic_managed_ips(as_names, args.hosts)
+        traffic = synthetic_traffic(
+            managed_ips,
+            duration=args.duration,
+            rate=args.rate,
+            victim_as=as_names[0],
+            attack_start=args.attack_start,
+            attack_duration=args.attack_duration,
+            attack_rate=args.attack_rate,
+            attackers=args.attackers,
+            seed=args.seed,
+        )
+        duration = args.duration
+
+    simulation = Simulation(
+        managed_ips, analysis_period=args.analysis_period, seed=args.seed
+    )
+    result = simulation.run(
+        traffic,
+        duration=duration,
+        attack_start=None if args.pcap else args.attack_start,
+    )
+    return simulation, result
+
+
+def _run_workload(args: argparse.Namespace) -> Tuple[Simulation, SimulationResult]:
+    space = AddressSpace([f"as{i}" for i in range(args.ases)], args.hosts)
+    hosts = np.concatenate([space.managed(as_name) for as_name in space.as_names])
+    rng = np.random.default_rng(args.seed)
+    attackers = rng.choice(
+        np.concatenate([space.managed(as_name) for as_name in space.as_names[1:]]),
+        args.attackers,
+    )
+    generator = WorkloadGenerator(
+        [
+            ZipfLegitimateTraffic(hosts, hosts, rate=args.rate),
+            VolumetricFlood(
+                attackers,
+                int(space.managed(space.as_names[0])[0]),
+                rate=args.attack_rate,
+                start=args.attack_start,
+                end=args.attack_start + args.attack_duration,
+            ),
+        ],
+        seed=args.seed,
+    )
+    simulation = Simulation(
+        space.managed_ips(),
+        analysis_period=args.analysis_period,
+        seed=args.seed,
+        use_hash=False,
+    )
+    result = simulation.run_workload(
+        generator, space, args.duration, attack_start=args.attack_start
+    )
+    return simulation, result
+
+
+def _write(output: str, path: str | None) -> None:
+    if path:
+        with open(path, mode="w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        sys.stdout.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
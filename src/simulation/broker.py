@@ -0,0 +1,297 @@
+import logging
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterator, List, Set, Tuple
+
+from kafka import ConsumerRebalanceListener
+from kafka.consumer.fetcher import ConsumerRecord
+from kafka.structs import TopicPartition
+
+from src.util import partition_for
+from src.util.jsonSerializer import json_serializer, json_deserializer
+
+log = logging.getLogger("broker")
+
+
+class SentFuture:
+    """
+    Result of InMemoryProducer.send, offers the callback surface of kafka's FutureRecordMetadata.
+    The message is delivered synchronously, therefore callbacks are called immediately.
+    """
+
+    def __init__(
+        self, record: ConsumerRecord | None = None, error: Exception | None = None
+    ):
+        self.record = record
+        self.error = error
+
+    def add_callback(self, f: Callable, *args, **kwargs) -> "SentFuture":
+        if self.error is None:
+            f(*args, self.record, **kwargs)
+        return self
+
+    def add_errback(self, f: Callable, *args, **kwargs) -> "SentFuture":
+        if self.error is not None:
+            f(*args, self.error, **kwargs)
+        return self
+
+    def get(self, timeout: float | None = None) -> ConsumerRecord | None:
+        if self.error is not None:
+            raise self.error
+        return self.record
+
+
+class InMemoryBroker:
+    """
+    In-memory stand-in for the kafka broker, used to run multiple CH2TF instances in one process.
+    Topics are created on first use and keep all messages in an append-only log per partition.
+    Consumers with a group id share the partitions of their topics (range assignment, like kafka's default)
+    and continue from the offsets committed by the group.
+    """
+
+    def __init__(self, clock: Callable[[], float], partitions: int = 1):
+        """
+        :param clock: returns the current (virtual) time in seconds, used as message timestamp
+        :type clock: Callable[[], float]
+        :param partitions: partitions of each topic
+        :type partitions: int
+        """
+        self.clock = clock
+        self.partitions = partitions
+        self.logs: Dict[TopicPartition, List[ConsumerRecord]] = defaultdict(list)
+        self.sent: Dict[str, int] = defaultdict(int)
+        # group id -> members in the order they joined
+        self.groups: Dict[str, List["InMemoryConsumer"]] = defaultdict(list)
+        # (group id, topic partition) -> next offset to read
+        self.committed: Dict[Tuple[str, TopicPartition], int] = {}
+
+    def topics(self) -> set:
+        return {tp.topic for tp in self.logs}
+
+    def partitions_for(self, topic: str) -> List[TopicPartition]:
+        return [TopicPartition(topic, p) for p in range(self.partitions)]
+
+    def append(
+        self,
+        topic: str,
+        key: bytes | None,
+        value: bytes,
+        partition: int | None = None,
+    ) -> ConsumerRecord:
+        """
+        Appends a serialized message to the log of the topic.
+
+        :param topic: topic of the message
+        :type topic: str
+        :param key: message key
+        :type key: bytes | None
+        :param value: serialized message
+        :type value: bytes
+        :param partition: partition of the message, by default derived from the key (partition 0 without key)
+        :type partition: int | None
+        :return: the stored record
+        :rtype: ConsumerRecord
+        """
+        if partition is None:
+            partition = partition_for(key, self.partitions) if key else 0
+        tp = self.partitions_for(topic)[partition]
+        partition_log = self.logs[tp]
+        record = ConsumerRecord(
+            topic=topic,
+            partition=tp.partition,
+            offset=len(partition_log),
+            timestamp=int(self.clock() * 1000),
+            timestamp_type=0,
+            key=key,
+            value=value,
+            headers=[],
+            checksum=None,
+            serialized_key_size=len(key) if key is not None else -1,
+            serialized_value_size=len(value),
+            serialized_header_size=-1,
+        )
+        partition_log.append(record)
+        self.sent[topic] += 1
+        return record
+
+    def join(self, consumer: "InMemoryConsumer") -> None:
+        if consumer not in self.groups[consumer.group_id]:
+            self.groups[consumer.group_id].append(consumer)
+        self._rebalance(consumer.group_id)
+
+    def leave(self, consumer: "InMemoryConsumer") -> None:
+        members = self.groups.get(consumer.group_id, [])
+        if consumer in members:
+            members.remove(consumer)
+            consumer.revoke()
+            self._rebalance(consumer.group_id)
+
+    def _rebalance(self, group_id: str) -> None:
+        """
+        Revokes the partitions of all members of the group and assigns them again,
+        the partitions of each topic are split into contiguous ranges over the members that subscribed to it.
+        """
+        members = self.groups[group_id]
+        for member in members:
+            member.revoke()
+        assignments: Dict[int, Set[TopicPartition]] = {id(m): set() for m in members}
+        for topic in sorted(set().union(*(m.subscribed for m in members))):
+            subscribed = [m for m in members if topic in m.subscribed]
+            tps = self.partitions_for(topic)
+            per_member, extra = divmod(len(tps), len(subscribed))
+            start = 0
+            for i, member in enumerate(subscribed):
+                stop = start + per_member + (1 if i < extra else 0)
+                assignments[id(member)].update(tps[start:stop])
+                start = stop
+        for member in members:
+            member.assign(
+                {
+                    tp: self.committed.get((group_id, tp), self.end_offsets([tp])[tp])
+                    for tp in assignments[id(member)]
+                }
+            )
+        log.debug("group %s rebalanced: %s members", group_id, len(members))
+
+    def end_offsets(self, tps: List[TopicPartition]) -> Dict[TopicPartition, int]:
+        return {tp: len(self.logs.get(tp, ())) for tp in tps}
+
+    def read(
+        self, tp: TopicPartition, offset: int, max_records: int
+    ) -> List[ConsumerRecord]:
+        return self.logs.get(tp, [])[offset : offset + max_records]
+
+
+class InMemoryProducer:
+    """
+    Offers the KafkaProducer.send surface that CH2TF uses, on top of an InMemoryBroker.
+    """
+
+    def __init__(
+        self,
+        broker: InMemoryBroker,
+        value_serializer: Callable[[Any], bytes] = json_serializer,
+    ):
+        self.broker = broker
+        self.value_serializer = value_serializer
+
+    def send(
+        self,
+        topic: str,
+        value: Any = None,
+        key: bytes | None = None,
+        partition: int | None = None,
+        **kwargs,
+    ) -> SentFuture:
+        try:
+            record = self.broker.append(
+                topic, key, self.value_serializer(value), partition
+            )
+        except Exception as e:
+            log.error("sending to %s failed: %s", topic, e)
+            return SentFuture(error=e)
+        return SentFuture(record)
+
+    def flush(self, timeout: float | None = None) -> None:
+        pass
+
+    def close(self, timeout: float | None = None) -> None:
+        pass
+
+
+class InMemoryConsumer:
+    """
+    Offers the KafkaConsumer surface that CH2TF uses, on top of an InMemoryBroker.
+    Like CH2TF's consumer (auto_offset_reset="latest"), only messages sent after the subscription are received.
+    Iterating over the consumer returns the pending messages and stops instead of blocking.
+    With a group id, the consumer only reads the partitions assigned to it and commits its offsets on each poll.
+    """
+
+    def __init__(
+        self,
+        broker: InMemoryBroker,
+        value_deserializer: Callable[[bytes], Any] = json_deserializer,
+        group_id: str | None = None,
+    ):
+        self.broker = broker
+        self.value_deserializer = value_deserializer
+        self.group_id = group_id
+        self.subscribed: Set[str] = set()
+        self.listener: ConsumerRebalanceListener | None = None
+        self.positions: Dict[TopicPartition, int] = {}
+
+    def subscribe(
+        self, topics: List[str], listener: ConsumerRebalanceListener | None = None
+    ) -> None:
+        self.subscribed.update(topics)
+        self.listener = listener
+        if self.group_id is not None:
+            self.broker.join(self)
+            return
+        for topic in topics:
+            for tp in self.broker.partitions_for(topic):
+                self.positions.setdefault(tp, self.broker.end_offsets([tp])[tp])
+
+    def subscription(self) -> set:
+        return set(self.subscribed)
+
+    def assignment(self) -> Set[TopicPartition]:
+        return set(self.positions)
+
+    def assign(self, positions: Dict[TopicPartition, int]) -> None:
+        """
+        Called by the broker on a rebalance of the group.
+        """
+        self.positions = positions
+        if self.listener is not None:
+            self.listener.on_partitions_assigned(set(positions))
+
+    def revoke(self) -> None:
+        """
+        Called by the broker on a rebalance of the group, commits the offsets of the revoked partitions.
+        """
+        for tp, offset in self.positions.items():
+            self.broker.committed[(self.group_id, tp)] = offset
+        revoked, self.positions = set(self.positions), {}
+        if self.listener is not None and revoked:
+            self.listener.on_partitions_revoked(revoked)
+
+    def topics(self) -> set:
+        return self.broker.topics()
+
+    def poll(
+        self, timeout_ms: int = 0, max_records: int | None = None
+    ) -> Dict[TopicPartition, List[ConsumerRecord]]:
+        """
+        :param timeout_ms: ignored, the messages are already available
+        :type timeout_ms: int
+        :param max_records: max. number of records to return
+        :type max_records: int | None
+        :return: deserialized records per topic partition
+        :rtype: Dict[TopicPartition, List[ConsumerRecord]]
+        """
+        remaining = max_records if max_records is not None else float("inf")
+        polled = {}
+        for tp, offset in self.positions.items():
+            if remaining <= 0:
+                break
+            records = self.broker.read(tp, offset, int(min(remaining, 1 << 62)))
+            if not records:
+                continue
+            self.positions[tp] = offset + len(records)
+            if self.group_id is not None:
+                self.broker.committed[(self.group_id, tp)] = self.positions[tp]
+            remaining -= len(records)
+            polled[tp] = [
+                record._replace(value=self.value_deserializer(record.value))
+                for record in records
+            ]
+        return polled
+
+    def __iter__(self) -> Iterator[ConsumerRecord]:
+        while polled := self.poll():
+            for records in polled.values():
+                yield from records
+
+    def close(self) -> None:
+        if self.group_id is not None:
+            self.broker.leave(self)
@@ -0,0 +1,19 @@
+class VirtualClock:
+    """
+    Clock of a simulation. The time only moves when the simulation advances it,
+    such that a scenario runs as fast as possible and is reproducible.
+    """
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance_to(self, timestamp: float) -> None:
+        """
+        :param timestamp: new time in seconds, the clock never goes backwards
+        :type timestamp: float
+        :return: None
+        """
+        self.now = max(self.now, timestamp)
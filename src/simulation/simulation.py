@@ -0,0 +1,385 @@
+import json
+import logging
+import random
+import time
+from dataclasses import dataclass, field, asdict
+from typing import Callable, Dict, Iterable, List
+
+from src.ch2tf import (
+    CH2TF,
+    CH2TFState,
+    HeavyHitterAnalysis,
+    DDoSAttackAnalysis,
+    SamplingController,
+)
+from src.config import ANALYSIS_PERIOD, USE_HASH
+from src.enums import DecisionEnum
+from src.mitigation import Mitigation, NoMitigation
+from src.models import (
+    DefenseCollaborationRequestData,
+    DefenseCollaborationResponseData,
+    Detection,
+    PacketData,
+)
+from src.util import init_bloom_filter, add_to_bloom_filter
+from src.util.pseudonym import hash_ip
+from .broker import InMemoryBroker, InMemoryProducer, InMemoryConsumer
+from .clock import VirtualClock
+from .traffic import TrafficEvent
+from src.traffic.workload import WorkloadGenerator, AddressSpace
+
+log = logging.getLogger("simulation")
+
+
+@dataclass
+class SimulatedAS:
+    """
+    A CH2TF instance of the simulation together with its consumer.
+    """
+
+    name: str
+    ch2tf: CH2TF
+    consumer: InMemoryConsumer
+    packets: int = 0
+
+    def store(self, timestamp: float, src: str, dst: str) -> None:
+        packet_data = PacketData(
+            src=src,
+            dst=dst,
+            srcport="80",
+            dstport="80",
+            timestamp=timestamp,  # type: ignore
+            transport_layer="TCP",
+        )
+        self.ch2tf._store_data(
+            packet_data, self.ch2tf.state.dest_dict, self.ch2tf.state.src_dict
+        )
+        self.packets += 1
+
+    def deliver(self) -> int:
+        """
+        Dispatches all pending messages to the CH2TF instance.
+        :return: number of dispatched messages
+        :rtype: int
+        """
+        # the early alarms raised by the ingestion are sent as in the consumer loop of the runtime
+        self.ch2tf.send_early_alarms()
+        delivered = 0
+        for message in self.consumer:
+            self.ch2tf.dispatch(message)
+            delivered += 1
+        return delivered
+
+
+def _to_json(obj, indent: int | None = None) -> str:
+    # enums are written by name
+    return json.dumps(
+        asdict(obj), indent=indent, sort_keys=True, default=lambda o: o.name
+    )
+
+
+@dataclass
+class EpochRecord:
+    """
+    Entry of the detection timeline, recorded at the end of each analysis period.
+    """
+
+    epoch: int
+    # virtual time at the end of the epoch
+    time: float
+    # AS name -> packets ingested during the epoch
+    packets: Dict[str, int]
+    # AS name -> potential victims detected by the analysis of the epoch
+    detections: Dict[str, List[Detection]]
+    # topic -> messages sent during the epoch (including the requests of the analysis)
+    messages: Dict[str, int]
+    # AS name -> rate the packets of the epoch were sampled with
+    sampling_rates: Dict[str, float] = field(default_factory=dict)
+
+    def to_json(self) -> str:
+        return _to_json(self)
+
+
+@dataclass
+class SimulationResult:
+    packets: int
+    epochs: int
+    virtual_duration: float
+    wall_duration: float
+    # packets ingested per second of wall clock time
+    packets_per_second: float
+    # topic -> number of messages
+    messages: Dict[str, int]
+    # victim -> seconds from attack start to the first collaboration request (per originator)
+    detection_latency: Dict[str, Dict[str, float]] = field(default_factory=dict)
+    # victim -> seconds from attack start to the first FOUND response (per responding AS)
+    mitigation_latency: Dict[str, Dict[str, float]] = field(default_factory=dict)
+
+    def to_json(self) -> str:
+        return _to_json(self, indent=2)
+
+
+class Simulation:
+    """
+    Runs multiple CH2TF instances in one process, connected through an InMemoryBroker.
+    The traffic is ingested on a virtual clock: analysis periods and message deliveries
+    happen at the timestamps of the traffic, such that long scenarios finish in seconds
+    and give reproducible results.
+    """
+
+    def __init__(
+        self,
+        managed_ips: Dict[str, Iterable[str]],
+        analysis_period: float = ANALYSIS_PERIOD,
+        delivery_interval: float = 0.1,
+        seed: int = 0,
+        mitigation_factory: Callable[[], Mitigation] = NoMitigation,
+        use_hash: bool = USE_HASH,
+    ):
+        """
+        :param managed_ips: AS name -> (unhashed) managed addresses
+        :type managed_ips: Dict[str, Iterable[str]]
+        :param analysis_period: seconds of virtual time per analysis period
+        :type analysis_period: float
+        :param delivery_interval: seconds of virtual time between the deliveries of the broker messages
+        :type delivery_interval: float
+        :param seed: seed for the sampling of packets, each AS samples with its own generator derived from it
+        :type seed: int
+        :param mitigation_factory: creates the mitigation of each AS
+        :type mitigation_factory: Callable[[], Mitigation]
+        :param use_hash: whether the addresses are hashed as in TrafficGenerator
+        :type use_hash: bool
+        """
+        # the global generator is not reseeded, the simulation does not change the state of the caller
+        self.rng = random.Random(seed)
+        self.analysis_period = analysis_period
+        self.delivery_interval = delivery_interval
+        self.use_hash = use_hash
+        self.clock = VirtualClock()
+        self.broker = InMemoryBroker(self.clock)
+        self.nodes: Dict[str, SimulatedAS] = {}
+        for as_name, ips in managed_ips.items():
+            ips = [self._address(ip) for ip in ips]
+            bloom_filter = add_to_bloom_filter(
+                init_bloom_filter(max(len(ips), 1) * 2), ips
+            )
+            ch2tf = CH2TF(
+                queue=None,  # type: ignore
+                mitigation=mitigation_factory(),
+                attacker_analysis=HeavyHitterAnalysis(),
+                attack_analysis=DDoSAttackAnalysis(),
+                state=CH2TFState(self.clock),
+                as_name=as_name,
+                managed_ips=bloom_filter,
+                producer=InMemoryProducer(self.broker),  # type: ignore
+                consumer_factory=lambda: InMemoryConsumer(self.broker),  # type: ignore
+                clock=self.clock,
+                sampling=SamplingController(
+                    rng=random.Random(self.rng.getrandbits(64))
+                ),
+            )
+            self.nodes[as_name] = SimulatedAS(as_name, ch2tf, ch2tf.subscribe())  # type: ignore
+        self.epochs = 0
+        self.next_epoch = analysis_period
+        self.next_delivery = delivery_interval
+        # one record per analysis period
+        self.timeline: List[EpochRecord] = []
+        self._recorded_packets: Dict[str, int] = {}
+        self._recorded_messages: Dict[str, int] = {}
+
+    def _address(self, ip: str) -> str:
+        return hash_ip(ip) if self.use_hash else ip
+
+    def deliver(self) -> int:
+        """
+        Delivers messages to all ASes until no more messages are pending
+        (requests lead to responses, which are delivered in the same step).
+        :return: number of delivered messages
+        :rtype: int
+        """
+        total = 0
+        while delivered := sum(node.deliver() for node in self.nodes.values()):
+            total += delivered
+        return total
+
+    def advance_to(self, timestamp: float) -> None:
+        """
+        Advances the virtual clock and runs all deliveries and analysis periods up to the timestamp.
+        :param timestamp: virtual time in seconds
+        :type timestamp: float
+        :return: None
+        """
+        while min(self.next_epoch, self.next_delivery) <= timestamp:
+            if self.next_epoch <= self.next_delivery:
+                self.clock.advance_to(self.next_epoch)
+                self.epochs += 1
+                detections = {
+                    name: node.ch2tf.analyse_period(self.epochs)
+                    for name, node in self.nodes.items()
+                }
+                self._record_epoch(detections)
+                self.next_epoch += self.analysis_period
+            else:
+                self.clock.advance_to(self.next_delivery)
+                self.next_delivery += self.delivery_interval
+            self.deliver()
+        self.clock.advance_to(timestamp)
+
+    def _record_epoch(self, detections: Dict[str, List[Detection]]) -> None:
+        packets = {
+            name: node.packets - self._recorded_packets.get(name, 0)
+            for name, node in self.nodes.items()
+        }
+        messages = {
+            topic: sent - self._recorded_messages.get(topic, 0)
+            for topic, sent in self.broker.sent.items()
+            if sent > self._recorded_messages.get(topic, 0)
+        }
+        self.timeline.append(
+            EpochRecord(
+                epoch=self.epochs,
+                time=self.clock(),
+                packets=packets,
+                detections={name: d for name, d in detections.items() if d},
+                messages=messages,
+                sampling_rates={
+                    name: node.ch2tf.sampling.previous_rate
+                    for name, node in self.nodes.items()
+                },
+            )
+        )
+        self._recorded_packets = {name: n.packets for name, n in self.nodes.items()}
+        self._recorded_messages = dict(self.broker.sent)
+
+    def write_timeline(self, path: str) -> None:
+        """
+        Writes the detection timeline as JSON lines, one line per epoch.
+        :param path: path of the file
+        :type path: str
+        :return: None
+        """
+        with open(path, mode="w", encoding="utf-8") as f:
+            for record in self.timeline:
+                f.write(record.to_json() + "\n")
+
+    def run(
+        self,
+        traffic: Iterable[TrafficEvent],
+        duration: float | None = None,
+        attack_start: float | None = None,
+    ) -> SimulationResult:
+        """
+        Ingests the traffic and runs the collaboration on the virtual clock.
+        The timestamps of the traffic are relative to its first packet,
+        the packets are assigned to the analysis periods by their timestamps.
+        Traffic is read as fast as it can be processed, e.g. hours of captured traffic are replayed in minutes
+        with the same results on each run.
+
+        :param traffic: traffic events ordered by time
+        :type traffic: Iterable[TrafficEvent]
+        :param duration: virtual seconds to run, by default until the end of the traffic
+        :type duration: float | None
+        :param attack_start: virtual time of the attack start, to compute the detection latencies
+        :type attack_start: float | None
+        :return: throughput and detection results
+        :rtype: SimulationResult
+        """
+        start = time.perf_counter()
+        t0 = None
+        for timestamp, as_name, src, dst in traffic:
+            if t0 is None:
+                t0 = timestamp
+            timestamp -= t0
+            if duration is not None and timestamp > duration:
+                break
+            self.advance_to(timestamp)
+            self.nodes[as_name].store(timestamp, self._address(src), self._address(dst))
+        self.advance_to(duration if duration is not None else self.clock())
+        return self._result(time.perf_counter() - start, attack_start)
+
+    def run_workload(
+        self,
+        generator: WorkloadGenerator,
+        space: AddressSpace,
+        duration: float,
+        attack_start: float | None = None,
+    ) -> SimulationResult:
+        """
+        Ingests the batches of a workload generator, each batch is handled at the end of its time slice.
+        The ASes of the simulation must be named as in the address space.
+
+        :param generator: generator of the packet batches
+        :type generator: WorkloadGenerator
+        :param space: managed address blocks of the ASes
+        :type space: AddressSpace
+        :param duration: virtual seconds to run
+        :type duration: float
+        :param attack_start: virtual time of the attack start, to compute the detection latencies
+        :type attack_start: float | None
+        :return: throughput and detection results
+        :rtype: SimulationResult
+        """
+        start = time.perf_counter()
+        for batch in generator.batches(0, duration):
+            if not len(batch):
+                continue
+            self.advance_to(float(batch.timestamp.max()))
+            for as_name, observed in space.split_by_observer(batch).items():
+                node = self.nodes[as_name]
+                srcs, dsts = observed.addresses(self.use_hash)
+                node.ch2tf.store_batch(srcs, dsts)
+                node.packets += len(observed)
+        self.advance_to(duration)
+        return self._result(time.perf_counter() - start, attack_start)
+
+    def _result(
+        self, wall_duration: float, attack_start: float | None
+    ) -> SimulationResult:
+        packets = sum(node.packets for node in self.nodes.values())
+        result = SimulationResult(
+            packets=packets,
+            epochs=self.epochs,
+            virtual_duration=self.clock(),
+            wall_duration=wall_duration,
+            packets_per_second=packets / wall_duration if wall_duration else 0.0,
+            messages=dict(self.broker.sent),
+        )
+        if attack_start is not None:
+            self._add_latencies(result, attack_start)
+        return result
+
+    def _add_latencies(self, result: SimulationResult, attack_start: float) -> None:
+        """
+        Computes the detection and mitigation latencies from the messages of the broker.
+        """
+        victims = {}  # request id -> victim
+        for tp, records in self.broker.logs.items():
+            if not tp.topic.endswith(".REQ"):
+                continue
+            for record in records:
+                request = DefenseCollaborationRequestData.from_json(
+                    json.loads(record.value)
+                )
+                victims[request.request_id] = request.potential_victim
+                latencies = result.detection_latency.setdefault(
+                    request.potential_victim, {}
+                )
+                latency = record.timestamp / 1000 - attack_start
+                latencies[request.request_originator] = min(
+                    latencies.get(request.request_originator, latency), latency
+                )
+        for tp, records in self.broker.logs.items():
+            if not tp.topic.endswith(".RES"):
+                continue
+            for record in records:
+                response = DefenseCollaborationResponseData.from_json(
+                    json.loads(record.value)
+                )
+                victim = victims.get(response.request_id)
+                if victim is None or response.decision != DecisionEnum.FOUND:
+                    continue
+                latencies = result.mitigation_latency.setdefault(victim, {})
+                latency = record.timestamp / 1000 - attack_start
+                latencies[response.as_name] = min(
+                    latencies.get(response.as_name, latency), latency
+                )
@@ -0,0 +1,176 @@
+import random
+import socket
+import struct
+from typing import BinaryIO, Dict, Iterator, List, Sequence, Tuple
+
+from scapy.layers.inet import IP
+from scapy.layers.inet6 import IPv6
+from scapy.utils import PcapReader
+
+# (timestamp in seconds, name of the AS that observes the packet, src, dst)
+TrafficEvent = Tuple[float, str, str, str]
+
+
+def synthetic_managed_ips(as_names: Sequence[str], hosts: int) -> Dict[str, List[str]]:
+    """
+    Assigns the addresses 10.<i>.x.y to the i-th AS.
+
+    :param as_names: names of the ASes
+    :type as_names: Sequence[str]
+    :param hosts: number of addresses per AS (max. 65536)
+    :type hosts: int
+    :return: AS name -> managed addresses
+    :rtype: Dict[str, List[str]]
+    """
+    return {
+        as_name: [f"10.{i}.{k // 256}.{k % 256}" for k in range(hosts)]
+        for i, as_name in enumerate(as_names)
+    }
+
+
+def synthetic_traffic(
+    managed_ips: Dict[str, List[str]],
+    duration: float,
+    rate: float,
+    victim_as: str,
+    attack_start: float,
+    attack_duration: float,
+    attack_rate: float,
+    attackers: int,
+    seed: int = 0,
+) -> Iterator[TrafficEvent]:
+    """
+    Generates legitimate traffic between random hosts of all ASes and a flood from
+    random hosts of the other ASes to a victim in victim_as.
+    Each packet is observed by the AS that manages its source and the AS that manages its destination.
+
+    :param managed_ips: AS name -> managed addresses
+    :type managed_ips: Dict[str, List[str]]
+    :param duration: duration of the traffic in seconds
+    :type duration: float
+    :param rate: legitimate packets per second
+    :type rate: float
+    :param victim_as: AS that manages the victim
+    :type victim_as: str
+    :param attack_start: start of the attack in seconds
+    :type attack_start: float
+    :param attack_duration: duration of the attack in seconds
+    :type attack_duration: float
+    :param attack_rate: attack packets per second
+    :type attack_rate: float
+    :param attackers: number of attacking hosts
+    :type attackers: int
+    :param seed: seed of the random generator
+    :type seed: int
+    :return: traffic events ordered by time
+    :rtype: Iterator[TrafficEvent]
+    """
+    rnd = random.Random(seed)
+    owner = {ip: as_name for as_name, ips in managed_ips.items() for ip in ips}
+    hosts = list(owner)
+    victim = managed_ips[victim_as][0]
+    attacker_ips = rnd.sample([ip for ip in hosts if owner[ip] != victim_as], attackers)
+    attack_end = attack_start + attack_duration
+
+    def observe(timestamp: float, src: str, dst: str) -> Iterator[TrafficEvent]:
+        yield timestamp, owner[src], src, dst
+        if owner[dst] != owner[src]:
+            yield timestamp, owner[dst], src, dst
+
+    next_legit = 0.0
+    next_attack = attack_start if attack_rate > 0 else duration
+    while min(next_legit, next_attack) < duration:
+        if next_legit <= next_attack:
+            yield from observe(next_legit, rnd.choice(hosts), rnd.choice(hosts))
+            next_legit += rnd.expovariate(rate)
+        else:
+            yield from observe(next_attack, rnd.choice(attacker_ips), victim)
+            next_attack += rnd.expovariate(attack_rate)
+            if next_attack >= attack_end:
+                next_attack = duration
+
+
+# magic number of classic pcap files -> (byte order, timestamp units per second)
+_PCAP_MAGIC = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e6),
+    b"\xa1\xb2\xc3\xd4": (">", 1e6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e9),
+    b"\xa1\xb2\x3c\x4d": (">", 1e9),
+}
+# link type -> (offset of the ethertype / protocol field, offset of the network layer)
+_LINK_TYPES = {
+    1: (12, 14),  # Ethernet
+    113: (14, 16),  # Linux cooked capture
+    276: (0, 20),  # Linux cooked capture v2
+    101: (None, 0),  # raw IP
+    228: (None, 0),  # raw IPv4
+    229: (None, 0),  # raw IPv6
+}
+_ETHERTYPE_VLAN = (0x8100, 0x88A8)
+
+
+def _ip_addresses(frame: bytes, link_type: int) -> Tuple[str, str] | None:
+    """
+    :return: source and destination address of an IPv4 / IPv6 frame, None for other frames
+    """
+    proto_offset, offset = _LINK_TYPES[link_type]
+    if proto_offset is not None and len(frame) >= proto_offset + 2:
+        ethertype = int.from_bytes(frame[proto_offset : proto_offset + 2], "big")
+        while link_type == 1 and ethertype in _ETHERTYPE_VLAN:
+            ethertype = int.from_bytes(frame[offset + 2 : offset + 4], "big")
+            offset += 4
+    if len(frame) <= offset:
+        return None
+    version = frame[offset] >> 4
+    if version == 4 and len(frame) >= offset + 20:
+        return (
+            socket.inet_ntoa(frame[offset + 12 : offset + 16]),
+            socket.inet_ntoa(frame[offset + 16 : offset + 20]),
+        )
+    if version == 6 and len(frame) >= offset + 40:
+        return (
+            socket.inet_ntop(socket.AF_INET6, frame[offset + 8 : offset + 24]),
+            socket.inet_ntop(socket.AF_INET6, frame[offset + 24 : offset + 40]),
+        )
+    return None
+
+
+def _read_classic_pcap(f: BinaryIO, as_name: str) -> Iterator[TrafficEvent]:
+    header = f.read(24)
+    byte_order, resolution = _PCAP_MAGIC[header[:4]]
+    link_type = struct.unpack(byte_order + "I", header[20:24])[0] & 0xFFFF
+    if link_type not in _LINK_TYPES:
+        raise ValueError(f"unsupported link type: {link_type}")
+    record = struct.Struct(byte_order + "IIII")
+    while len(record_header := f.read(record.size)) == record.size:
+        ts_sec, ts_frac, incl_len, _ = record.unpack(record_header)
+        frame = f.read(incl_len)
+        addresses = _ip_addresses(frame, link_type)
+        if addresses is not None:
+            yield ts_sec + ts_frac / resolution, as_name, *addresses
+
+
+def pcap_traffic(path: str, as_name: str) -> Iterator[TrafficEvent]:
+    """
+    Replays a pcap file as observed by a single AS, using the capture timestamps.
+    Classic pcap files are parsed directly from the IP headers, which is much faster than dissecting
+    every packet with scapy. Other formats (e.g. pcapng) are read with scapy.
+    Packets without an IPv4 / IPv6 header are skipped.
+
+    :param path: path of the pcap file
+    :type path: str
+    :param as_name: AS that observes the packets
+    :type as_name: str
+    :return: traffic events ordered by time
+    :rtype: Iterator[TrafficEvent]
+    """
+    with open(path, mode="rb") as f:
+        if f.read(4) in _PCAP_MAGIC:
+            f.seek(0)
+            yield from _read_classic_pcap(f, as_name)
+            return
+    with PcapReader(path) as reader:
+        for packet in reader:
+            layer = IP if IP in packet else IPv6 if IPv6 in packet else None
+            if layer is not None:
+                yield float(packet.time), as_name, packet[layer].src, packet[layer].dst
@@ -4,7 +4,7 @@ import time
 from multiprocessing import Queue
 import warnings
 from cryptography.utils import CryptographyDeprecationWarning
-from src.util import sha3_hash
+from src.util.pseudonym import hash_ip
 
 warnings.filterwarnings("ignore", category=CryptographyDeprecationWarning)
 
@@ -33,8 +33,8 @@ class TrafficGenerator:
 
     def send_packet_data(self, src, dst):
         if USE_HASH:
-            src = sha3_hash(src)
-            dst = sha3_hash(dst)
+            src = hash_ip(src)
+            dst = hash_ip(dst)
 
         packet_data: PacketData = PacketData(
             src=src,
@@ -48,12 +48,12 @@ class TrafficGenerator:
 
     def read_simulated_traffic(self):
         time.sleep(1)
-        log.info(f"sending traffic")
+        log.info("sending traffic")
         self._read_traffic(EVAL_SIMULATED_TRAFFIC_PATH, LEGITIMATE_TRAFFIC_INTERVAL)
 
     def read_simulated_attack_traffic(self):
         time.sleep(3)
-        log.info(f"attacking")
+        log.info("attacking")
         self._read_traffic(
             EVAL_SIMULATED_ATK_TRAFFIC_PATH, ILLEGITIMATE_TRAFFIC_INTERVAL
         )
@@ -70,7 +70,7 @@ class TrafficGenerator:
             self.send_packet_data(packet.src, packet.dst)
             iteration += 1
             if iteration % 1000 == 0:
-                log.info(f"{iteration} for {file_path} done")
+                log.info("%s for %s done", iteration, file_path)
             # stop = time.time_ns()
             # print(f'_read_traffic - took {(stop - start)} ns')
             self.sleep(wait_time)
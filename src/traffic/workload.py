@@ -0,0 +1,363 @@
+# GNU General Public License v2.0
+
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+from src.util.pseudonym import hash_ip
+
+
+def ip_to_str(addresses: np.ndarray) -> np.ndarray:
+    """
+    Converts IPv4 addresses (uint32) to dotted strings.
+
+    :param addresses: IPv4 addresses as integers
+    :type addresses: np.ndarray
+    :return: addresses as strings (dtype object)
+    :rtype: np.ndarray
+    """
+    addresses = addresses.astype(np.uint32)
+    octets = [(addresses >> shift) & 0xFF for shift in (24, 16, 8, 0)]
+    return np.array(
+        [f"{a}.{b}.{c}.{d}" for a, b, c, d in zip(*(o.tolist() for o in octets))],
+        dtype=object,
+    )
+
+
+def str_to_ip(address: str) -> int:
+    a, b, c, d = (int(octet) for octet in address.split("."))
+    return (a << 24) | (b << 16) | (c << 8) | d
+
+
+@dataclass
+class PacketBatch:
+    """
+    Packets of a time slice as columns. Addresses are IPv4 addresses as uint32.
+    """
+
+    src: np.ndarray
+    dst: np.ndarray
+    timestamp: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.src)
+
+    def select(self, mask: np.ndarray) -> "PacketBatch":
+        return PacketBatch(self.src[mask], self.dst[mask], self.timestamp[mask])
+
+    def sort(self) -> "PacketBatch":
+        order = np.argsort(self.timestamp, kind="stable")
+        return PacketBatch(self.src[order], self.dst[order], self.timestamp[order])
+
+    def addresses(self, use_hash: bool = False) -> Tuple[List[str], List[str]]:
+        """
+        Converts the addresses to the strings that CH2TF works with.
+        Each distinct address is only converted (and hashed) once.
+
+        :param use_hash: whether the addresses are hashed as in TrafficGenerator
+        :type use_hash: bool
+        :return: source and destination addresses
+        :rtype: Tuple[List[str], List[str]]
+        """
+        unique, inverse = np.unique(
+            np.concatenate((self.src, self.dst)), return_inverse=True
+        )
+        strings = ip_to_str(unique)
+        if use_hash:
+            strings = np.array([hash_ip(s) for s in strings], dtype=object)
+        converted = strings[inverse]
+        return converted[: len(self)].tolist(), converted[len(self) :].tolist()
+
+
+class AddressSpace:
+    """
+    Managed address blocks of the ASes, AS i manages the contiguous block 10.i.0.0/16.
+    """
+
+    def __init__(self, as_names: Sequence[str], hosts_per_as: int = 65_536):
+        """
+        :param as_names: names of the ASes (max. 256)
+        :type as_names: Sequence[str]
+        :param hosts_per_as: number of managed addresses per AS (max. 65536)
+        :type hosts_per_as: int
+        """
+        self.as_names = list(as_names)
+        self.hosts_per_as = hosts_per_as
+        self.starts = np.array(
+            [str_to_ip(f"10.{i}.0.0") for i in range(len(self.as_names))],
+            dtype=np.uint32,
+        )
+
+    def managed(self, as_name: str) -> np.ndarray:
+        start = self.starts[self.as_names.index(as_name)]
+        return start + np.arange(self.hosts_per_as, dtype=np.uint32)
+
+    def managed_ips(self, use_hash: bool = False) -> Dict[str, List[str]]:
+        """
+        :param use_hash: whether the addresses are hashed as in TrafficGenerator
+        :type use_hash: bool
+        :return: AS name -> managed addresses as strings
+        :rtype: Dict[str, List[str]]
+        """
+        managed = {}
+        for as_name in self.as_names:
+            strings = ip_to_str(self.managed(as_name)).tolist()
+            managed[as_name] = [hash_ip(s) for s in strings] if use_hash else strings
+        return managed
+
+    def owner(self, addresses: np.ndarray) -> np.ndarray:
+        """
+        :param addresses: IPv4 addresses as integers
+        :type addresses: np.ndarray
+        :return: index of the managing AS per address, -1 if unmanaged
+        :rtype: np.ndarray
+        """
+        idx = np.searchsorted(self.starts, addresses, side="right") - 1
+        offset = addresses.astype(np.int64) - self.starts[np.maximum(idx, 0)]
+        return np.where((idx >= 0) & (offset < self.hosts_per_as), idx, -1)
+
+    def split_by_observer(self, batch: PacketBatch) -> Dict[str, PacketBatch]:
+        """
+        Each packet is observed by the AS that manages its source and the AS that manages its destination.
+
+        :param batch: packets
+        :type batch: PacketBatch
+        :return: AS name -> observed packets
+        :rtype: Dict[str, PacketBatch]
+        """
+        src_owner = self.owner(batch.src)
+        dst_owner = self.owner(batch.dst)
+        observed = {}
+        for i, as_name in enumerate(self.as_names):
+            mask = (src_owner == i) | (dst_owner == i)
+            if mask.any():
+                observed[as_name] = batch.select(mask)
+        return observed
+
+
+class TrafficModel(ABC):
+    """
+    Parameterised traffic source. Rates are packets per second.
+    """
+
+    def __init__(self, rate: float, start: float = 0.0, end: float = float("inf")):
+        self.rate = rate
+        self.start = start
+        self.end = end
+
+    def active(self, t0: float, t1: float) -> Tuple[float, float]:
+        return max(t0, self.start), min(t1, self.end)
+
+    def _count(self, rng: np.random.Generator, t0: float, t1: float) -> int:
+        return int(rng.poisson(self.rate * (t1 - t0))) if t1 > t0 else 0
+
+    @abstractmethod
+    def generate(self, rng: np.random.Generator, t0: float, t1: float) -> PacketBatch:
+        raise NotImplementedError
+
+
+def _batch(src: np.ndarray, dst: np.ndarray, rng, t0: float, t1: float) -> PacketBatch:
+    timestamp = t0 + rng.random(len(src)) * (t1 - t0)
+    return PacketBatch(src.astype(np.uint32), dst.astype(np.uint32), timestamp)
+
+
+def _empty() -> PacketBatch:
+    return PacketBatch(
+        np.empty(0, dtype=np.uint32),
+        np.empty(0, dtype=np.uint32),
+        np.empty(0, dtype=np.float64),
+    )
+
+
+class ZipfLegitimateTraffic(TrafficModel):
+    """
+    Clients send to servers whose popularity follows a Zipf distribution (bounded to the servers).
+    The ranks are drawn from a precomputed table of the inverse distribution function,
+    which is much faster than sampling an unbounded Zipf distribution.
+    """
+
+    def __init__(
+        self,
+        clients: np.ndarray,
+        servers: np.ndarray,
+        rate: float,
+        zipf_a: float = 1.2,
+        start: float = 0.0,
+        end: float = float("inf"),
+    ):
+        super().__init__(rate, start, end)
+        self.clients = clients
+        self.servers = servers
+        self.zipf_a = zipf_a
+        weights = 1.0 / np.arange(1, len(servers) + 1) ** zipf_a
+        cdf = np.cumsum(weights) / weights.sum()
+        resolution = max(1 << 16, 16 * len(servers))
+        self.rank_table = np.minimum(
+            np.searchsorted(cdf, (np.arange(resolution) + 0.5) / resolution),
+            len(servers) - 1,
+        )
+
+    def generate(self, rng: np.random.Generator, t0: float, t1: float) -> PacketBatch:
+        t0, t1 = self.active(t0, t1)
+        n = self._count(rng, t0, t1)
+        if n == 0:
+            return _empty()
+        rank = self.rank_table[rng.integers(0, len(self.rank_table), n)]
+        src = self.clients[rng.integers(0, len(self.clients), n)]
+        return _batch(src, self.servers[rank], rng, t0, t1)
+
+
+class VolumetricFlood(TrafficModel):
+    """
+    Attackers flood a victim with a high aggregated rate.
+    """
+
+    def __init__(
+        self,
+        attackers: np.ndarray,
+        victim: int,
+        rate: float,
+        start: float = 0.0,
+        end: float = float("inf"),
+    ):
+        super().__init__(rate, start, end)
+        self.attackers = attackers
+        self.victim = victim
+
+    def _attack(self, rng: np.random.Generator, t0: float, t1: float) -> PacketBatch:
+        n = self._count(rng, t0, t1)
+        if n == 0:
+            return _empty()
+        src = self.attackers[rng.integers(0, len(self.attackers), n)]
+        return _batch(src, np.full(n, self.victim), rng, t0, t1)
+
+    def generate(self, rng: np.random.Generator, t0: float, t1: float) -> PacketBatch:
+        return self._attack(rng, *self.active(t0, t1))
+
+
+class LowAndSlowAttack(VolumetricFlood):
+    """
+    Many attackers that each send only a few packets per second to the victim,
+    such that no single attacker crosses the per-source thresholds.
+    """
+
+    def __init__(
+        self,
+        attackers: np.ndarray,
+        victim: int,
+        rate_per_attacker: float,
+        start: float = 0.0,
+        end: float = float("inf"),
+    ):
+        super().__init__(
+            attackers, victim, rate_per_attacker * len(attackers), start, end
+        )
+
+
+class PulseAttack(VolumetricFlood):
+    """
+    Flood that is only active during the first duty_cycle of each period (in seconds).
+    """
+
+    def __init__(
+        self,
+        attackers: np.ndarray,
+        victim: int,
+        rate: float,
+        period: float,
+        duty_cycle: float,
+        start: float = 0.0,
+        end: float = float("inf"),
+    ):
+        super().__init__(attackers, victim, rate, start, end)
+        self.period = period
+        self.duty_cycle = duty_cycle
+
+    def generate(self, rng: np.random.Generator, t0: float, t1: float) -> PacketBatch:
+        t0, t1 = self.active(t0, t1)
+        batches = []
+        pulse = self.start + np.floor((t0 - self.start) / self.period) * self.period
+        while pulse < t1:
+            on0, on1 = max(t0, pulse), min(t1, pulse + self.period * self.duty_cycle)
+            if on1 > on0:
+                batches.append(self._attack(rng, on0, on1))
+            pulse += self.period
+        return concat(batches)
+
+
+class SpoofedSourceStorm(TrafficModel):
+    """
+    Flood with uniformly random (spoofed) source addresses from the whole IPv4 space.
+    """
+
+    def __init__(
+        self, victim: int, rate: float, start: float = 0.0, end: float = float("inf")
+    ):
+        super().__init__(rate, start, end)
+        self.victim = victim
+
+    def generate(self, rng: np.random.Generator, t0: float, t1: float) -> PacketBatch:
+        t0, t1 = self.active(t0, t1)
+        n = self._count(rng, t0, t1)
+        if n == 0:
+            return _empty()
+        src = rng.integers(0, 1 << 32, n, dtype=np.uint32)
+        return _batch(src, np.full(n, self.victim), rng, t0, t1)
+
+
+def concat(batches: List[PacketBatch]) -> PacketBatch:
+    batches = [batch for batch in batches if len(batch)]
+    if not batches:
+        return _empty()
+    return PacketBatch(
+        np.concatenate([b.src for b in batches]),
+        np.concatenate([b.dst for b in batches]),
+        np.concatenate([b.timestamp for b in batches]),
+    )
+
+
+class WorkloadGenerator:
+    """
+    Emits packet batches of a combination of traffic models.
+    The batches are ordered by time, the packets within a batch only if sort is set.
+    """
+
+    def __init__(
+        self,
+        models: Sequence[TrafficModel],
+        seed: int = 0,
+        batch_duration: float = 0.1,
+        sort: bool = False,
+    ):
+        """
+        :param models: traffic models
+        :type models: Sequence[TrafficModel]
+        :param seed: seed of the random generator, the same seed generates the same workload
+        :type seed: int
+        :param batch_duration: seconds per batch
+        :type batch_duration: float
+        :param sort: whether the packets within a batch are ordered by time
+        :type sort: bool
+        """
+        self.models = list(models)
+        self.rng = np.random.default_rng(seed)
+        self.batch_duration = batch_duration
+        self.sort = sort
+
+    def batches(self, start: float, end: float) -> Iterator[PacketBatch]:
+        """
+        :param start: start time in seconds
+        :type start: float
+        :param end: end time in seconds
+        :type end: float
+        :return: batches of batch_duration seconds
+        :rtype: Iterator[PacketBatch]
+        """
+        steps = int(np.ceil((end - start) / self.batch_duration))
+        for step in range(steps):
+            t0 = start + step * self.batch_duration
+            t1 = min(end, t0 + self.batch_duration)
+            batch = concat([model.generate(self.rng, t0, t1) for model in self.models])
+            yield batch.sort() if self.sort else batch
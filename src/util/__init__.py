@@ -1,5 +1,7 @@
 from .ch2tfUtil import (
     is_sampling_skip,
+    scale_sampled,
+    partition_for,
     sha3_hash,
     init_managed_ips,
     init_bloom_filter,
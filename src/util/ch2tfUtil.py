@@ -1,6 +1,7 @@
 import hashlib
 import random
-from typing import Any, List
+import zlib
+from typing import Any, Callable, List
 
 import pybloom_live
 
@@ -21,13 +22,51 @@ def is_sampling_skip(sampling_rate: float, rand: float | None = None) -> bool:
     return rand > sampling_rate
 
 
+def scale_sampled(count: float, sampling_rate: float) -> float:
+    """
+    Estimates the packets that were sent from the packets that were sampled.
+
+    :param count: sampled packets
+    :type count: float
+    :param sampling_rate: rate the packets were sampled with, in (0, 1]
+    :type sampling_rate: float
+    :return: estimated packets, count itself if nothing was skipped
+    :rtype: float
+    """
+    if sampling_rate >= 1:
+        return count
+    return count / sampling_rate
+
+
+def partition_for(key: str | bytes, partitions: int) -> int:
+    """
+    Partition of a message key, e.g. a victim. The same for all ASes and workers,
+    independent of the partitioner of the producer.
+
+    :param key: key of the message
+    :type key: str | bytes
+    :param partitions: number of partitions of the topic
+    :type partitions: int
+    :return: partition in [0, partitions)
+    :rtype: int
+    """
+    if partitions <= 1:
+        return 0
+    if isinstance(key, str):
+        key = key.encode()
+    return zlib.crc32(key) % partitions
+
+
 def sha3_hash(var: Any) -> str:
     var = var.encode()
     return hashlib.sha3_256(var).hexdigest()
 
 
 def init_managed_ips(
-    managed_ip_path: str, is_use_hash: bool, capacity: int = 100_000
+    managed_ip_path: str,
+    is_use_hash: bool,
+    capacity: int = 100_000,
+    hash_function: Callable[[str], str] = sha3_hash,
 ) -> pybloom_live.BloomFilter:
     """
     Initializes the bloom filter by adding the managed ip addresses
@@ -37,6 +76,8 @@ def init_managed_ips(
     :type managed_ip_path: str
     :param capacity: capacity of the bloom filter
     :type capacity: int
+    :param hash_function: hashes the ips if is_use_hash is set
+    :type hash_function: Callable[[str], str]
     :return: populated bloom filter
     :rtype: pybloom_live.BloomFilter
     """
@@ -45,7 +86,7 @@ def init_managed_ips(
         for line in f:
             entry = line.rstrip("\n")
             if is_use_hash:
-                entry = sha3_hash(entry)
+                entry = hash_function(entry)
             bloom_filter.add(entry)
     return bloom_filter
 
@@ -0,0 +1,130 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Sequence, Tuple
+
+from src.config import LOG_RATE_INTERVAL, LOG_RATE_BURST
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler for an in-process queue: records are enqueued as they are,
+    i.e. the message is only formatted by the listener thread and not by the thread that logs.
+    The arguments of a log call must therefore not be changed after the call.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+# loggers of the per-packet / per-request paths of ch2tf, the records of other loggers (libraries) are not limited
+RATE_LIMITED_LOGGERS = ("ch2tf", "analysis")
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Passes at most `burst` records per call site (file and line) in each interval of `interval` seconds.
+    The first record of a call site after suppressed records reports how many were suppressed.
+    Suppressed records are neither formatted nor written.
+    Only records of the given loggers (and their children) below max_level are limited.
+    """
+
+    def __init__(
+        self,
+        interval: float = LOG_RATE_INTERVAL,
+        burst: int = LOG_RATE_BURST,
+        loggers: Sequence[str] = RATE_LIMITED_LOGGERS,
+        max_level: int = logging.ERROR,
+    ):
+        """
+        :param interval: seconds of a window
+        :type interval: float
+        :param burst: records per call site and window
+        :type burst: int
+        :param loggers: names of the limited loggers
+        :type loggers: Sequence[str]
+        :param max_level: records at this level and above are always passed
+        :type max_level: int
+        """
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.loggers = tuple(loggers)
+        self._children = tuple(f"{name}." for name in loggers)
+        self.max_level = max_level
+        # call site -> [start of the window, passed records, suppressed records]
+        self._windows: Dict[Tuple[str, int], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= self.max_level or not (
+            record.name in self.loggers or record.name.startswith(self._children)
+        ):
+            return True
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or record.created - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                self._windows[key] = [record.created, 1, 0]
+            elif window[1] < self.burst:
+                window[1] += 1
+                return True
+            else:
+                window[2] += 1
+                return False
+        if suppressed:
+            record.msg = (
+                f"{record.getMessage()} ({suppressed} similar messages suppressed)"
+            )
+            record.args = ()
+        return True
+
+
+def setup_async_logging(
+    handlers: Sequence[logging.Handler],
+    level: int = logging.INFO,
+    fmt: str = "%(asctime)s - [%(levelname)s] - %(message)s",
+    rate_limit: bool = LOG_RATE_BURST > 0,
+) -> QueueListener:
+    """
+    Configures the root logger to hand the records to a queue,
+    the given handlers (files, console) write them in a background thread.
+    Logging threads therefore never wait for formatting or disk writes.
+
+    :param handlers: handlers that write the records
+    :type handlers: Sequence[logging.Handler]
+    :param level: level of the root logger
+    :type level: int
+    :param fmt: format of the records
+    :type fmt: str
+    :param rate_limit: whether the records of the ch2tf loggers are rate limited per call site (see RateLimitFilter)
+    :type rate_limit: bool
+    :return: the started listener, stopped at exit
+    :rtype: QueueListener
+    """
+    formatter = logging.Formatter(fmt)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(records)
+    if rate_limit:
+        queue_handler.addFilter(RateLimitFilter())
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(queue_handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    def restart_in_child() -> None:
+        # the listener thread does not exist in a forked process, the queue might be locked
+        listener.queue = queue_handler.queue = queue.SimpleQueue()
+        listener.start()
+
+    os.register_at_fork(after_in_child=restart_in_child)
+    return listener
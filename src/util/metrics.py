@@ -0,0 +1,291 @@
+import logging
+import math
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+log = logging.getLogger("metrics")
+
+# default buckets of the prometheus clients, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class CounterValue:
+    """
+    Monotonically increasing value.
+    Updates are not locked to keep them cheap in the hot path,
+    i.e. concurrent increments of the same value can get lost in rare cases.
+    """
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def samples(self, name: str, labels: str) -> Iterator[Tuple[str, float]]:
+        yield f"{name}{labels}", self.value
+
+
+class GaugeValue:
+    """
+    Value that can go up and down. If a function is set, it is called on each exposition instead.
+    """
+
+    def __init__(self):
+        self.value = 0.0
+        self.function: Callable[[], float] | None = None
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self.function = function
+
+    def get(self) -> float:
+        if self.function is None:
+            return self.value
+        try:
+            return self.function()
+        except Exception as e:  # e.g. Queue.qsize is not implemented on all platforms
+            log.debug("gauge function failed: %s", e)
+            return math.nan
+
+    def samples(self, name: str, labels: str) -> Iterator[Tuple[str, float]]:
+        yield f"{name}{labels}", self.get()
+
+
+class HistogramValue:
+    """
+    Distribution of observed values in fixed buckets.
+    """
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        # last count is for values larger than the largest bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self, name: str, labels: str) -> Iterator[Tuple[str, float]]:
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            cumulative += count
+            le = "+Inf" if bound == math.inf else repr(float(bound))
+            yield f"{name}_bucket{_add_label(labels, 'le', le)}", cumulative
+        yield f"{name}_sum{labels}", self.sum
+        yield f"{name}_count{labels}", cumulative
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    escaped = (
+        str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for v in values
+    )
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+def _add_label(labels: str, name: str, value: str) -> str:
+    label = f'{name}="{value}"'
+    return "{" + label + "}" if not labels else labels[:-1] + "," + label + "}"
+
+
+class Metric:
+    """
+    Metric family with a fixed set of label names. The values of the label combinations are created on first use,
+    callers in the hot path should keep a reference to the value returned by labels.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        metric_type: str,
+        factory: Callable[[], CounterValue | GaugeValue | HistogramValue],
+        label_names: Sequence[str] = (),
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.metric_type = metric_type
+        self.factory = factory
+        self.label_names = tuple(label_names)
+        self._values: Dict[
+            Tuple[str, ...], CounterValue | GaugeValue | HistogramValue
+        ] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str, **kwargs: str):
+        """
+        :return: the value of the label combination
+        :rtype: CounterValue | GaugeValue | HistogramValue
+        """
+        key = tuple(str(v) for v in values) or tuple(
+            str(kwargs[name]) for name in self.label_names
+        )
+        if len(key) != len(self.label_names):
+            raise ValueError(f"{self.name} expects the labels {self.label_names}")
+        value = self._values.get(key)
+        if value is None:
+            with self._lock:
+                value = self._values.setdefault(key, self.factory())
+        return value
+
+    def expose(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            labels = _format_labels(self.label_names, key)
+            for sample, number in value.samples(self.name, labels):
+                lines.append(f"{sample} {_format_number(number)}")
+        return lines
+
+
+def _format_number(number: float) -> str:
+    if math.isnan(number):
+        return "NaN"
+    if math.isinf(number):
+        return "+Inf" if number > 0 else "-Inf"
+    return repr(float(number)) if number != int(number) else str(int(number))
+
+
+class Registry:
+    """
+    Collection of metrics that are exposed together in the Prometheus text format.
+    Registering an existing name again returns the existing metric,
+    such that multiple instances (e.g. simulated ASes) share a metric and differ in their labels.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(
+        self,
+        name: str,
+        documentation: str,
+        metric_type: str,
+        factory: Callable,
+        label_names: Sequence[str],
+    ) -> Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = Metric(name, documentation, metric_type, factory, label_names)
+                self._metrics[name] = metric
+            elif metric.metric_type != metric_type or metric.label_names != tuple(
+                label_names
+            ):
+                raise ValueError(f"metric {name} is already registered differently")
+            return metric
+
+    def counter(
+        self, name: str, documentation: str, label_names: Sequence[str] = ()
+    ) -> Metric:
+        return self._register(name, documentation, "counter", CounterValue, label_names)
+
+    def gauge(
+        self, name: str, documentation: str, label_names: Sequence[str] = ()
+    ) -> Metric:
+        return self._register(name, documentation, "gauge", GaugeValue, label_names)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Metric:
+        return self._register(
+            name,
+            documentation,
+            "histogram",
+            lambda: HistogramValue(buckets),
+            label_names,
+        )
+
+    def expose(self) -> str:
+        """
+        :return: all metrics in the Prometheus text exposition format
+        :rtype: str
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+# registry of the process
+REGISTRY = Registry()
+
+
+def start_metrics_server(
+    address: str,
+    port: int,
+    registry: Registry = REGISTRY,
+    routes: Dict[str, Callable[[Dict[str, str]], str]] | None = None,
+) -> ThreadingHTTPServer:
+    """
+    Serves the metrics of the registry on http://address:port/metrics in a daemon thread.
+    Additional routes (e.g. /profile) are called with the query parameters and return a text body.
+
+    :param address: address to bind to, e.g. 127.0.0.1 to only serve locally
+    :type address: str
+    :param port: port to bind to, 0 picks a free port
+    :type port: int
+    :param registry: registry to expose
+    :type registry: Registry
+    :param routes: path -> function of the query parameters that returns the body
+    :type routes: Dict[str, Callable[[Dict[str, str]], str]] | None
+    :return: the running server, server.shutdown() stops it
+    :rtype: ThreadingHTTPServer
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path in ("/metrics", "/"):
+                body = registry.expose().encode("utf-8")
+            elif routes and url.path in routes:
+                try:
+                    body = routes[url.path](dict(parse_qsl(url.query))).encode("utf-8")
+                except ValueError as e:
+                    self.send_error(400, str(e))
+                    return
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            log.debug(format, *args)
+
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    log.info("serving metrics on %s:%s", address, server.server_address[1])
+    return server
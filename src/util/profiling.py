@@ -0,0 +1,204 @@
+import functools
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from types import FrameType
+from typing import Callable, Dict
+
+from src.config import STAGE_TIMERS, PROFILE_INTERVAL, PROFILE_DURATION, PROFILE_DIR
+from .metrics import REGISTRY, HistogramValue
+
+log = logging.getLogger("profiling")
+
+_stage_duration = REGISTRY.histogram(
+    "ch2tf_stage_duration_seconds",
+    "Duration of the pipeline stages, only measured if the stage timers are enabled.",
+    ("stage",),
+    (0.00001, 0.0001, 0.001, 0.01, 0.1, 1, 10),
+)
+_timers_enabled = STAGE_TIMERS
+
+
+def set_stage_timers(enabled: bool) -> None:
+    """
+    Switches the stage timers on or off at runtime.
+    :param enabled: whether the stages are timed
+    :type enabled: bool
+    :return: None
+    """
+    global _timers_enabled
+    _timers_enabled = enabled
+    log.info("stage timers %s", "enabled" if enabled else "disabled")
+
+
+def stage_timers_enabled() -> bool:
+    return _timers_enabled
+
+
+def stage_timer(name: str) -> HistogramValue:
+    """
+    :param name: name of the stage
+    :type name: str
+    :return: histogram of the durations of the stage
+    :rtype: HistogramValue
+    """
+    return _stage_duration.labels(name)
+
+
+def stopwatch(name: str) -> Callable:
+    """
+    Decorator that observes the duration of each call in the histogram of the stage.
+    If the stage timers are disabled, the call costs a single flag check.
+
+    :param name: name of the stage
+    :type name: str
+    :return: decorator
+    :rtype: Callable
+    """
+    histogram = stage_timer(name)
+
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _timers_enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def _fold(frame: FrameType | None, thread_name: str) -> str:
+    """
+    :return: stack of the frame in the folded format (root first, separated by semicolons)
+    """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(
+            f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        )
+        frame = frame.f_back
+    names.append(thread_name)
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler that samples the stacks of all threads of the process.
+    The result is written in the folded stack format, which flamegraph.pl, speedscope etc. read.
+    Only one profile runs at a time.
+    """
+
+    def __init__(
+        self,
+        interval: float = PROFILE_INTERVAL,
+        output_dir: str = PROFILE_DIR,
+    ):
+        """
+        :param interval: seconds between two samples
+        :type interval: float
+        :param output_dir: directory the profiles started by start are written to
+        :type output_dir: str
+        """
+        self.interval = interval
+        self.output_dir = output_dir
+        self._running = threading.Lock()
+
+    def profile(self, duration: float) -> Counter:
+        """
+        Samples the stacks for the given duration, blocks the calling thread.
+
+        :param duration: seconds to sample
+        :type duration: float
+        :return: folded stack -> number of samples
+        :rtype: Counter
+        """
+        if not self._running.acquire(blocking=False):
+            raise ValueError("a profile is already running")
+        try:
+            own = threading.get_ident()
+            stacks: Counter = Counter()
+            deadline = time.monotonic() + duration
+            while time.monotonic() < deadline:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id != own:
+                        stacks[_fold(frame, names.get(thread_id, str(thread_id)))] += 1
+                time.sleep(self.interval)
+            return stacks
+        finally:
+            self._running.release()
+
+    @staticmethod
+    def folded(stacks: Counter) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    def start(self, duration: float = PROFILE_DURATION) -> bool:
+        """
+        Samples the stacks in a background thread and writes the profile to the output directory.
+
+        :param duration: seconds to sample
+        :type duration: float
+        :return: False if a profile is already running
+        :rtype: bool
+        """
+        if self._running.locked():
+            log.warning("a profile is already running")
+            return False
+
+        def run() -> None:
+            try:
+                stacks = self.profile(duration)
+            except ValueError as e:
+                log.warning(str(e))
+                return
+            os.makedirs(self.output_dir, exist_ok=True)
+            path = os.path.join(
+                self.output_dir, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.folded"
+            )
+            with open(path, mode="w", encoding="utf-8") as f:
+                f.write(self.folded(stacks))
+            log.info("profile written to %s", path)
+
+        log.info("profiling for %ss", duration)
+        threading.Thread(target=run, name="profiler", daemon=True).start()
+        return True
+
+    def route(self, query: Dict[str, str]) -> str:
+        """
+        Route for the metrics server: profiles for ?seconds=N (default PROFILE_DURATION) and returns the profile.
+        """
+        seconds = float(query.get("seconds", PROFILE_DURATION))
+        if not 0 < seconds <= 300:
+            raise ValueError("seconds must be in (0, 300]")
+        return self.folded(self.profile(seconds))
+
+    def install_signal_handlers(
+        self,
+        profile_signum: int = signal.SIGUSR1,
+        timers_signum: int = signal.SIGUSR2,
+    ) -> None:
+        """
+        Starts a profile on profile_signum (e.g. `kill -USR1 <pid>`)
+        and switches the stage timers on / off on timers_signum. Must be called from the main thread.
+
+        :param profile_signum: signal that starts a profile
+        :type profile_signum: int
+        :param timers_signum: signal that switches the stage timers
+        :type timers_signum: int
+        :return: None
+        """
+        signal.signal(profile_signum, lambda *_: self.start())
+        signal.signal(
+            timers_signum, lambda *_: set_stage_timers(not stage_timers_enabled())
+        )
@@ -0,0 +1,69 @@
+import hashlib
+import hmac
+import socket
+from functools import lru_cache
+
+from src.config import PSEUDONYM_KEY
+from .ch2tfUtil import sha3_hash
+
+
+class PrefixPreservingPseudonymizer:
+    """
+    Keyed, prefix-preserving pseudonyms of IPv4 / IPv6 addresses (in the manner of Crypto-PAn):
+    bit i of the pseudonym is bit i of the address, flipped by a pseudorandom function of the first i bits.
+    Addresses that share a prefix of n bits therefore have pseudonyms that share a prefix of n bits,
+    i.e. traffic can be aggregated per prefix without revealing the addresses.
+    The pseudonyms are valid addresses of the same family. All ASes have to use the same key.
+    """
+
+    def __init__(self, key: bytes, cache_size: int = 1 << 20):
+        """
+        :param key: secret shared by the collaborating ASes
+        :type key: bytes
+        :param cache_size: number of cached prefix bits, addresses with a common prefix share them
+        :type cache_size: int
+        """
+        self.key = key
+        self._flip = lru_cache(maxsize=cache_size)(self._prf)
+
+    def _prf(self, bits: int, length: int, prefix: int) -> int:
+        message = bytes((bits >> 3, length)) + prefix.to_bytes(16, "big")
+        return hmac.new(self.key, message, hashlib.sha256).digest()[0] >> 7
+
+    def pseudonymize(self, ip: str) -> str:
+        """
+        :param ip: IPv4 or IPv6 address
+        :type ip: str
+        :return: the pseudonym, an address of the same family
+        :rtype: str
+        """
+        family = socket.AF_INET6 if ":" in ip else socket.AF_INET
+        packed = socket.inet_pton(family, ip)
+        bits = len(packed) * 8
+        value = int.from_bytes(packed, "big")
+        result = 0
+        for i in range(bits):
+            bit = (value >> (bits - 1 - i)) & 1
+            result = (result << 1) | (bit ^ self._flip(bits, i, value >> (bits - i)))
+        return socket.inet_ntop(family, result.to_bytes(len(packed), "big"))
+
+
+_pseudonymizer = (
+    PrefixPreservingPseudonymizer(PSEUDONYM_KEY.encode()) if PSEUDONYM_KEY else None
+)
+
+
+@lru_cache(maxsize=1 << 20)
+def hash_ip(ip: str) -> str:
+    """
+    Hides an address in hashed mode (USE_HASH): a prefix-preserving pseudonym if PSEUDONYM_KEY is set,
+    the sha3 hash otherwise. Unlike hashes, pseudonyms can still be aggregated per prefix.
+
+    :param ip: address
+    :type ip: str
+    :return: pseudonym or hash of the address
+    :rtype: str
+    """
+    if _pseudonymizer is None:
+        return sha3_hash(ip)
+    return _pseudonymizer.pseudonymize(ip)
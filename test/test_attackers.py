@@ -0,0 +1,104 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from src.ch2tf import ConfirmedAttackerTable
+from src.enums import DecisionEnum, DetectionEnum
+from src.mitigation import BlocklistMitigation, NftablesWriter, NoMitigation
+from src.models import DefenseCollaborationResponseData
+from src.simulation import Simulation, synthetic_managed_ips
+
+
+class ConfirmedAttackerTableTest(unittest.TestCase):
+    def test_expiry_refresh_and_removal(self):
+        table = ConfirmedAttackerTable(ttl_periods=2, max_entries=3)
+        self.assertEqual(2, table.add(["a", "b"], "v"))
+        table.packets[("a", "v")] += 5
+        self.assertEqual({("a", "v"): 5}, table.rollover())
+        self.assertEqual({}, table.packets)
+
+        # b is confirmed again and expires one period later than a
+        self.assertEqual(1, table.add(["b", "c", "d", "e"], "v"))
+        self.assertNotIn(("d", "v"), table)
+        self.assertTrue(table.remove("c", "v"))
+        self.assertFalse(table.remove("c", "v"))
+        table.rollover()
+        self.assertNotIn(("a", "v"), table)
+        self.assertIn(("b", "v"), table)
+        table.rollover()
+        self.assertEqual(0, len(table))
+
+    def test_attackers_are_confirmed_per_victim(self):
+        table = ConfirmedAttackerTable(ttl_periods=2, max_entries=3)
+        table.add(["a"], "v")
+        self.assertIn(("a", "v"), table)
+        self.assertNotIn(("a", "w"), table)
+
+
+class BlockingMitigation(NoMitigation):
+    active = True
+
+
+@mock.patch("src.ch2tf.ch2tf.ATTACKER_FAST_PATH", True)
+class FastPathTest(unittest.TestCase):
+    def setUp(self):
+        managed_ips = synthetic_managed_ips(["as0", "as1"], 10)
+        self.simulation = Simulation(
+            managed_ips, use_hash=False, mitigation_factory=BlockingMitigation
+        )
+        self.ch2tf = self.simulation.nodes["as0"].ch2tf
+        self.victim = managed_ips["as0"][0]
+        self.attacker = managed_ips["as1"][0]
+        # an own request for the victim
+        self.ch2tf._send_collab_requests(
+            self.victim, {self.attacker: 500}, DetectionEnum.THRESHOLD, 500, 500
+        )
+        self.request_id = next(key for key, _ in self.ch2tf.state.req_dict.items())
+
+    def respond(self) -> None:
+        response = DefenseCollaborationResponseData(
+            request_id=self.request_id,
+            ack_potential_attacker_ips=[self.attacker],
+            decision=DecisionEnum.FOUND,
+            request_originator="as0",
+            as_name="as1",
+        )
+        message = mock.Mock(value=response.to_json())
+        self.ch2tf.handle_collab_res(message, topic="lowprob.RES")
+
+    def test_confirmed_for_the_victim_only(self):
+        self.respond()
+        self.assertIn((self.attacker, self.victim), self.ch2tf.attackers)
+        self.ch2tf.store_batch(
+            [self.attacker] * 3, [self.victim, "10.9.9.9", "10.9.9.9"]
+        )
+        # only the traffic to the victim is kept out of the tables
+        self.assertNotIn(self.victim, self.ch2tf.state.dest_dict)
+        self.assertEqual(2, self.ch2tf.state.dest_dict["10.9.9.9"][self.attacker])
+
+    def test_confirmed_with_blocklist_mitigation(self):
+        with tempfile.TemporaryDirectory() as directory:
+            mitigation = BlocklistMitigation(
+                NftablesWriter(os.path.join(directory, "blocklist")),
+                clock=self.simulation.clock,
+            )
+            self.ch2tf.mitigation = mitigation
+            # nothing is blocked yet, the mitigation blocks nevertheless
+            self.assertIs(True, mitigation.active)
+            self.respond()
+            self.assertIn((self.attacker, self.victim), self.ch2tf.attackers)
+
+    def test_not_confirmed_without_blocking_mitigation(self):
+        self.ch2tf.mitigation = NoMitigation()
+        self.respond()
+        self.assertEqual(0, len(self.ch2tf.attackers))
+
+    def test_not_confirmed_by_ases_with_low_reputation(self):
+        self.ch2tf.state.reputation_dict.put("as1", 0.2, owner="as1")
+        self.respond()
+        self.assertEqual(0, len(self.ch2tf.attackers))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,223 @@
+import os
+import tempfile
+import unittest
+
+from src.mitigation import (
+    BlocklistMitigation,
+    NftablesWriter,
+    IpsetWriter,
+    NoMitigation,
+    create_mitigation,
+)
+from src.mitigation.blocklist import _apply_errors
+from src.simulation import Simulation, synthetic_managed_ips, synthetic_traffic
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class BlocklistMitigationTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "blocklist")
+        self.clock = Clock()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def read(self, path: str) -> str:
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+
+    def last_diff(self, mitigation: BlocklistMitigation) -> str:
+        return self.read(mitigation.writer.diff_path(mitigation.writer.sequence))
+
+    def mitigation(self, writer) -> BlocklistMitigation:
+        return BlocklistMitigation(
+            writer, ttl=10, flush_interval=1, max_entries=3, clock=self.clock
+        )
+
+    def test_coalesces_and_writes_diffs(self):
+        mitigation = self.mitigation(NftablesWriter(self.path))
+        self.assertIn("set blocklist4", self.read(self.path + ".full"))
+
+        mitigation.filter_ips(["10.0.0.2", "10.0.0.1"])
+        mitigation.filter_ips(["10.0.0.1", "fe80::1", "a1b2c3"])
+        self.assertEqual([], mitigation.writer.diff_paths())
+
+        self.clock.now = 1
+        mitigation.filter_ip("10.0.0.1")
+        self.assertEqual(
+            "add element inet ch2tf blocklist4 { 10.0.0.1, 10.0.0.2 }\n"
+            "add element inet ch2tf blocklist6 { fe80::1 }\n",
+            self.last_diff(mitigation),
+        )
+        self.assertEqual({"10.0.0.1", "10.0.0.2", "fe80::1"}, set(mitigation._expiry))
+
+        # refreshed entries stay, the others expire
+        self.clock.now = 5
+        mitigation.filter_ips(["10.0.0.2"])
+        mitigation.flush()
+        self.clock.now = 12
+        mitigation.flush()
+        self.assertEqual(
+            "delete element inet ch2tf blocklist4 { 10.0.0.1 }\n"
+            "delete element inet ch2tf blocklist6 { fe80::1 }\n",
+            self.last_diff(mitigation),
+        )
+        self.assertEqual(["10.0.0.2"], list(mitigation._expiry))
+
+    def test_ipset_and_max_entries(self):
+        mitigation = self.mitigation(IpsetWriter(self.path))
+        mitigation.filter_ips(["10.0.0.1", "10.0.0.2", "10.0.0.3", "10.0.0.4"])
+        mitigation.flush()
+        self.assertEqual(3, len(mitigation._expiry))
+        self.assertEqual(3, self.last_diff(mitigation).count("add ch2tf-blocklist4 "))
+        self.assertIn(
+            "create ch2tf-blocklist6 hash:net family inet6 -exist",
+            self.read(self.path + ".full"),
+        )
+
+    def test_prefixes_replace_the_entries_they_cover(self):
+        mitigation = self.mitigation(NftablesWriter(self.path))
+        mitigation.max_entries = 10
+        mitigation.filter_ips(["10.0.0.5", "10.0.1.5/32", "fe80::1"])
+        mitigation.flush()
+        self.assertEqual({"10.0.0.5", "10.0.1.5", "fe80::1"}, set(mitigation._expiry))
+
+        self.clock.now = 1
+        mitigation.filter_ips(["10.0.0.7/24", "10.0.0.9"])
+        mitigation.flush()
+        # the host is deleted before the prefix is added, the new host is covered by the prefix
+        self.assertEqual(
+            "delete element inet ch2tf blocklist4 { 10.0.0.5 }\n"
+            "add element inet ch2tf blocklist4 { 10.0.0.0/24 }\n",
+            self.last_diff(mitigation),
+        )
+        self.assertEqual(
+            {"10.0.0.0/24", "10.0.1.5", "fe80::1"}, set(mitigation._expiry)
+        )
+
+        self.clock.now = 2
+        mitigation.filter_ips(["10.0.0.0/16", "10.0.2.0/24"])
+        mitigation.flush()
+        self.assertEqual(
+            "delete element inet ch2tf blocklist4 { 10.0.0.0/24, 10.0.1.5 }\n"
+            "add element inet ch2tf blocklist4 { 10.0.0.0/16 }\n",
+            self.last_diff(mitigation),
+        )
+        self.assertEqual({"10.0.0.0/16", "fe80::1"}, set(mitigation._expiry))
+
+    def test_diffs_are_numbered(self):
+        mitigation = self.mitigation(IpsetWriter(self.path))
+        mitigation.filter_ips(["10.0.0.1"])
+        mitigation.flush()
+        mitigation.filter_ips(["10.0.0.2"])
+        mitigation.flush()
+        first, second = mitigation.writer.diff_paths()
+        self.assertEqual("add ch2tf-blocklist4 10.0.0.1 -exist\n", self.read(first))
+        self.assertEqual("add ch2tf-blocklist4 10.0.0.2 -exist\n", self.read(second))
+
+    def test_snapshot_and_diffs_replay_the_blocklist(self):
+        def replay() -> set:
+            # as ipset restore, the snapshot first and then the diffs in their order
+            blocked = set()
+            paths = [mitigation.writer.snapshot_path, *mitigation.writer.diff_paths()]
+            for path in paths:
+                for line in self.read(path).splitlines():
+                    command, _, *args = line.split()
+                    match command:
+                        case "flush":
+                            blocked.clear()
+                        case "add":
+                            blocked.add(args[0])
+                        case "del":
+                            blocked.discard(args[0])
+            return blocked
+
+        mitigation = BlocklistMitigation(
+            IpsetWriter(self.path),
+            ttl=3,
+            flush_interval=0,
+            max_entries=100,
+            snapshot_diffs=4,
+            clock=self.clock,
+        )
+        for second in range(1, 20):
+            self.clock.now = second
+            mitigation.filter_ips([f"10.0.0.{second}", f"10.0.1.{second % 4}"])
+            self.assertEqual(set(mitigation._expiry), replay())
+            self.assertLess(len(mitigation.writer.diff_paths()), 4)
+        self.assertIn(
+            "add ch2tf-blocklist4 10.0.0.16 -exist",
+            self.read(mitigation.writer.snapshot_path),
+        )
+
+    def test_apply_failures_are_counted(self):
+        class FailingWriter(NftablesWriter):
+            apply_command = ("false",)
+
+        errors = _apply_errors.labels()
+        before = errors.value
+        mitigation = self.mitigation(FailingWriter(self.path, apply=True))
+        mitigation.filter_ips(["10.0.0.1"])
+        with self.assertLogs("Mitigation", level="ERROR"):
+            mitigation.flush()
+        self.assertEqual(before + 2, errors.value)
+
+
+class CreateMitigationTest(unittest.TestCase):
+    def test_blocklists_require_plain_addresses(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "blocklist")
+            for name in ("nftables", "ipset"):
+                with self.assertRaises(ValueError):
+                    create_mitigation(name, path, use_hash=True)
+                self.assertIsInstance(
+                    create_mitigation(name, path, use_hash=False), BlocklistMitigation
+                )
+        self.assertIsInstance(create_mitigation("none", use_hash=True), NoMitigation)
+
+
+class BlockRefreshTest(unittest.TestCase):
+    def test_attackers_stay_blocked_during_the_attack(self):
+        class RecordingMitigation(BlocklistMitigation):
+            def flush(self) -> None:
+                super().flush()
+                history.append((self.clock(), len(self._expiry)))
+
+        history: list = []
+        managed_ips = synthetic_managed_ips(["as0", "as1"], 50)
+        traffic = synthetic_traffic(
+            managed_ips,
+            duration=120,
+            rate=1,
+            victim_as="as0",
+            attack_start=5,
+            attack_duration=115,
+            attack_rate=200,
+            attackers=10,
+        )
+        simulation = Simulation(managed_ips, analysis_period=5, use_hash=False)
+        with tempfile.TemporaryDirectory() as directory:
+            simulation.nodes["as0"].ch2tf.mitigation = RecordingMitigation(
+                NftablesWriter(os.path.join(directory, "blocklist")),
+                ttl=30,
+                clock=simulation.clock,
+            )
+            simulation.run(traffic, duration=120, attack_start=5)
+        first = next(i for i, (_, n) in enumerate(history) if n)
+        during_attack = [n for t, n in history[first:] if t <= 115]
+        # the blocks are refreshed each period, they do not expire after the ttl
+        self.assertLess(history[first][0], 30)
+        self.assertGreater(len(during_attack), 15)
+        self.assertGreaterEqual(min(during_attack), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+from unittest import mock
+
+from src.ch2tf import CH2TF
+from src.ch2tf.campaign import CampaignManager, CampaignVerdictCache
+from src.enums import DecisionEnum, DetectionEnum
+from src.models import DefenseCollaborationRequestData
+from src.simulation import Simulation, synthetic_managed_ips
+
+
+class CampaignManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.campaigns = CampaignManager(idle_periods=2, change_ratio=2.0)
+
+    def test_delta_sends_new_and_changed_sources(self):
+        campaign_id, sent = self.campaigns.delta("v", {"a": 10, "b": 10})
+        self.assertEqual(["a", "b"], sent)
+        # a unchanged, b doubled, c new
+        next_id, sent = self.campaigns.delta("v", {"a": 15, "b": 20, "c": 1})
+        self.assertEqual(campaign_id, next_id)
+        self.assertEqual(["b", "c"], sent)
+        # compared with the packets when they were sent last, not when they were seen last
+        self.assertEqual(["a"], self.campaigns.delta("v", {"a": 20, "b": 30})[1])
+
+    def test_local_delta_is_kept_apart(self):
+        campaign_id, _ = self.campaigns.delta("v", {"a": 10})
+        self.assertEqual(
+            (campaign_id, ["a"]), self.campaigns.delta("v", {"a": 10}, local=True)
+        )
+        self.assertEqual([], self.campaigns.delta("v", {"a": 10}, local=True)[1])
+
+    def test_campaigns_per_victim(self):
+        v_id, _ = self.campaigns.delta("v", {"a": 10})
+        w_id, sent = self.campaigns.delta("w", {"a": 10})
+        self.assertNotEqual(v_id, w_id)
+        self.assertEqual(["a"], sent)
+
+    def test_idle_campaigns_end(self):
+        v_id, _ = self.campaigns.delta("v", {"a": 10})
+        w_id, _ = self.campaigns.delta("w", {"a": 10})
+        self.assertEqual([], self.campaigns.end_period())
+        self.assertEqual([], self.campaigns.end_period())
+        # w is detected again, its idle periods start anew
+        self.campaigns.delta("w", {"a": 10})
+        self.assertEqual([v_id], self.campaigns.end_period())
+        self.assertNotIn("v", self.campaigns.campaigns)
+
+        # a new campaign that sends all sources again
+        new_id, sent = self.campaigns.delta("v", {"a": 10})
+        self.assertNotEqual(v_id, new_id)
+        self.assertEqual(["a"], sent)
+        self.assertEqual([], self.campaigns.end_period())
+        self.assertEqual([w_id], self.campaigns.end_period())
+
+
+class CampaignVerdictCacheTest(unittest.TestCase):
+    def test_verdicts_of_idle_campaigns_are_dropped(self):
+        cache = CampaignVerdictCache(idle_periods=1)
+        cache.get_campaign("c1")["a"] = DecisionEnum.FOUND
+        cache.get_campaign("c2")["a"] = DecisionEnum.NOT_MANAGED
+        cache.end_period()
+        self.assertEqual({"a": DecisionEnum.FOUND}, cache.get_campaign("c1"))
+        cache.end_period()
+        self.assertEqual({"a": DecisionEnum.FOUND}, cache.get_campaign("c1"))
+        self.assertEqual({}, cache.get_campaign("c2"))
+
+
+class CampaignVerdictsTest(unittest.TestCase):
+    def setUp(self):
+        managed_ips = synthetic_managed_ips(["as0", "as1"], 10)
+        self.simulation = Simulation(managed_ips, use_hash=False)
+        self.ch2tf = self.simulation.nodes["as1"].ch2tf
+        self.victim = managed_ips["as0"][0]
+        self.under_threshold = managed_ips["as1"][0]
+        self.not_managed = managed_ips["as0"][1]
+        self.ch2tf.store_batch([self.under_threshold], [self.victim])
+
+    def request(self) -> None:
+        request = DefenseCollaborationRequestData(
+            potential_attacker_ips=[self.under_threshold, self.not_managed],
+            potential_victim=self.victim,
+            request_detection=DetectionEnum.THRESHOLD,
+            requests_relative_to_size=1.0,
+            request_originator="as0",
+            campaign_id="c1",
+        )
+        self.ch2tf.handle_collab_req(def_collab_req=request, topics=["lowprob"])
+
+    @mock.patch.object(CH2TF, "_is_larger_than_own_threshold", return_value=True)
+    def test_sources_under_the_thresholds_are_analysed_once_per_period(self, _):
+        analysis = self.ch2tf.attacker_analysis
+        with mock.patch.object(
+            analysis, "run_analysis", wraps=analysis.run_analysis
+        ) as run_analysis:
+            # two chunks of the campaign in the same period
+            self.request()
+            self.request()
+            self.assertEqual(1, run_analysis.call_count)
+            self.assertEqual(
+                {"c1": {self.not_managed: DecisionEnum.NOT_MANAGED}},
+                {c: v for c, (_, v) in self.ch2tf.campaign_verdicts.verdicts.items()},
+            )
+            # the traffic of the next period may exceed the thresholds
+            self.ch2tf.reset_data()
+            self.request()
+            self.assertEqual(2, run_analysis.call_count)
+
+
+if __name__ == "__main__":
+    unittest.main()
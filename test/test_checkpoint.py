@@ -0,0 +1,104 @@
+import copy
+import tempfile
+import unittest
+from collections import Counter
+
+from src.ch2tf.checkpoint import Checkpointer, read_snapshot, write_snapshot
+from src.simulation import Simulation, synthetic_managed_ips, synthetic_traffic
+
+
+class SnapshotTest(unittest.TestCase):
+    def test_tables_are_restored_from_the_mapped_file(self):
+        src_dict_tm1 = {
+            "10.0.0.2": Counter({"10.1.0.1": 3, "2001:db8::1": 1}),
+            "10.0.0.1": Counter({"10.1.0.1": 7}),
+            "a" * 64: Counter({"10.1.0.2": 2}),
+        }
+        dest_dict_aggregated = {"10.1.0.1": 10, "2001:db8::1": 2.5}
+        reputation = [("as1", 0.8, 30.0), ("as2", 1.1, 5.0)]
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/snapshot.ckpt"
+            write_snapshot(
+                path, src_dict_tm1, dest_dict_aggregated, reputation, 0.5, 1000.0
+            )
+            snapshot = read_snapshot(path)
+
+        self.assertEqual(src_dict_tm1, dict(snapshot.src_dict_tm1))
+        self.assertEqual({}, snapshot.src_dict_tm1.get("10.0.0.3", {}))
+        self.assertNotIn("10.0.0.1" * 10, snapshot.src_dict_tm1)
+        self.assertIs(
+            snapshot.src_dict_tm1, copy.deepcopy(snapshot.src_dict_tm1.copy())
+        )
+        self.assertEqual(dest_dict_aggregated, dict(snapshot.dest_dict_aggregated))
+        self.assertEqual(0, snapshot.dest_dict_aggregated.get("10.1.0.2", 0))
+        self.assertEqual(reputation, snapshot.reputation)
+        self.assertEqual((0.5, 1000.0), (snapshot.sampling_rate, snapshot.created))
+
+    def test_empty_tables(self):
+        with tempfile.TemporaryDirectory() as directory:
+            write_snapshot(f"{directory}/empty.ckpt", {}, {}, [])
+            snapshot = read_snapshot(f"{directory}/empty.ckpt")
+        self.assertEqual(0, len(snapshot.src_dict_tm1))
+        self.assertEqual({}, snapshot.src_dict_tm1.get("10.0.0.1", {}))
+
+
+class CheckpointRestoreTest(unittest.TestCase):
+    def test_restart_continues_with_the_state_of_the_last_period(self):
+        managed_ips = synthetic_managed_ips(["as0", "as1", "as2"], 50)
+        traffic = synthetic_traffic(
+            managed_ips,
+            duration=15,
+            rate=50,
+            victim_as="as0",
+            attack_start=5,
+            attack_duration=10,
+            attack_rate=500,
+            attackers=10,
+        )
+        now = [1000.0]
+        with tempfile.TemporaryDirectory() as directory:
+            simulation = Simulation(managed_ips, analysis_period=5, use_hash=False)
+            ch2tf = simulation.nodes["as1"].ch2tf
+            ch2tf.checkpointer = Checkpointer(
+                directory, periods=1, keep=2, max_age=60, clock=lambda: now[0]
+            )
+            ch2tf.state.reputation_dict.put("as0", 0.4, owner="as0")
+            simulation.run(traffic, duration=15)
+            # as on shutdown
+            ch2tf.checkpoint(wait=True)
+            ch2tf.checkpointer.close()
+            self.assertEqual(2, len(ch2tf.checkpointer.snapshots()))
+            self.assertTrue(ch2tf.state.src_dict_tm1)
+
+            restarted = Simulation(managed_ips, analysis_period=5, use_hash=False)
+            restored = restarted.nodes["as1"].ch2tf
+            restored.checkpointer = Checkpointer(
+                directory, max_age=60, clock=lambda: now[0]
+            )
+            self.assertTrue(restored.restore_checkpoint())
+            self.assertEqual(
+                ch2tf.state.src_dict_tm1, dict(restored.state.src_dict_tm1)
+            )
+            self.assertEqual(
+                ch2tf.state.dest_dict_aggregated,
+                dict(restored.state.dest_dict_aggregated),
+            )
+            self.assertEqual(0.4, restored.state.reputation_dict.get("as0"))
+            # the next period is analysed with the restored tables
+            restored.analyse_period(1)
+            self.assertIsInstance(restored.state.src_dict_tm1, dict)
+
+            # too old: only the reputations are restored
+            now[0] += 120
+            stale = Simulation(managed_ips, analysis_period=5, use_hash=False)
+            stale_ch2tf = stale.nodes["as1"].ch2tf
+            stale_ch2tf.checkpointer = Checkpointer(
+                directory, max_age=60, clock=lambda: now[0]
+            )
+            self.assertTrue(stale_ch2tf.restore_checkpoint())
+            self.assertEqual({}, stale_ch2tf.state.src_dict_tm1)
+            self.assertEqual(0.4, stale_ch2tf.state.reputation_dict.get("as0"))
+
+
+if __name__ == "__main__":
+    unittest.main()
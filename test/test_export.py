@@ -0,0 +1,144 @@
+import importlib.util
+import os
+import tempfile
+import threading
+import unittest
+from collections import Counter
+
+from src.ch2tf.export import ArrowWriter, ColumnarWriter, EpochExporter, TABLES
+from src.simulation import Simulation, synthetic_managed_ips, synthetic_traffic
+
+
+class MemoryWriter(ColumnarWriter):
+    def __init__(self, blocked: threading.Event | None = None):
+        self.batches = []
+        self.rotations = 0
+        self.blocked = blocked
+        self.writing = threading.Event()
+
+    def write(self, table, columns):
+        self.writing.set()
+        if self.blocked is not None:
+            self.blocked.wait()
+        self.batches.append((table, columns))
+
+    def rotate(self):
+        self.rotations += 1
+
+    def rows(self, table):
+        return [
+            dict(zip(columns, row))
+            for name, columns in self.batches
+            if name == table
+            for row in zip(*columns.values())
+        ]
+
+
+class EpochExporterTest(unittest.TestCase):
+    def test_periods_of_the_collaboration_are_exported(self):
+        managed_ips = synthetic_managed_ips(["as0", "as1", "as2"], 200)
+        traffic = synthetic_traffic(
+            managed_ips,
+            duration=30,
+            rate=50,
+            victim_as="as0",
+            attack_start=10,
+            attack_duration=15,
+            attack_rate=500,
+            attackers=20,
+        )
+        simulation = Simulation(managed_ips, analysis_period=5, use_hash=False)
+        writers = {}
+        for name in ("as0", "as1"):
+            writers[name] = MemoryWriter()
+            simulation.nodes[name].ch2tf.exporter = EpochExporter(
+                name,
+                writers[name],
+                top_n=3,
+                batch_periods=4,
+                rotate_periods=0,
+                clock=simulation.clock,
+            )
+        simulation.run(traffic, duration=30)
+        for name in writers:
+            simulation.nodes[name].ch2tf.exporter.close()
+        writer = writers["as0"]
+        victim = managed_ips["as0"][0]
+
+        # 6 periods in two batches, the writer is closed once
+        self.assertEqual(2, len([t for t, _ in writer.batches if t == "destinations"]))
+        self.assertEqual(1, writer.rotations)
+        destinations = writer.rows("destinations")
+        # before the attack no packets are kept out of the tables
+        self.assertEqual(
+            simulation.timeline[0].packets["as0"],
+            sum(r["packets"] for r in destinations if r["epoch"] == 1),
+        )
+        top = [r for r in writer.rows("top_sources") if r["destination"] == victim]
+        self.assertTrue(top)
+        for epoch in {r["epoch"] for r in top}:
+            ranked = [r["packets"] for r in top if r["epoch"] == epoch]
+            self.assertLessEqual(len(ranked), 3)
+            self.assertEqual(sorted(ranked, reverse=True), ranked)
+
+        self.assertIn(
+            (3, victim, "THRESHOLD"),
+            {
+                (r["epoch"], r["victim"], r["detection_case"])
+                for r in writer.rows("detections")
+            },
+        )
+        sent = {r["request_id"] for r in writer.rows("requests") if r["role"] == "sent"}
+        self.assertTrue(sent)
+        handled = [
+            r
+            for r in writers["as1"].rows("requests")
+            if r["role"] == "handled" and r["request_id"] in sent
+        ]
+        self.assertTrue(any(r["decision"] == "FOUND" for r in handled))
+        responses = writer.rows("responses")
+        self.assertIn(
+            ("as1", "FOUND"), {(r["responder"], r["decision"]) for r in responses}
+        )
+        self.assertTrue(
+            all(set(r) == {n for n, _ in TABLES["responses"]} for r in responses)
+        )
+
+    def test_analysis_is_not_blocked_by_the_writer(self):
+        blocked = threading.Event()
+        writer = MemoryWriter(blocked)
+        exporter = EpochExporter(
+            "as0", writer, batch_periods=1, rotate_periods=0, queue_size=1
+        )
+        dest_dict = {"10.0.0.1": Counter({"10.1.0.1": 5})}
+        results = [exporter.end_epoch(1, dest_dict, [])]
+        self.assertTrue(writer.writing.wait(5))
+        results += [exporter.end_epoch(epoch, dest_dict, []) for epoch in range(2, 5)]
+        # the first period is being written, the second one waits, the others are dropped
+        self.assertEqual([True, True, False, False], results)
+        blocked.set()
+        exporter.close()
+        self.assertEqual([1, 2], [r["epoch"] for r in writer.rows("destinations")])
+
+
+@unittest.skipUnless(importlib.util.find_spec("pyarrow"), "requires pyarrow")
+class ArrowWriterTest(unittest.TestCase):
+    def test_batches_are_appended_to_ipc_streams(self):
+        import pyarrow
+
+        with tempfile.TemporaryDirectory() as directory:
+            exporter = EpochExporter(
+                "as0", ArrowWriter(directory, "arrow", "as0"), batch_periods=1
+            )
+            for epoch in (1, 2):
+                exporter.end_epoch(epoch, {"10.0.0.1": Counter({"10.1.0.1": 5})}, [])
+            exporter.close()
+            (name,) = os.listdir(f"{directory}/destinations")
+            with pyarrow.ipc.open_stream(f"{directory}/destinations/{name}") as reader:
+                table = reader.read_all()
+        self.assertEqual([1, 2], table.column("epoch").to_pylist())
+        self.assertEqual([5, 5], table.column("packets").to_pylist())
+
+
+if __name__ == "__main__":
+    unittest.main()
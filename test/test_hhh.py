@@ -0,0 +1,133 @@
+import unittest
+from collections import Counter, defaultdict
+from unittest import mock
+
+from src.ch2tf import HeavyHitterAnalysis
+from src.ch2tf.hhh import aggregate_sources, parse_prefix, PrefixIndex
+from src.simulation import Simulation, synthetic_managed_ips, synthetic_traffic
+from src.util import pseudonym
+from src.util.pseudonym import PrefixPreservingPseudonymizer
+
+
+class PseudonymTest(unittest.TestCase):
+    def test_common_prefixes_are_preserved(self):
+        pseudonymizer = PrefixPreservingPseudonymizer(b"key")
+        a = pseudonymizer.pseudonymize("10.1.2.3")
+        b = pseudonymizer.pseudonymize("10.1.2.200")
+        c = pseudonymizer.pseudonymize("10.1.3.3")
+        self.assertNotEqual("10.1.2.3", a)
+        self.assertEqual(a.rsplit(".", 1)[0], b.rsplit(".", 1)[0])
+        self.assertEqual(a.split(".")[:2], c.split(".")[:2])
+        self.assertNotEqual(a.rsplit(".", 1)[0], c.rsplit(".", 1)[0])
+        self.assertEqual(
+            a, PrefixPreservingPseudonymizer(b"key").pseudonymize("10.1.2.3")
+        )
+        self.assertNotEqual(
+            a, PrefixPreservingPseudonymizer(b"other").pseudonymize("10.1.2.3")
+        )
+        v6 = pseudonymizer.pseudonymize("2001:db8::1")
+        self.assertEqual(
+            v6.split(":")[:2], pseudonymizer.pseudonymize("2001:db8::2").split(":")[:2]
+        )
+
+
+class AggregateSourcesTest(unittest.TestCase):
+    def test_longest_prefixes_first_and_heavy_hitters_kept(self):
+        sources = {f"10.1.{i % 4}.{i}": 2 for i in range(40)}
+        sources["10.1.0.250"] = 100
+        sources["10.2.0.1"] = 2
+        sources["hash"] = 3
+        aggregated, prefixes = aggregate_sources(
+            sources, threshold=15, min_sources=4, heavy_hitter=10
+        )
+        # each /24 has 10 sources with 20 packets
+        self.assertEqual(
+            ["10.1.0.0/24", "10.1.1.0/24", "10.1.2.0/24", "10.1.3.0/24"],
+            sorted(prefixes),
+        )
+        self.assertEqual(20, aggregated["10.1.0.0/24"])
+        self.assertEqual(
+            {"10.1.0.250": 100, "10.2.0.1": 2, "hash": 3},
+            {k: v for k, v in aggregated.items() if k not in prefixes},
+        )
+
+        aggregated, prefixes = aggregate_sources(
+            sources, threshold=50, min_sources=4, heavy_hitter=10
+        )
+        self.assertEqual(["10.1.0.0/16"], prefixes)
+
+        index = PrefixIndex(sources, [parse_prefix("10.1.0.0/16")])
+        self.assertEqual(41, len(index.members(parse_prefix("10.1.0.0/16"))))
+
+
+class PrefixAnalysisTest(unittest.TestCase):
+    def analyse(self, sending: dict) -> set:
+        members = sorted(sending)
+        src_dict = {
+            member: {"v": num_packets} for member, num_packets in sending.items()
+        }
+        return set(
+            HeavyHitterAnalysis().run_prefix_analysis(
+                members, "v", src_dict, defaultdict(Counter), src_dict_tm1={}
+            )
+        )
+
+    def test_each_acknowledged_source_contributes(self):
+        # HHH_THRESHOLD=50, HHH_MIN_SOURCES=4, THRESHOLD_SRC_1=10 (.env)
+        botnet = {f"10.1.0.{i}": 8 for i in range(8)}
+        botnet["10.1.0.100"] = 1
+        self.assertEqual(set(botnet) - {"10.1.0.100"}, self.analyse(botnet))
+
+    def test_heavy_source_does_not_acknowledge_its_neighbours(self):
+        sending = {f"10.1.0.{i}": 1 for i in range(10)}
+        sending["10.1.0.100"] = 500
+        self.assertEqual({"10.1.0.100"}, self.analyse(sending))
+
+
+class HierarchicalHeavyHitterSimulationTest(unittest.TestCase):
+    def run_botnet(self, use_hash: bool):
+        as_names = ["as0", "as1", "as2"]
+        managed_ips = synthetic_managed_ips(as_names, 250)
+        # 400 attackers, each below the thresholds of a single source
+        traffic = synthetic_traffic(
+            managed_ips,
+            duration=30,
+            rate=50,
+            victim_as="as0",
+            attack_start=10,
+            attack_duration=15,
+            attack_rate=100,
+            attackers=400,
+        )
+        simulation = Simulation(managed_ips, analysis_period=5, use_hash=use_hash)
+        return simulation.run(traffic, duration=30, attack_start=10), simulation
+
+    def test_botnet_is_only_found_by_prefix(self):
+        result, _ = self.run_botnet(use_hash=False)
+        self.assertEqual({}, result.mitigation_latency)
+
+        with mock.patch("src.ch2tf.ch2tf.HHH_ENABLED", True):
+            result, simulation = self.run_botnet(use_hash=False)
+        self.assertEqual({"as1", "as2"}, set(result.mitigation_latency["10.0.0.0"]))
+        first = next(r for r in simulation.timeline if r.detections)
+        self.assertEqual(
+            {"10.1.0.0/24", "10.2.0.0/24"}, set(first.detections["as0"][0].prefixes)
+        )
+
+    @mock.patch("src.ch2tf.ch2tf.HHH_ENABLED", True)
+    @mock.patch.object(
+        pseudonym, "_pseudonymizer", PrefixPreservingPseudonymizer(b"shared key")
+    )
+    def test_botnet_is_found_with_pseudonyms(self):
+        pseudonym.hash_ip.cache_clear()
+        try:
+            result, simulation = self.run_botnet(use_hash=True)
+        finally:
+            pseudonym.hash_ip.cache_clear()
+        self.assertEqual(2, len(next(iter(result.mitigation_latency.values()))))
+        first = next(r for r in simulation.timeline if r.detections)
+        self.assertEqual(2, len(first.detections["as0"][0].prefixes))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import logging
+import unittest
+
+from src.util.logs import RateLimitFilter
+
+
+def record(
+    created: float,
+    lineno: int = 1,
+    name: str = "ch2tf",
+    level: int = logging.INFO,
+) -> logging.LogRecord:
+    rec = logging.LogRecord(name, level, "file.py", lineno, "case %s", ("a",), None)
+    rec.created = created
+    return rec
+
+
+class RateLimitFilterTest(unittest.TestCase):
+    def test_limits_per_call_site_and_reports_suppressed(self):
+        rate_limit = RateLimitFilter(interval=10, burst=2)
+        passed = [rate_limit.filter(record(t)) for t in (0, 1, 2, 3)]
+        self.assertEqual([True, True, False, False], passed)
+        # other call sites are not affected
+        self.assertTrue(rate_limit.filter(record(4, lineno=2)))
+
+        summary = record(11)
+        self.assertTrue(rate_limit.filter(summary))
+        self.assertEqual("case a (2 similar messages suppressed)", summary.getMessage())
+        self.assertEqual("case a", record(12).getMessage())
+
+    def test_only_ch2tf_records_below_error_are_limited(self):
+        rate_limit = RateLimitFilter(interval=10, burst=1)
+        for lineno, name in enumerate(("ch2tf", "analysis", "ch2tf.child")):
+            self.assertTrue(rate_limit.filter(record(0, lineno, name)))
+            self.assertFalse(rate_limit.filter(record(1, lineno, name)))
+        # errors and the records of libraries are never suppressed
+        for level in (logging.ERROR, logging.CRITICAL):
+            self.assertTrue(rate_limit.filter(record(2, level=level)))
+        for name in ("kafka", "ch2tfx", "root"):
+            self.assertTrue(rate_limit.filter(record(2, name=name)))
+            self.assertTrue(rate_limit.filter(record(3, name=name)))
+
+
+if __name__ == "__main__":
+    unittest.main()
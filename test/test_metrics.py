@@ -0,0 +1,58 @@
+import unittest
+import urllib.request
+
+from src.util.metrics import Registry, start_metrics_server
+
+
+class RegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_exposition(self):
+        counter = self.registry.counter("sent_total", "Sent.", ("topic",))
+        counter.labels("a.REQ").inc()
+        counter.labels(topic="a.REQ").inc(2)
+        gauge = self.registry.gauge("depth", "Depth.")
+        gauge.labels().set_function(lambda: 7)
+        histogram = self.registry.histogram("duration", "Duration.", buckets=(0.1, 1))
+        histogram.labels().observe(0.05)
+        histogram.labels().observe(5)
+        self.assertEqual(
+            [
+                "# HELP sent_total Sent.",
+                "# TYPE sent_total counter",
+                'sent_total{topic="a.REQ"} 3',
+                "# HELP depth Depth.",
+                "# TYPE depth gauge",
+                "depth 7",
+                "# HELP duration Duration.",
+                "# TYPE duration histogram",
+                'duration_bucket{le="0.1"} 1',
+                'duration_bucket{le="1.0"} 1',
+                'duration_bucket{le="+Inf"} 2',
+                "duration_sum 5.05",
+                "duration_count 2",
+            ],
+            self.registry.expose().splitlines(),
+        )
+
+    def test_register_twice(self):
+        first = self.registry.counter("c_total", "C.", ("as_name",))
+        self.assertIs(first, self.registry.counter("c_total", "C.", ("as_name",)))
+        with self.assertRaises(ValueError):
+            self.registry.gauge("c_total", "C.")
+
+    def test_server(self):
+        self.registry.counter("c_total", "C.").labels().inc()
+        server = start_metrics_server("127.0.0.1", 0, self.registry)
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+            with urllib.request.urlopen(url, timeout=5) as response:
+                self.assertIn("c_total 1", response.read().decode())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import threading
+import time
+import unittest
+
+from src.util import profiling
+from src.util.profiling import SamplingProfiler, stopwatch, stage_timer
+
+
+def busy_loop(stop: threading.Event) -> None:
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class StopwatchTest(unittest.TestCase):
+    def tearDown(self):
+        profiling.set_stage_timers(False)
+
+    def test_only_timed_if_enabled(self):
+        timed = stopwatch("test_stage")(lambda x: x + 1)
+        histogram = stage_timer("test_stage")
+        profiling.set_stage_timers(False)
+        self.assertEqual(2, timed(1))
+        self.assertEqual(0, sum(histogram.counts))
+        profiling.set_stage_timers(True)
+        self.assertEqual(3, timed(2))
+        self.assertEqual(1, sum(histogram.counts))
+
+
+class SamplingProfilerTest(unittest.TestCase):
+    def test_profile_contains_busy_thread(self):
+        stop = threading.Event()
+        thread = threading.Thread(target=busy_loop, args=(stop,), name="busy")
+        thread.start()
+        try:
+            stacks = SamplingProfiler(interval=0.005).profile(0.2)
+        finally:
+            stop.set()
+            thread.join()
+        busy = [stack for stack in stacks if stack.startswith("busy;")]
+        self.assertTrue(busy)
+        self.assertTrue(all("busy_loop (test_profiling.py" in s for s in busy))
+        folded = SamplingProfiler.folded(stacks).splitlines()
+        self.assertTrue(all(line.rsplit(" ", 1)[1].isdigit() for line in folded))
+
+    def test_only_one_profile_at_a_time(self):
+        profiler = SamplingProfiler(interval=0.005)
+        thread = threading.Thread(target=profiler.profile, args=(0.2,))
+        thread.start()
+        time.sleep(0.05)
+        try:
+            with self.assertRaises(ValueError):
+                profiler.profile(0.1)
+            self.assertFalse(profiler.start(0.1))
+        finally:
+            thread.join()
+
+    def test_route_validates_seconds(self):
+        with self.assertRaises(ValueError):
+            SamplingProfiler().route({"seconds": "0"})
+
+
+if __name__ == "__main__":
+    unittest.main()
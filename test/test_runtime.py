@@ -0,0 +1,132 @@
+import asyncio
+import queue
+import threading
+import time
+import unittest
+from unittest import mock
+
+from src.ch2tf import CH2TFRuntime
+from src.models import PacketData
+from src.simulation import Simulation, synthetic_managed_ips
+
+
+def packet(src: str, dst: str) -> PacketData:
+    return PacketData(
+        src=src,
+        dst=dst,
+        srcport="80",
+        dstport="80",
+        timestamp=None,  # type: ignore
+        transport_layer="TCP",
+    )
+
+
+class CH2TFRuntimeTest(unittest.TestCase):
+    def test_stop_drains_queue_and_analyses(self):
+        managed_ips = synthetic_managed_ips(["as0", "as1"], 50)
+        simulation = Simulation(managed_ips, use_hash=False)
+        ch2tf = simulation.nodes["as0"].ch2tf
+        ch2tf.queue = queue.Queue()
+        victim = managed_ips["as0"][0]
+        for i in range(2000):
+            ch2tf.queue.put(packet(managed_ips["as1"][i % 50], victim))
+        # the period is longer than the test, the packets are only analysed when stopping
+        runtime = CH2TFRuntime(ch2tf, analysis_period=3600)
+
+        async def run() -> None:
+            task = asyncio.create_task(runtime.run())
+            await asyncio.sleep(0.3)
+            runtime.stop()
+            await task
+
+        asyncio.run(run())
+        self.assertTrue(ch2tf.queue.empty())
+        self.assertEqual(1, runtime.iteration)
+        self.assertIn(victim, ch2tf.alarm_dict)
+        self.assertGreater(sum(simulation.broker.sent.values()), 0)
+
+    def test_stop_under_load(self):
+        managed_ips = synthetic_managed_ips(["as0", "as1"], 50)
+        simulation = Simulation(managed_ips, use_hash=False)
+        ch2tf = simulation.nodes["as0"].ch2tf
+        ch2tf.queue = queue.Queue()
+        packets = [packet(src, managed_ips["as0"][0]) for src in managed_ips["as1"]]
+        producing = threading.Event()
+        producing.set()
+
+        def produce() -> None:
+            # the traffic does not stop with the runtime
+            while producing.is_set():
+                for received in packets * 100:
+                    ch2tf.queue.put(received)
+                time.sleep(0.001)
+
+        runtime = CH2TFRuntime(ch2tf, analysis_period=3600, batch_size=50_000)
+        # longest time the event loop did not run
+        max_gap = 0.0
+
+        async def heartbeat() -> None:
+            nonlocal max_gap
+            while True:
+                start = time.perf_counter()
+                await asyncio.sleep(0.005)
+                max_gap = max(max_gap, time.perf_counter() - start - 0.005)
+
+        async def run() -> None:
+            task = asyncio.create_task(runtime.run())
+            beat = asyncio.create_task(heartbeat())
+            await asyncio.sleep(0.5)
+            runtime.stop()
+            # the packets queued after the stop are not waited for
+            await asyncio.wait_for(task, 5)
+            beat.cancel()
+
+        producer = threading.Thread(target=produce)
+        producer.start()
+        try:
+            asyncio.run(run())
+        finally:
+            producing.clear()
+            producer.join()
+        self.assertEqual(1, runtime.iteration)
+        self.assertGreater(sum(ch2tf.state.dest_dict_aggregated.values()), 0)
+        # the batches are aggregated in the ingestion thread, the event loop keeps running
+        self.assertLess(max_gap, 0.1)
+
+    @mock.patch("src.ch2tf.ch2tf.STREAMING_DETECTION", True)
+    def test_early_alarms_are_sent_by_the_analysis_thread(self):
+        managed_ips = synthetic_managed_ips(["as0", "as1"], 50)
+        simulation = Simulation(managed_ips, use_hash=False)
+        ch2tf = simulation.nodes["as0"].ch2tf
+        ch2tf.queue = queue.Queue()
+        victim = managed_ips["as1"][0]
+        for i in range(2000):
+            ch2tf.queue.put(packet(managed_ips["as0"][i % 50], victim))
+        runtime = CH2TFRuntime(ch2tf, analysis_period=3600)
+        # executor -> messages sent from its threads
+        threads: dict = {}
+        send = ch2tf._send
+
+        def record(*args, **kwargs) -> None:
+            name = threading.current_thread().name.split("_")[0]
+            threads[name] = threads.get(name, 0) + 1
+            send(*args, **kwargs)
+
+        async def run() -> dict:
+            task = asyncio.create_task(runtime.run())
+            await asyncio.sleep(0.3)
+            # the alarm is sent before the analysis of the period
+            sent_before_stop = dict(threads)
+            runtime.stop()
+            await task
+            return sent_before_stop
+
+        with mock.patch.object(ch2tf, "_send", side_effect=record):
+            sent_before_stop = asyncio.run(run())
+        self.assertIn(victim, ch2tf.alarm_dict)
+        self.assertEqual(["analysis"], list(sent_before_stop))
+        self.assertEqual(["analysis"], list(threads))
+
+
+if __name__ == "__main__":
+    unittest.main()
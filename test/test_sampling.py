@@ -0,0 +1,222 @@
+import ast
+import importlib.util
+import multiprocessing
+import os
+import queue
+import random
+import unittest
+from unittest import mock
+
+from src.ch2tf import (
+    CH2TF,
+    DDoSAttackAnalysis,
+    HeavyHitterAnalysis,
+    SampledQueue,
+    SamplingController,
+)
+from src.mitigation import NoMitigation
+from src.models import PacketData
+from src.simulation import (
+    InMemoryBroker,
+    InMemoryProducer,
+    Simulation,
+    VirtualClock,
+    synthetic_managed_ips,
+    synthetic_traffic,
+)
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+
+class SamplingControllerTest(unittest.TestCase):
+    def test_rate_follows_backlog_and_lag(self):
+        controller = SamplingController(
+            max_rate=1.0,
+            adaptive=True,
+            min_rate=0.1,
+            target_backlog=1000,
+            max_lag=1.0,
+            decrease=0.5,
+            increase=0.25,
+        )
+        controller.observe(backlog=5000)
+        controller.observe(backlog=10)
+        self.assertEqual(0.5, controller.next_epoch())
+        controller.observe(lag=2.0)
+        self.assertEqual(0.25, controller.next_epoch())
+        self.assertEqual(0.5, controller.previous_rate)
+        controller.observe(backlog=100_000)
+        self.assertEqual(0.125, controller.next_epoch())
+        controller.observe(backlog=100_000)
+        self.assertEqual(0.1, controller.next_epoch())
+        self.assertAlmostEqual(0.35, controller.next_epoch())
+        # between half of and the target backlog the rate is kept
+        controller.observe(backlog=700)
+        self.assertAlmostEqual(0.35, controller.next_epoch())
+        self.assertEqual(1.0, [controller.next_epoch() for _ in range(3)][-1])
+        self.assertEqual([1.0, 0.5, 0.25, 0.125, 0.1], list(controller.epoch_rates)[:5])
+
+        static = SamplingController(max_rate=0.5, adaptive=False)
+        static.observe(backlog=10**9, lag=100)
+        self.assertEqual(0.5, static.next_epoch())
+
+
+class SampledSimulationTest(unittest.TestCase):
+    def test_attack_is_detected_on_sampled_traffic(self):
+        managed_ips = synthetic_managed_ips(["as0", "as1", "as2"], 200)
+        traffic = synthetic_traffic(
+            managed_ips,
+            duration=30,
+            rate=50,
+            victim_as="as0",
+            attack_start=10,
+            attack_duration=15,
+            attack_rate=500,
+            attackers=20,
+        )
+        simulation = Simulation(managed_ips, analysis_period=5, use_hash=False)
+        for node in simulation.nodes.values():
+            node.ch2tf.sampling = SamplingController(
+                max_rate=0.2, adaptive=False, rng=node.ch2tf.sampling.rng
+            )
+        result = simulation.run(traffic, duration=30, attack_start=10)
+
+        # the counts are scaled by the rate, i.e. the thresholds are reached as without sampling
+        victim = managed_ips["as0"][0]
+        self.assertLessEqual(result.detection_latency[victim]["as0"], 5)
+        self.assertEqual({"as1", "as2"}, set(result.mitigation_latency[victim]))
+        self.assertEqual(
+            {"as0": 0.2, "as1": 0.2, "as2": 0.2}, simulation.timeline[0].sampling_rates
+        )
+        self.assertFalse(any(r.detections for r in simulation.timeline[:2]))
+
+    def test_sampling_is_seeded_per_simulation(self):
+        managed_ips = synthetic_managed_ips(["as0", "as1"], 50)
+
+        def run(seed: int) -> list:
+            traffic = synthetic_traffic(
+                managed_ips,
+                duration=10,
+                rate=100,
+                victim_as="as0",
+                attack_start=5,
+                attack_duration=5,
+                attack_rate=100,
+                attackers=5,
+            )
+            simulation = Simulation(
+                managed_ips, analysis_period=5, use_hash=False, seed=seed
+            )
+            for node in simulation.nodes.values():
+                node.ch2tf.sampling.rate = 0.5
+            simulation.run(traffic, duration=10)
+            return [
+                dict(node.ch2tf.state.src_dict_tm1)
+                for node in simulation.nodes.values()
+            ]
+
+        state = random.getstate()
+        self.assertEqual(run(1), run(1))
+        self.assertNotEqual(run(1), run(2))
+        # the global generator of the caller is not reseeded
+        self.assertEqual(state, random.getstate())
+
+
+class SampledQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.queue = SampledQueue(queue.Queue(), rate=1.0)
+        self.ch2tf = CH2TF(
+            queue=self.queue,  # type: ignore
+            mitigation=NoMitigation(),
+            attacker_analysis=HeavyHitterAnalysis(),
+            attack_analysis=DDoSAttackAnalysis(),
+            as_name="as0",
+            managed_ips={"10.0.0.1"},
+            producer=InMemoryProducer(InMemoryBroker(VirtualClock())),  # type: ignore
+            sampling=SamplingController(max_rate=0.5, adaptive=False),
+        )
+
+    def put(self, count: int) -> None:
+        for _ in range(count):
+            self.queue.put(
+                PacketData(
+                    src="10.0.0.1",
+                    dst="10.0.0.2",
+                    srcport="80",
+                    dstport="80",
+                    timestamp=None,  # type: ignore
+                    transport_layer="TCP",
+                )
+            )
+
+    def drain(self) -> list:
+        packets = []
+        while not self.queue.queue.empty():
+            packets.append(self.queue.get_nowait())
+        return packets
+
+    def test_packets_are_skipped_before_they_are_queued(self):
+        # the rate of the controller is shared with the producers
+        self.assertEqual(0.5, self.queue.rate)
+        with mock.patch("random.random", side_effect=[0.9, 0.1] * 50):
+            self.put(100)
+        self.assertEqual(50, self.queue.qsize())
+        sampled_out = self.ch2tf.metrics.packets_sampled_out
+        before = sampled_out.value
+
+        # the queued packets are not sampled again
+        self.ch2tf.store_packets(self.drain())
+        self.assertEqual(50, self.ch2tf.state.dest_dict["10.0.0.2"]["10.0.0.1"])
+        self.assertEqual(before, sampled_out.value)
+
+        # the rate of the next period is set in the queue
+        sampling = self.ch2tf.sampling
+        sampling.max_rate, sampling.adaptive, sampling.increase = 1.0, True, 0.5
+        self.ch2tf.analyse_period(1)
+        self.assertEqual(before + 50, sampled_out.value)
+        self.assertEqual(1.0, self.queue.rate)
+        self.put(10)
+        self.assertEqual(10, self.queue.qsize())
+        self.assertEqual(0, self.queue.take_sampled_out())
+
+    def test_queue_as_built_by_main(self):
+        # main.py only imports through src, i.e. its queue is a SampledQueue of this module
+        with open(os.path.join(SRC, "main.py"), encoding="utf-8") as f:
+            tree = ast.parse(f.read())
+        packages = {
+            os.path.splitext(name)[0]
+            for name in os.listdir(SRC)
+            if not name.startswith("_")
+        }
+        roots = {
+            node.module.split(".")[0]
+            for node in ast.walk(tree)
+            if isinstance(node, ast.ImportFrom) and node.module
+        }
+        self.assertFalse(roots & packages)
+
+        # a SampledQueue loaded a second time through another path is a different class
+        spec = importlib.util.spec_from_file_location(
+            "sampling_copy", os.path.join(SRC, "ch2tf", "sampling.py")
+        )
+        module = importlib.util.module_from_spec(spec)  # type: ignore
+        spec.loader.exec_module(module)  # type: ignore
+        sampled_queue = module.SampledQueue(multiprocessing.Queue())
+        self.assertNotIsInstance(sampled_queue, SampledQueue)
+        ch2tf = CH2TF(
+            queue=sampled_queue,
+            mitigation=NoMitigation(),
+            attacker_analysis=HeavyHitterAnalysis(),
+            attack_analysis=DDoSAttackAnalysis(),
+            as_name="as0",
+            managed_ips={"10.0.0.1"},
+            producer=InMemoryProducer(InMemoryBroker(VirtualClock())),  # type: ignore
+            sampling=SamplingController(max_rate=0.5, adaptive=False),
+        )
+        # the packets are sampled once, at the rate of the controller
+        self.assertTrue(ch2tf._presampled)
+        self.assertEqual(0.5, sampled_queue.rate)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,181 @@
+import json
+import unittest
+from unittest import mock
+
+from src.ch2tf import CH2TF, CH2TFState, HeavyHitterAnalysis, DDoSAttackAnalysis
+from src.enums import DecisionEnum
+from src.mitigation import NoMitigation
+from src.models import DefenseCollaborationResponseData, PacketData
+from src.simulation import (
+    InMemoryBroker,
+    InMemoryConsumer,
+    InMemoryProducer,
+    VirtualClock,
+)
+from src.util import partition_for
+
+
+class ConsumerGroupTest(unittest.TestCase):
+    def test_members_split_the_partitions_and_continue_after_leave(self):
+        broker = InMemoryBroker(VirtualClock(), partitions=4)
+        producer = InMemoryProducer(broker)
+        first = InMemoryConsumer(broker, group_id="as1")
+        first.subscribe(["t"])
+        second = InMemoryConsumer(broker, group_id="as1")
+        second.subscribe(["t"])
+        other = InMemoryConsumer(broker)
+        other.subscribe(["t"])
+        self.assertEqual({0, 1}, {tp.partition for tp in first.assignment()})
+        self.assertEqual({2, 3}, {tp.partition for tp in second.assignment()})
+
+        for partition in range(4):
+            producer.send("t", value=partition, partition=partition)
+        self.assertEqual([0, 1], sorted(m.value for m in first))
+        self.assertEqual(4, len(list(other)))
+
+        second.close()
+        producer.send("t", value=4, partition=3)
+        # the remaining member continues from the offsets committed by the group
+        self.assertEqual([2, 3, 4], sorted(m.value for m in first))
+
+
+@mock.patch("src.ch2tf.ch2tf.TOPIC_PARTITIONS", 4)
+class ShardedWorkersTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.broker = InMemoryBroker(self.clock, partitions=4)
+
+    def create(self, as_name: str, managed_ips, group: str | None = None) -> CH2TF:
+        return CH2TF(
+            queue=None,  # type: ignore
+            mitigation=NoMitigation(),
+            attacker_analysis=HeavyHitterAnalysis(),
+            attack_analysis=DDoSAttackAnalysis(),
+            state=CH2TFState(self.clock),
+            as_name=as_name,
+            managed_ips=set(managed_ips),
+            producer=InMemoryProducer(self.broker),  # type: ignore
+            consumer_factory=lambda: InMemoryConsumer(self.broker, group_id=group),  # type: ignore
+            clock=self.clock,
+        )
+
+    def test_requests_are_handled_by_the_worker_of_the_victim(self):
+        attackers = [f"10.1.0.{i}" for i in range(20)]
+        candidates = [f"10.0.0.{i}" for i in range(50)]
+        origin = self.create("as0", candidates)
+        workers = [self.create("as1", attackers, group="as1") for _ in range(2)]
+        nodes = [(node, node.subscribe()) for node in [origin, *workers]]
+        self.assertEqual({0, 1}, workers[0].shard)
+        self.assertEqual({2, 3}, workers[1].shard)
+
+        # one victim in the shard of each worker
+        victims = [
+            next(v for v in candidates if partition_for(v, 4) in worker.shard)
+            for worker in workers
+        ]
+        srcs = [src for src in attackers for _ in range(50)] * 2
+        dsts = [victim for victim in victims for _ in range(len(attackers) * 50)]
+        for node, _ in nodes:
+            node.store_batch(srcs, dsts)
+        for worker, victim in zip(workers, victims):
+            self.assertEqual([victim], list(worker.state.dest_dict))
+
+        origin.analyse_period(1)
+        # requests lead to responses, deliver until no message is pending
+        pending = True
+        while pending:
+            pending = False
+            for node, consumer in nodes:
+                for message in consumer:
+                    node.dispatch(message)
+                    pending = True
+
+        responses = [
+            DefenseCollaborationResponseData.from_json(json.loads(record.value))
+            for tp, records in self.broker.logs.items()
+            if tp.topic.endswith(".RES")
+            for record in records
+        ]
+        found = [
+            r
+            for r in responses
+            if r.request_originator == "as0" and r.decision == DecisionEnum.FOUND
+        ]
+        self.assertEqual(2, len(found))
+        self.assertEqual(
+            set(attackers), {ip for r in found for ip in r.ack_potential_attacker_ips}
+        )
+
+    def test_source_perspective_is_not_sharded(self):
+        # in partition 3, i.e. not in the shard of the worker
+        attacker = "10.1.0.1"
+        victims = [f"10.0.0.{i}" for i in range(64)]
+        worker = self.create("as1", [attacker], group="as1")
+        worker.assign_shard([0, 1])
+        own = [v for v in victims if partition_for(v, 4) in worker.shard]
+        other = [v for v in victims if partition_for(v, 4) not in worker.shard]
+        # each victim receives too few packets for case 1, all of them together exceed case 2
+        srcs = [attacker] * 4 * len(victims) + [other[0]] * 150
+        dsts = [v for v in victims for _ in range(4)] + [attacker] * 150
+        worker.store_batch(srcs, dsts)
+
+        self.assertEqual(set(own), set(worker.state.dest_dict) - {attacker})
+        self.assertEqual(
+            4 * len(victims), sum(worker.state.src_dict[attacker].values())
+        )
+        # traffic to the managed attacker is kept, whichever partition it belongs to
+        self.assertEqual(150, worker.state.dest_dict[attacker][other[0]])
+        self.assertTrue(
+            worker.attacker_analysis.run_analysis(
+                attacker,
+                own[0],
+                worker.state.src_dict,
+                worker.state.dest_dict,
+                src_dict_tm1={},
+            )
+        )
+        self.assertEqual({"case2": 1}, worker.attacker_analysis.pop_case_counts())
+        # the attacker receives enough packets for a detection, but it is analysed by the worker of its partition
+        worker.analyse_period(1)
+        self.assertEqual({}, worker.alarm_dict)
+
+    def test_packets_of_other_partitions_are_counted_as_dropped(self):
+        attacker = "10.1.0.1"
+        victims = [f"10.0.0.{i}" for i in range(64)]
+        worker = self.create("as1", [attacker], group="as1")
+        worker.assign_shard([0, 1])
+        other = [v for v in victims if partition_for(v, 4) not in worker.shard]
+        # from the managed attacker and from an unmanaged source, to all victims and to the attacker
+        srcs = [attacker] * len(victims) + [other[0]] * (len(victims) + 1)
+        dsts = victims + victims + [attacker]
+        # the counters of the registry are shared by the instances of the AS
+        metrics = worker.metrics
+        aggregated = metrics.packets_aggregated.value
+        sharded_out = metrics.packets_sharded_out.value
+        worker.store_batch(srcs, dsts)
+        worker.store_packets(
+            [
+                PacketData(
+                    src=src,
+                    dst=dst,
+                    srcport="80",
+                    dstport="80",
+                    timestamp=None,  # type: ignore
+                    transport_layer="TCP",
+                )
+                for src, dst in zip(srcs, dsts)
+            ]
+        )
+        worker.analyse_period(1)
+
+        sharded_out = metrics.packets_sharded_out.value - sharded_out
+        self.assertEqual(4 * len(other), sharded_out)
+        # ingested = aggregated + dropped
+        self.assertEqual(
+            2 * len(srcs),
+            metrics.packets_aggregated.value - aggregated + sharded_out,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,182 @@
+import json
+import unittest
+from unittest import mock
+
+from src.ch2tf.digests import encode_bloom_filter
+from src.enums import DetectionEnum
+from src.models import DefenseCollaborationRequestData
+
+from src.simulation import (
+    InMemoryBroker,
+    InMemoryConsumer,
+    InMemoryProducer,
+    Simulation,
+    VirtualClock,
+    synthetic_managed_ips,
+    synthetic_traffic,
+)
+
+
+class InMemoryBrokerTest(unittest.TestCase):
+    def test_consumer_receives_messages_after_subscription(self):
+        broker = InMemoryBroker(VirtualClock())
+        producer = InMemoryProducer(broker)
+        producer.send(topic="lowprob.REQ", value="before", key=b"1")
+        consumer = InMemoryConsumer(broker)
+        consumer.subscribe(["lowprob.REQ", "lowprob.RES"])
+        producer.send(topic="lowprob.REQ", value="after", key=b"2")
+        producer.send(topic="lowprob.RES", value={"a": 1}, key=b"3")
+        self.assertEqual(["after", {"a": 1}], [m.value for m in consumer])
+        self.assertEqual([], list(consumer))
+
+
+class SimulationTest(unittest.TestCase):
+    def test_attack_is_detected_and_attackers_found(self):
+        as_names = ["as0", "as1", "as2"]
+        managed_ips = synthetic_managed_ips(as_names, 200)
+        traffic = synthetic_traffic(
+            managed_ips,
+            duration=30,
+            rate=50,
+            victim_as="as0",
+            attack_start=10,
+            attack_duration=15,
+            attack_rate=500,
+            attackers=20,
+        )
+        simulation = Simulation(managed_ips, analysis_period=5, use_hash=False)
+        result = simulation.run(traffic, duration=30, attack_start=10)
+
+        victim = managed_ips["as0"][0]
+        self.assertEqual(6, result.epochs)
+        self.assertLessEqual(result.detection_latency[victim]["as0"], 5)
+        self.assertEqual({"as1", "as2"}, set(result.mitigation_latency[victim]))
+
+        # the attack is detected in the epochs from 10 to 25 only
+        self.assertEqual(6, len(simulation.timeline))
+        detected = [
+            record.epoch
+            for record in simulation.timeline
+            if victim in {d.victim for d in record.detections.get("as0", [])}
+        ]
+        self.assertEqual(3, min(detected))
+        self.assertLessEqual(max(detected), 6)
+        self.assertEqual(
+            result.packets,
+            sum(sum(r.packets.values()) for r in simulation.timeline),
+        )
+
+    @mock.patch("src.ch2tf.ch2tf.DIGEST_PERIODS", 1)
+    @mock.patch("src.ch2tf.ch2tf.DIGEST_ROUTING", True)
+    def test_requests_are_routed_by_digest(self):
+        as_names = ["as0", "as1", "as2", "as3"]
+        managed_ips = synthetic_managed_ips(as_names, 200)
+        traffic = synthetic_traffic(
+            managed_ips,
+            duration=30,
+            rate=50,
+            victim_as="as0",
+            attack_start=10,
+            attack_duration=15,
+            attack_rate=500,
+            attackers=20,
+        )
+        simulation = Simulation(managed_ips, analysis_period=5, use_hash=False)
+        for node in simulation.nodes.values():
+            # the digests of all ASes are received before the attack, no digest expires
+            node.ch2tf.digests.ttl = 10
+        result = simulation.run(traffic, duration=30, attack_start=10)
+
+        victim = managed_ips["as0"][0]
+        requests = {t for t in result.messages if t.endswith(".REQ")}
+        self.assertTrue(requests)
+        # no broadcast, each AS receives the requests on its own topic
+        self.assertTrue(all(t.rsplit(".", 2)[1] in as_names for t in requests))
+        self.assertEqual(
+            {t.rsplit(".", 2)[1] for t in requests},
+            set(result.mitigation_latency[victim]),
+        )
+
+    @mock.patch("src.ch2tf.ch2tf.DIGEST_ROUTING", True)
+    def test_attackers_in_no_digest_are_broadcast(self):
+        managed_ips = synthetic_managed_ips(["as0", "as1", "as2"], 10)
+        simulation = Simulation(managed_ips, use_hash=False)
+        ch2tf = simulation.nodes["as0"].ch2tf
+        ch2tf.digests.ttl = 10
+        simulation.clock.advance_to(10)
+        # the digest of as2 has not been received
+        ch2tf.digests.put("as1", encode_bloom_filter(managed_ips["as1"]))
+        self.send(simulation, managed_ips)
+
+        self.assertEqual(
+            [managed_ips["as1"][0]], self.requested(simulation, "lowprob.as1.REQ")
+        )
+        self.assertEqual(
+            [managed_ips["as2"][0]], self.requested(simulation, "lowprob.REQ")
+        )
+        # the managed source is only analysed locally
+        self.assertEqual([], self.requested(simulation, "lowprob.as0.REQ"))
+
+    @mock.patch("src.ch2tf.ch2tf.DIGEST_ROUTING", True)
+    def test_routed_attackers_are_broadcast_while_digests_may_be_missing(self):
+        managed_ips = synthetic_managed_ips(["as0", "as1", "as2"], 10)
+        simulation = Simulation(managed_ips, use_hash=False)
+        ch2tf = simulation.nodes["as0"].ch2tf
+        ch2tf.digests.ttl = 10
+        # false positive: the digest of as1 contains a source managed by as2
+        digest = encode_bloom_filter(managed_ips["as1"] + [managed_ips["as2"][0]])
+        ch2tf.digests.put("as1", digest)
+        expected = [managed_ips["as1"][0], managed_ips["as2"][0]]
+
+        # at startup, the digest of as2 may not have been received yet
+        self.send(simulation, managed_ips)
+        self.assertEqual(expected, self.requested(simulation, "lowprob.as1.REQ"))
+        self.assertEqual(expected, self.requested(simulation, "lowprob.REQ"))
+
+        # as2 leaves, its digest expires
+        ch2tf.digests.put("as2", encode_bloom_filter(managed_ips["as2"]))
+        for timestamp in (10, 20):
+            simulation.clock.advance_to(timestamp)
+            ch2tf.digests.put("as1", digest)
+        self.assertFalse(ch2tf.digests.complete())
+        self.send(simulation, managed_ips, victim=managed_ips["as0"][2])
+        self.assertEqual(2 * expected, self.requested(simulation, "lowprob.REQ"))
+
+        # it is no longer expected after another ttl
+        simulation.clock.advance_to(31)
+        ch2tf.digests.put("as1", digest)
+        self.assertTrue(ch2tf.digests.complete())
+        self.send(simulation, managed_ips, victim=managed_ips["as0"][3])
+        self.assertEqual(2 * expected, self.requested(simulation, "lowprob.REQ"))
+        self.assertEqual(3 * expected, self.requested(simulation, "lowprob.as1.REQ"))
+
+    @staticmethod
+    def send(simulation: Simulation, managed_ips: dict, victim: str = "") -> None:
+        attackers = [
+            managed_ips["as0"][1],
+            managed_ips["as1"][0],
+            managed_ips["as2"][0],
+        ]
+        simulation.nodes["as0"].ch2tf._send_collab_requests(
+            victim or managed_ips["as0"][0],
+            {ip: 500 for ip in attackers},
+            DetectionEnum.THRESHOLD,
+            1500,
+            1500,
+        )
+
+    @staticmethod
+    def requested(simulation: Simulation, topic: str) -> list:
+        return [
+            ip
+            for tp, records in simulation.broker.logs.items()
+            if tp.topic == topic
+            for record in records
+            for ip in DefenseCollaborationRequestData.from_json(
+                json.loads(record.value)
+            ).potential_attacker_ips
+        ]
+
+
+if __name__ == "__main__":
+    unittest.main()
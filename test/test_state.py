@@ -0,0 +1,77 @@
+import sys
+import threading
+import time
+import unittest
+from collections import defaultdict
+
+from src.ch2tf import CH2TFState
+from src.models import PacketData
+from src.simulation import Simulation, synthetic_managed_ips
+
+
+def packet(src: str, dst: str) -> PacketData:
+    return PacketData(
+        src=src,
+        dst=dst,
+        srcport="80",
+        dstport="80",
+        timestamp=None,  # type: ignore
+        transport_layer="TCP",
+    )
+
+
+class CH2TFStateTest(unittest.TestCase):
+    def test_reset_moves_the_current_period(self):
+        state = CH2TFState()
+        state.src_dict["a"]["v"] += 2
+        state.dest_dict["v"]["a"] += 2
+        state.dest_totals["v"] += 2
+        state.reset_period()
+        self.assertEqual({"a": {"v": 2}}, state.src_dict_tm1)
+        # a plain dict, lookups of unknown sources do not add them
+        self.assertNotIsInstance(state.src_dict_tm1, defaultdict)
+        self.assertEqual({}, state.src_dict)
+        self.assertEqual({}, state.dest_dict)
+        self.assertEqual({}, state.dest_totals)
+
+    def test_reset_during_concurrent_ingestion(self):
+        managed_ips = synthetic_managed_ips(["as0", "as1"], 4000)
+        simulation = Simulation(managed_ips, use_hash=False)
+        ch2tf = simulation.nodes["as0"].ch2tf
+        packets = [packet(src, managed_ips["as1"][0]) for src in managed_ips["as0"]]
+        stopped = threading.Event()
+
+        def ingest() -> None:
+            # as collect_packages, the tables of the state are looked up for each packet
+            while not stopped.is_set():
+                for received in packets:
+                    ch2tf._store_data(
+                        received, ch2tf.state.dest_dict, ch2tf.state.src_dict
+                    )
+
+        # switch threads as often as possible, such that the reset is interrupted by the ingestion
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-5)
+        thread = threading.Thread(target=ingest)
+        thread.start()
+        try:
+            with self.assertNoLogs("ch2tf", level="ERROR"):
+                for _ in range(200):
+                    # the sources of the period are still added while it is reset
+                    while len(ch2tf.state.src_dict) < 1000:
+                        time.sleep(0.0001)
+                    ch2tf.reset_data()
+        finally:
+            stopped.set()
+            thread.join()
+            sys.setswitchinterval(switch_interval)
+        # each reset has rolled over the period
+        self.assertEqual(200, ch2tf.campaigns.period)
+        self.assertEqual(200, ch2tf.verdict_cache.epoch)
+        ch2tf.reset_data()
+        self.assertTrue(ch2tf.state.src_dict_tm1)
+        self.assertEqual({}, ch2tf.state.src_dict)
+
+
+if __name__ == "__main__":
+    unittest.main()
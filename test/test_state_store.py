@@ -0,0 +1,54 @@
+import unittest
+
+from src.ch2tf.state_store import AttackerRef, BoundedStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class BoundedStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.store = BoundedStore(
+            ttl=10, max_entries=4, max_entries_per_owner=2, clock=self.clock
+        )
+
+    def test_ttl_eviction(self):
+        self.store.put("a", 1, owner="as0")
+        self.clock.now = 5
+        self.store.put("b", 2, owner="as1")
+        self.clock.now = 12
+        self.assertIsNone(self.store.get("a"))
+        self.assertEqual(2, self.store.get("b"))
+        self.assertEqual(1, self.store.evict_expired())
+        self.assertEqual(1, len(self.store))
+
+    def test_owner_quota(self):
+        for key in ("a", "b", "c"):
+            self.store.put(key, key, owner="as0")
+        self.store.put("d", "d", owner="as1")
+        self.assertNotIn("a", self.store)
+        self.assertEqual(["b", "c", "d"], [k for k, _ in self.store.items()])
+        self.assertEqual(1, self.store.evictions["quota"])
+
+    def test_size_eviction(self):
+        for i, owner in enumerate(("as0", "as1", "as2", "as3", "as4")):
+            self.store.put(i, i, owner=owner)
+        self.assertEqual(4, len(self.store))
+        self.assertNotIn(0, self.store)
+        self.assertEqual(1, self.store.evictions["size"])
+
+    def test_attacker_ref(self):
+        attackers = ["a", "b", "c", "d", "e"]
+        self.assertEqual(["c", "d"], list(AttackerRef(attackers, 2, 4)))
+        self.assertEqual(1, len(AttackerRef(attackers, 4, 8)))
+        self.assertEqual(5, len(AttackerRef(attackers)))
+
+
+if __name__ == "__main__":
+    unittest.main()
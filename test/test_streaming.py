@@ -0,0 +1,100 @@
+import json
+import unittest
+from unittest import mock
+
+from src.enums import DecisionEnum
+from src.models import DefenseCollaborationResponseData
+from src.simulation import Simulation, synthetic_managed_ips
+
+
+@mock.patch("src.ch2tf.ch2tf.STREAMING_DEBOUNCE", 5)
+@mock.patch("src.ch2tf.ch2tf.STREAMING_DETECTION", True)
+class StreamingDetectionTest(unittest.TestCase):
+    def setUp(self):
+        managed_ips = synthetic_managed_ips(["as0", "as1"], 50)
+        self.simulation = Simulation(managed_ips, use_hash=False)
+        self.ch2tf = self.simulation.nodes["as0"].ch2tf
+        self.victim = managed_ips["as1"][0]
+        # attackers managed by the AS that detects the attack
+        self.attackers = managed_ips["as0"][:10]
+
+    def flood(self, timestamp: float, packets_per_attacker: int) -> None:
+        self.simulation.clock.advance_to(timestamp)
+        srcs = [src for src in self.attackers for _ in range(packets_per_attacker)]
+        self.ch2tf.store_batch(srcs, [self.victim] * len(srcs))
+        # sent by the consumer loop of the runtime
+        self.ch2tf.send_early_alarms()
+
+    def requests(self) -> int:
+        return sum(
+            sent
+            for topic, sent in self.simulation.broker.sent.items()
+            if topic.endswith(".REQ")
+        )
+
+    def own_responses(self) -> list:
+        return [
+            response
+            for tp, records in self.simulation.broker.logs.items()
+            if tp.topic.endswith(".RES")
+            for record in records
+            if (
+                response := DefenseCollaborationResponseData.from_json(
+                    json.loads(record.value)
+                )
+            ).as_name
+            == "as0"
+        ]
+
+    def test_early_alarms_are_debounced(self):
+        self.flood(0, 20)
+        self.assertEqual(1, self.requests())
+        self.assertEqual(0, self.ch2tf.alarm_dict[self.victim])
+        # within the debounce interval
+        self.flood(1, 40)
+        self.assertEqual(1, self.requests())
+        # the sources have at least doubled their packets since they were sent
+        self.flood(6, 40)
+        self.assertEqual(2, self.requests())
+        self.assertEqual(6, self.ch2tf.alarm_dict[self.victim])
+        # early alarms do not analyse the request locally
+        self.assertEqual([], self.own_responses())
+
+    def test_early_alarms_are_sent_apart_from_the_ingestion(self):
+        srcs = [src for src in self.attackers for _ in range(20)]
+        with mock.patch.object(self.ch2tf.mitigation, "filter_ips") as filter_ips:
+            self.ch2tf.store_batch(srcs, [self.victim] * len(srcs))
+            # the ingestion only queues the alarm
+            self.assertEqual(0, self.requests())
+            filter_ips.assert_not_called()
+            self.assertEqual(1, len(self.ch2tf.pending_alarms))
+
+            # the queued sources are not changed by the packets collected afterwards
+            self.ch2tf.store_batch(self.attackers[:1], [self.victim])
+            self.assertEqual(1, self.ch2tf.send_early_alarms())
+            self.assertEqual(1, self.requests())
+            filter_ips.assert_called_once()
+        self.assertEqual(0, self.ch2tf.send_early_alarms())
+        self.assertEqual(1, self.requests())
+
+    def test_periodic_analysis_handles_sources_of_early_alarms_locally(self):
+        self.flood(0, 20)
+        self.assertEqual(1, self.requests())
+        self.ch2tf.analyse_period(1)
+        # the sources have already been published by the early alarm
+        self.assertEqual(1, self.requests())
+        responses = self.own_responses()
+        self.assertEqual(1, len(responses))
+        self.assertEqual(DecisionEnum.FOUND, responses[0].decision)
+        self.assertEqual(
+            set(self.attackers), set(responses[0].ack_potential_attacker_ips)
+        )
+
+        # the next period does not analyse the unchanged sources again
+        self.flood(10, 20)
+        self.ch2tf.analyse_period(2)
+        self.assertEqual(1, len(self.own_responses()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+
+from src.ch2tf.verdict_cache import VerdictCache, _lookups
+from src.enums import DecisionEnum
+
+
+class VerdictCacheTest(unittest.TestCase):
+    def test_verdicts_are_cached_per_attacker_and_victim(self):
+        cache = VerdictCache()
+        cache.put("a", "v", DecisionEnum.FOUND)
+        self.assertEqual(DecisionEnum.FOUND, cache.get("a", "v"))
+        self.assertIsNone(cache.get("a", "w"))
+        self.assertIsNone(cache.get("v", "a"))
+        self.assertEqual((1, 2), (cache.epoch_hits, cache.epoch_misses))
+
+    def test_rollover_evicts_the_epoch(self):
+        hits, misses = _lookups.labels("hit"), _lookups.labels("miss")
+        before = hits.value, misses.value
+        cache = VerdictCache()
+        cache.put("a", "v", DecisionEnum.UNDER_THRS)
+        cache.get("a", "v")
+        cache.get("b", "v")
+        cache.get("a", "v")
+        with self.assertLogs("ch2tf", level="INFO") as logs:
+            cache.rollover()
+        self.assertIn("hit ratio 0.67 (2 hits, 1 misses)", logs.output[0])
+        self.assertEqual(1, cache.epoch)
+        self.assertEqual((before[0] + 2, before[1] + 1), (hits.value, misses.value))
+
+        # the verdicts of the previous epoch are evicted
+        self.assertIsNone(cache.get("a", "v"))
+        self.assertEqual((2, 1), (cache.hits, cache.misses))
+        self.assertEqual(0.5, cache.hit_ratio)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+
+import numpy as np
+
+from src.traffic.workload import (
+    AddressSpace,
+    PacketBatch,
+    VolumetricFlood,
+    WorkloadGenerator,
+    ZipfLegitimateTraffic,
+    ip_to_str,
+    str_to_ip,
+)
+
+
+class WorkloadTest(unittest.TestCase):
+    def setUp(self):
+        self.space = AddressSpace(["as0", "as1"], hosts_per_as=100)
+        hosts = np.concatenate([self.space.managed("as0"), self.space.managed("as1")])
+        self.models = [
+            ZipfLegitimateTraffic(hosts, hosts, rate=1000),
+            VolumetricFlood(
+                self.space.managed("as1")[:10],
+                int(self.space.managed("as0")[0]),
+                rate=5000,
+                start=1,
+                end=2,
+            ),
+        ]
+
+    def test_address_conversion(self):
+        addresses = np.array([str_to_ip("10.1.0.5"), str_to_ip("192.168.0.1")])
+        self.assertEqual(["10.1.0.5", "192.168.0.1"], ip_to_str(addresses).tolist())
+
+    def test_owner(self):
+        addresses = np.array(
+            [str_to_ip(ip) for ip in ("10.0.0.1", "10.1.0.99", "10.1.0.100", "8.8.8.8")]
+        )
+        self.assertEqual([0, 1, -1, -1], self.space.owner(addresses).tolist())
+
+    def test_same_seed_same_workload(self):
+        first = list(WorkloadGenerator(self.models, seed=3).batches(0, 3))
+        second = list(WorkloadGenerator(self.models, seed=3).batches(0, 3))
+        self.assertEqual(30, len(first))
+        for a, b in zip(first, second):
+            np.testing.assert_array_equal(a.src, b.src)
+            np.testing.assert_array_equal(a.dst, b.dst)
+
+    def test_flood_window(self):
+        batch = WorkloadGenerator(self.models[1:], batch_duration=1).batches(0, 3)
+        sizes = [len(b) for b in batch]
+        self.assertEqual(0, sizes[0])
+        self.assertGreater(sizes[1], 4000)
+        self.assertEqual(0, sizes[2])
+
+    def test_addresses(self):
+        batch = PacketBatch(
+            np.array([str_to_ip("10.0.0.1")] * 2, dtype=np.uint32),
+            np.array([str_to_ip("10.1.0.1"), str_to_ip("10.0.0.1")], dtype=np.uint32),
+            np.zeros(2),
+        )
+        srcs, dsts = batch.addresses()
+        self.assertEqual(["10.0.0.1", "10.0.0.1"], srcs)
+        self.assertEqual(["10.1.0.1", "10.0.0.1"], dsts)
+
+
+if __name__ == "__main__":
+    unittest.main()